@@ -0,0 +1,102 @@
+'''
+run the benchmark suite without asv
+
+    python -m benchmarks [-k pattern] [-r repeat] [--quick]
+
+for every benchmark class, each parameter combination is set up once, its
+`check()` is run against the reference data of the fixture, then each `time_*`
+method is timed (best of `repeat`) and reported with the throughput in MB/s
+and points/s. The value of each `track_*` method (i.e. a size ratio, or an
+error) is reported in the time column. A benchmark whose setup raises
+NotImplementedError (i.e. an optional package not installed) is skipped, as
+in asv.
+
+'''
+
+import argparse
+import contextlib
+import io
+import itertools
+import time
+
+from . import bench_cfdpp, bench_tecplot, bench_post, bench_import
+
+MODULES = [bench_cfdpp, bench_tecplot, bench_post, bench_import]
+
+
+def _bench_classes():
+    for module in MODULES:
+        for name in dir(module):
+            obj = getattr(module, name)
+            if isinstance(obj, type) and not name.startswith('_') and obj.__module__ == module.__name__:
+                yield module.__name__.split('.')[-1], obj
+
+
+def _timeit(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(pattern=None, repeat=3, quick=False):
+
+    print('%-56s %-20s %10s %10s %12s %6s' % ('benchmark', 'params', 'time (s)', 'MB/s', 'points/s', 'check'))
+    n_fail = 0
+
+    for mod_name, cls in _bench_classes():
+        params = cls.params
+        if quick:
+            params = [p[:1] for p in params]
+
+        for para in itertools.product(*params):
+            methods = [m for m in dir(cls) if m.startswith('time_') or m.startswith('track_')]
+            methods = [m for m in methods if pattern is None or pattern in '%s.%s.%s' % (mod_name, cls.__name__, m)]
+            if len(methods) == 0:
+                continue
+
+            bench = cls()
+            # silence the readers, their prints are not part of the benchmark
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    bench.setup(*para)
+            except NotImplementedError:
+                print('%-56s %-20s %10s' % ('%s.%s' % (mod_name, cls.__name__), ','.join([str(p) for p in para]), 'skip'))
+                continue
+            try:
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        bench.check()
+                    check = 'ok'
+                except AssertionError:
+                    check = 'FAIL'
+                    n_fail += 1
+
+                for m in methods:
+                    if m.startswith('track_'):
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            value = getattr(bench, m)(*para)
+                        print('%-56s %-20s %10.4g %10s %12s %6s' % ('%s.%s.%s' % (mod_name, cls.__name__, m),
+                                ','.join([str(p) for p in para]), value, '', '', check))
+                        continue
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        dt = _timeit(lambda: getattr(bench, m)(*para), repeat)
+                    print('%-56s %-20s %10.4f %10.2f %12.4g %6s' % ('%s.%s.%s' % (mod_name, cls.__name__, m),
+                            ','.join([str(p) for p in para]), dt, bench.nbytes / dt / 1e6, bench.npoints / dt, check))
+            finally:
+                bench.teardown(*para)
+
+    return n_fail
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='cfdtools benchmark suite')
+    parser.add_argument('-k', dest='pattern', default=None, help='only run benchmarks whose name contains pattern')
+    parser.add_argument('-r', dest='repeat', type=int, default=3, help='repeat of each timing, the best is reported')
+    parser.add_argument('--quick', action='store_true', help='only run the smallest parameter of each benchmark')
+    args = parser.parse_args()
+
+    raise SystemExit(run(args.pattern, args.repeat, args.quick) > 0)
@@ -0,0 +1,588 @@
+'''
+benchmarks of the mcfd.info1 / mcfd.inp readers and writers of `cfdtools.cfdpp`
+
+each class follows the asv layout (`params`, `setup`, `time_*`), and also
+provides `nbytes`, `npoints` and `check()` used by `python -m benchmarks`
+
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from cfdtools.cfdpp import cfdpp, typ_dict, info1_index
+from cfdtools.boundary import bc_table
+from cfdtools.catalog import sweep_catalog
+from cfdtools.dataset import case_dataset, load_case
+from cfdtools.stats import running_stats
+from cfdtools.system import cmd
+from cfdtools.cli import main as cli_main
+from cfdtools.watch import case_watcher
+from .fixtures import write_info1, write_inp
+
+
+class _case_dir():
+    '''
+    a temporary case folder with synthetic mcfd.inp / mcfd.info1
+    '''
+
+    def make_case(self, n_bc=10, n_step=0, n_at=0, n_infset=20):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        self.infsets = write_inp(os.path.join(self.tmp, 'mcfd.inp'), n_bc=n_bc, n_infset=n_infset)
+        if n_step > 0:
+            self.ref_data, self.ref_areas = write_info1(os.path.join(self.tmp, 'mcfd.info1'), n_bc=n_bc, n_step=n_step, n_at=n_at)
+        self.op = cfdpp(self.tmp, verbose='None')
+
+    def teardown(self, *args):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class ffm_history(_case_dir):
+
+    params = ([10, 50], [100, 1000], [0, 20])
+    param_names = ['n_bc', 'n_step', 'n_at']
+
+    def setup(self, n_bc, n_step, n_at):
+        self.make_case(n_bc=n_bc, n_step=n_step, n_at=n_at)
+        self.nbytes = os.path.getsize(os.path.join(self.tmp, 'mcfd.info1'))
+        self.npoints = n_step * n_bc * len(typ_dict)
+
+    def time_read_FFM_history(self, *args):
+        self.op.read_FFM_history()
+
+    def time_read_FFM_history_parallel(self, *args):
+        self.op.read_FFM_history(n_proc=4)
+
+    def check(self):
+        for n_proc in [1, 4]:
+            self.op.read_FFM_history(n_proc=n_proc)
+            assert self.op.FFM_data.shape == self.ref_data.shape
+            assert np.allclose(self.op.FFM_data, self.ref_data, rtol=1e-7, atol=0.0)
+            assert np.allclose(self.op.areas, self.ref_areas, rtol=1e-7, atol=0.0)
+
+
+class shared_attach():
+    '''
+    `n_thread` threads attaching to pickled copies of a shared array, as the
+    workers of `read_info1_parallel` do, the process detaches once after
+    '''
+
+    params = ([1, 8],)
+    param_names = ['n_thread']
+    n_attach = 200
+
+    def setup(self, n_thread):
+        from cfdtools.shared import shared_array
+        self.sa = shared_array.publish(np.arange(1000.0))
+        self.n_thread = n_thread
+        self.nbytes = 0
+        self.npoints = n_thread * self.n_attach
+
+    def teardown(self, *args):
+        self.sa.unlink()
+
+    def _copy(self):
+        import pickle
+        return pickle.loads(pickle.dumps(self.sa))
+
+    def _attach(self):
+        for _ in range(self.n_attach):
+            assert self._copy().attach()[-1] == 999.0
+
+    def _open(self):
+        from cfdtools.shared import _open_shm
+        for _ in range(self.n_attach):
+            _open_shm(self.sa.name).close()
+
+    def _run(self, target):
+        import threading
+        threads = [threading.Thread(target=target) for _ in range(self.n_thread)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+
+    def time_attach(self, *args):
+        self._run(self._attach)
+        # the pickled copies share the attachment of the process
+        self._copy().close()
+
+    def check(self):
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        self._run(self._attach)
+        self._copy().close()
+        # each thread opens the block by itself, and the threads are switched
+        # as often as possible, so the swaps of the resource tracker interleave
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            self._run(self._open)
+        finally:
+            sys.setswitchinterval(interval)
+        assert resource_tracker.register is register
+
+
+class ffm_index(_case_dir):
+
+    params = ([50], [1000, 10000])
+    param_names = ['n_bc', 'n_step']
+
+    def setup(self, n_bc, n_step):
+        self.make_case(n_bc=n_bc, n_step=n_step, n_at=20)
+        self.nbytes = os.path.getsize(os.path.join(self.tmp, 'mcfd.info1'))
+        self.npoints = n_step
+
+    def time_index_FFM_history(self, *args):
+        self.op.FFM_index = None
+        self.op.index_FFM_history()
+
+    def check(self):
+        assert self.op.index_FFM_history() == self.ref_data.shape[0]
+        # the `At` lines indented
+        fname = os.path.join(self.tmp, 'mcfd.info1')
+        with open(fname, 'rb') as f:
+            text = f.read()
+        lines = text.replace(b'\nAt ', b'\n \tAt ').split(b'\n')
+        # and a block inside the data of the last step
+        at_block = [b' At time step 0'] + [b' setting_%d = 0' % i for i in range(10)]
+        lines[-30:-30] = at_block
+        with open(fname + '.indent', 'wb') as f:
+            f.write(b'\n'.join(lines))
+        index = info1_index(fname + '.indent', self.ref_data.shape[1])
+        assert index.update() == self.ref_data.shape[0] and index.n_line == self.op.FFM_index.n_line
+        assert np.allclose(index.read(), self.ref_data, rtol=1e-7, atol=0.0)
+
+
+class ffm_slice(_case_dir):
+
+    params = ([50], [1000, 10000], [200])
+    param_names = ['n_bc', 'n_step', 'window']
+
+    def setup(self, n_bc, n_step, window):
+        self.make_case(n_bc=n_bc, n_step=n_step, n_at=20)
+        self.op.index_FFM_history()
+        self.window = window
+        self.nbytes = os.path.getsize(os.path.join(self.tmp, 'mcfd.info1')) * window // n_step
+        self.npoints = window * 2
+
+    def time_read_FFM_slice(self, *args):
+        self.op.read_FFM_slice(steps=slice(-self.window, None), bcs=[2, 3], typs=['fx'])
+
+    def check(self):
+        data = self.op.read_FFM_slice(steps=slice(-self.window, None), bcs=[2, 3], typs=['fx'])
+        assert np.allclose(data[:, :, 0], self.ref_data[-self.window:, 1:3, typ_dict['fx']], rtol=1e-7, atol=0.0)
+
+
+class flux(_case_dir):
+
+    params = ([10, 50], [1000], [0, 200])
+    param_names = ['n_bc', 'n_step', 'ave_window']
+
+    def setup(self, n_bc, n_step, ave_window):
+        self.make_case(n_bc=n_bc, n_step=n_step)
+        self.op.read_FFM_history()
+        self.bc_series = list(range(1, n_bc + 1))
+        self.ave_window = ave_window
+        self.nbytes = self.op.FFM_data[-max(ave_window, 1):].nbytes
+        self.npoints = max(ave_window, 1) * n_bc
+
+    def time_read_flux(self, *args):
+        for typ in typ_dict:
+            self.op.read_flux(typ, self.bc_series, ave_window=self.ave_window)
+
+    def check(self):
+        for typ, i_typ in typ_dict.items():
+            if self.ave_window > 0:
+                ref = self.ref_data[-self.ave_window:, :, i_typ].mean(axis=0).sum()
+            else:
+                ref = self.ref_data[-1, :, i_typ].sum()
+            assert np.isclose(self.op.read_flux(typ, self.bc_series, ave_window=self.ave_window), ref, rtol=1e-7, atol=1e-12)
+
+
+
+class flux_stats(_case_dir):
+    '''
+    running statistics of a flux from step `n_step // 2`, then called again on
+    the same history (nothing new to add)
+    '''
+
+    params = ([10], [1000])
+    param_names = ['n_bc', 'n_step']
+
+    def setup(self, n_bc, n_step):
+        self.make_case(n_bc=n_bc, n_step=n_step)
+        self.op.lazy = True
+        self.op.index_FFM_history()
+        self.st = n_step // 2
+        self.nbytes = 0
+        self.npoints = n_step - self.st
+
+    def time_flux_stats(self, *args):
+        self.op.flux_stats('fx', [1, 2], st=self.st)
+
+    def check(self):
+        ref = self.ref_data[self.st:, 0:2, typ_dict['fx']].sum(axis=1)
+        stats = self.op.flux_stats('fx', [1, 2], st=self.st)
+        for _ in range(2):
+            # continued from `next_step`, the steps are not added again
+            stats = self.op.flux_stats('fx', [1, 2], stats=stats)
+            stats = self.op.flux_stats('fx', [1, 2], stats=running_stats.from_state(stats.state()))
+            assert stats.n == len(ref) and stats.next_step == self.ref_data.shape[0]
+            assert np.isclose(stats.mean, ref.mean(), rtol=1e-7) and np.isclose(stats.std(), ref.std(), rtol=1e-6)
+
+def _read_infset(inp_dir, inf_num):
+    '''
+    read back the values of info set `inf_num` from mcfd.inp
+    '''
+    values = []
+    with open(inp_dir, 'r') as f:
+        lines = f.readlines()
+    for idx, line in enumerate(lines):
+        split_line = line.split()
+        if split_line[:2] == ['seq.#', str(inf_num)]:
+            n_val = int(split_line[3])
+            for vline in lines[idx + 1: idx + 1 + (n_val + 4) // 5]:
+                values += [float(v) for v in vline.split()[1:]]
+            return values
+    return None
+
+
+class inp_edit(_case_dir):
+
+    params = ([20, 200, 2000],)
+    param_names = ['n_infset']
+
+    def setup(self, n_infset):
+        self.make_case(n_bc=10, n_infset=n_infset)
+        # use the last info set with values, its number is not the prefix of another one
+        self.inf_num = max(i + 1 for i, (typ, values) in enumerate(self.infsets) if len(values) > 0)
+        self.values = list(np.arange(1, len(self.infsets[self.inf_num - 1][1]) + 1) * 1.5e3)
+        self.nbytes = os.path.getsize(self.op.inp_dir)
+        self.npoints = n_infset
+
+    def time_set_para(self, n_infset):
+        self.op.set_para('ntstep', 2000)
+
+    def time_set_infset(self, n_infset):
+        self.op.set_infset(self.inf_num, self.values)
+
+    def check(self):
+        self.op.set_para('ntstep', 2000)
+        assert self.op.read_para('ntstep') == '2000'
+        self.op.set_infset(self.inf_num, self.values)
+        assert np.allclose(_read_infset(self.op.inp_dir, self.inf_num), self.values, rtol=1e-4)
+
+
+class bc_assign(_case_dir):
+
+    params = ([10, 100, 1000],)
+    param_names = ['n_bc']
+
+    def setup(self, n_bc):
+        self.make_case(n_bc=n_bc, n_infset=20)
+        # move every other boundary to the back pressure info set (#4)
+        self.changes = {i_bc: ('backpressure', 4) for i_bc in range(1, n_bc + 1, 2)}
+        self.nbytes = os.path.getsize(self.op.inp_dir)
+        self.npoints = len(self.changes)
+
+    def time_change_infset(self, n_bc):
+        for bc_num, (typ, infset_num) in self.changes.items():
+            self.op.change_infset(bc_num, typ, infset_num)
+
+    def time_change_infsets(self, n_bc):
+        self.op.change_infsets(self.changes)
+
+    def time_lookup(self, n_bc):
+        table = self.op.read_bc_table()
+        for bc_num in self.changes:
+            table[bc_num].infset
+
+    def check(self):
+        self.op.change_infsets(self.changes)
+        table = self.op.read_bc_table()
+        for bc_num in range(1, len(table) + 1):
+            if bc_num in self.changes:
+                assert table[bc_num].infset == 4 and table.typ_name(bc_num) == 'backpressure'
+            else:
+                assert table[bc_num].infset == (bc_num - 1) % 20 + 1 and table.typ_name(bc_num) == 'wall'
+        # the table is parsed again from the file
+        assert bc_table(self.op.inp_dir)[1].infset == 4
+        # a wrong change leaves the file and the cached table as they are
+        with open(self.op.inp_dir) as f:
+            text = f.read()
+        for changes in [{2: ('backpressure', 4), 10 ** 6: ('wall', 1)}, {2: ('no_such_type', 4)}]:
+            try:
+                self.op.change_infsets(changes)
+                assert False, 'change of %r not refused' % changes
+            except KeyError:
+                pass
+            with open(self.op.inp_dir) as f:
+                assert f.read() == text
+            assert self.op.read_bc_table()[2].infset == 2 and self.op.read_bc_table().typ_name(2) == 'wall'
+
+
+class catalog(_case_dir):
+    '''
+    a sweep catalog of `n_case` cases (scanned from one synthetic case), its
+    updates and queries
+    '''
+
+    params = ([100, 1000],)
+    param_names = ['n_case']
+
+    def setup(self, n_case):
+        self.make_case(n_bc=10, n_step=100)
+        self.cat = sweep_catalog(os.path.join(self.tmp, 'sweep.db'))
+        self.fluxes = {'fx': ('fx', [1, 2]), 'mass': ('mass', [3])}
+        self.names = ['case%d' % i for i in range(n_case)]
+        for i, name in enumerate(self.names):
+            self.cat.register(self.tmp, name)
+            self.cat.set_status(name, ['done', 'failed', 'incomplete'][i % 3])
+        self.nbytes = os.path.getsize(os.path.join(self.tmp, 'sweep.db'))
+        self.npoints = n_case
+
+    def time_scan(self, *args):
+        for name in self.names[:100]:
+            self.cat.scan(self.op, name, fluxes=self.fluxes, expect_step=100)
+
+    def time_summary(self, *args):
+        self.cat.summary()
+
+    def time_cases_failed(self, *args):
+        self.cat.cases(status=['failed', 'incomplete'])
+
+    def check(self):
+        n = len(self.names)
+        assert len(self.cat) == n
+        assert self.cat.summary()['failed'] == len(range(1, n, 3))
+        assert self.cat.scan(self.op, self.names[1], fluxes=self.fluxes, expect_step=100) == 'done'
+        assert self.cat.scan(self.op, self.names[2], expect_step=101) == 'incomplete'
+        fx = self.ref_data[-5:, 0:2, typ_dict['fx']].sum(axis=1)
+        metric = self.cat.case(self.names[1])['metrics']['fx']
+        assert np.isclose(metric['value'], fx[-1], rtol=1e-7)
+        assert np.isclose(metric['rel_change'], abs(fx[-1] - fx[0]) / abs(fx[-1]), rtol=1e-6)
+        # a folder of the same name in another sweep does not take the record
+        other = os.path.join(self.tmp, 'other', os.path.basename(self.tmp))
+        os.makedirs(other)
+        write_inp(os.path.join(other, 'mcfd.inp'), n_bc=10)
+        self.cat.register(self.tmp)
+        for func in [self.cat.register, lambda d: self.cat.todo([d])]:
+            try:
+                func(other)
+                assert False, 'name of %s taken' % other
+            except KeyError:
+                pass
+        assert self.cat.case(os.path.basename(self.tmp))['op_dir'] == os.path.abspath(self.tmp)
+        assert self.cat.register(other, name='other') and self.cat.case('other')['op_dir'] == os.path.abspath(other)
+
+
+class sweep_dataset():
+    '''
+    the FFM histories of `n_case` synthetic cases of different lengths stacked
+    by `case_dataset`, in memory and in a memory-mapped .npy file
+    '''
+
+    params = ([10, 40],)
+    param_names = ['n_case']
+
+    def setup(self, n_case):
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        self.case_dirs, self.refs = [], []
+        for i in range(n_case):
+            case_dir = os.path.join(self.tmp, 'case%d' % i)
+            os.makedirs(case_dir)
+            write_inp(os.path.join(case_dir, 'mcfd.inp'), n_bc=10)
+            self.refs.append(write_info1(os.path.join(case_dir, 'mcfd.info1'), n_bc=10, n_step=500 + 10 * i,
+                                         n_at=i % 3, seed=i))
+            self.case_dirs.append(case_dir)
+        self.nbytes = sum(os.path.getsize(os.path.join(d, 'mcfd.info1')) for d in self.case_dirs)
+        self.npoints = n_case * 500 * 10 * len(typ_dict)
+
+    def teardown(self, *args):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_load(self, *args):
+        case_dataset(self.case_dirs).load()
+
+    def time_load_mmap(self, *args):
+        case_dataset(self.case_dirs, mmap=os.path.join(self.tmp, 'sweep.npy')).load()
+
+    def check(self):
+        import tracemalloc
+
+        for kwargs in [{}, {'threads': 4}, {'mmap': os.path.join(self.tmp, 'sweep.npy')}, {'n_step': 100}]:
+            ds = case_dataset(self.case_dirs, **kwargs)
+            n_step = kwargs.get('n_step', 500)
+            assert ds.data.shape == (len(self.case_dirs), n_step, 10, len(typ_dict)) and ds.n_step == n_step
+            for i, (ref_data, ref_areas) in enumerate(self.refs):
+                assert np.allclose(ds.data[i], ref_data[-n_step:], rtol=1e-7, atol=0.0)
+                assert np.allclose(ds.areas[i], ref_areas, rtol=1e-7, atol=0.0)
+
+        # with `mmap`, about one case is in memory at a time, not the sweep
+        tracemalloc.start()
+        load_case(self.case_dirs[-1])
+        peak_case = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        ds = case_dataset(self.case_dirs, mmap=os.path.join(self.tmp, 'sweep.npy'))
+        ds.load()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert peak < peak_case + ds.data.nbytes / 4, (peak, peak_case, ds.data.nbytes)
+
+
+class cli_flux():
+    '''
+    the force table of `n_case` synthetic cases by one `cfdtools flux` command
+    '''
+
+    params = ([20, 100], [1, 4])
+    param_names = ['n_case', 'jobs']
+
+    def setup(self, n_case, jobs):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        self.refs = []
+        self.nbytes = 0
+        for i in range(n_case):
+            d = os.path.join(self.tmp, 'case%03d' % i)
+            os.makedirs(d)
+            write_inp(os.path.join(d, 'mcfd.inp'), n_bc=10, n_infset=5, seed=i)
+            ref_data, _ = write_info1(os.path.join(d, 'mcfd.info1'), n_bc=10, n_step=200, seed=i)
+            self.refs.append(ref_data)
+            self.nbytes += os.path.getsize(os.path.join(d, 'mcfd.info1'))
+        self.npoints = n_case
+        self.out = os.path.join(self.tmp, 'forces.npz')
+        self.argv = ['flux', os.path.join(self.tmp, 'case*'), '--flux', 'fx:1,2', '--flux', 'fy:1,2',
+                     '--ave', '50', '-j', str(jobs), '-o', self.out]
+
+    def teardown(self, *args):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_flux_table(self, *args):
+        cli_main(self.argv)
+
+    def check(self):
+        assert cli_main(self.argv) == 0
+        with np.load(self.out) as f:
+            assert list(f['case']) == ['case%03d' % i for i in range(len(self.refs))]
+            for typ in ['fx', 'fy']:
+                ref = [data[-50:, 0:2, typ_dict[typ]].mean(axis=0).sum() for data in self.refs]
+                assert np.allclose(f[typ], ref, rtol=1e-7)
+
+
+class watch_scan():
+    '''
+    one poll of a `case_watcher` over `n_case` processed cases (nothing
+    changed), the cost paid every `poll` seconds while a sweep runs
+    '''
+
+    params = ([100, 1000],)
+    param_names = ['n_case']
+
+    def setup(self, n_case):
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        for i in range(n_case):
+            d = os.path.join(self.tmp, 'case%04d' % i)
+            os.makedirs(d)
+            for fname in ['mcfd.inp', 'mcfd.info1', 'BC1.dat', 'BC2.dat']:
+                open(os.path.join(d, fname), 'w').close()
+        self.watcher = case_watcher(self.tmp, None, backend='poll')
+        self.watcher.scan()
+        self.watcher.done = dict(self.watcher.seen)
+        self.watcher.pending.clear()
+        self.nbytes = 0
+        self.npoints = n_case
+
+    def teardown(self, *args):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_scan(self, *args):
+        self.watcher.scan()
+
+    def check(self):
+        self.watcher.scan()
+        assert len(self.watcher.seen) == self.npoints and not self.watcher.pending
+        os.utime(os.path.join(self.tmp, 'case0000', 'mcfd.info1'), ns=(0, 0))
+        self.watcher.scan()
+        assert list(self.watcher.pending) == [os.path.join(self.tmp, 'case0000')]
+
+
+class cli_watch():
+    '''
+    `cfdtools watch --once` over `n_case` synthetic cases, run from the sweep
+    folder with relative paths (the handler must not move the files written)
+    '''
+
+    params = ([20],)
+    param_names = ['n_case']
+
+    def setup(self, n_case):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        for i in range(n_case):
+            d = os.path.join(self.tmp, 'sweep', 'case%03d' % i)
+            os.makedirs(d)
+            write_inp(os.path.join(d, 'mcfd.inp'), n_bc=10, n_infset=5, seed=i)
+            write_info1(os.path.join(d, 'mcfd.info1'), n_bc=10, n_step=200, seed=i)
+        self.nbytes = 0
+        self.npoints = n_case
+        self.argv = ['watch', 'sweep', '--flux', 'fx:1,2', '--catalog', 'cat.db', '--debounce', '0',
+                     '--backend', 'poll', '--once', '-o', 'forces.csv']
+        os.chdir(self.tmp)
+
+    def teardown(self, *args):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_watch_once(self, *args):
+        os.chdir(self.tmp)
+        cli_main(self.argv)
+
+    def check(self):
+        os.chdir(self.tmp)
+        assert cli_main(self.argv + ['--state', 'st.json']) == 0
+        assert os.path.exists('cat.db') and os.path.exists('st.json')
+        assert sweep_catalog('cat.db').summary() == {'done': self.npoints}
+        for i in range(self.npoints):
+            d = os.path.join('sweep', 'case%03d' % i)
+            assert not any([os.path.exists(os.path.join(d, f)) for f in ['cat.db', 'st.json', 'forces.csv']])
+        # the state file is found again, nothing to process
+        with open('st.json') as f:
+            assert len(f.read()) > 2
+        assert cli_main(self.argv + ['--state', 'st.json']) == 0
+
+
+class cmd_output():
+    '''
+    `system.cmd` of a process writing `mbytes` MB of short lines, the last
+    lines kept
+    '''
+
+    params = ([1, 50],)
+    param_names = ['mbytes']
+
+    def setup(self, mbytes):
+        n_line = mbytes * (1 << 20) // 18
+        self.command = [sys.executable, '-c', "import sys; sys.stdout.buffer.write(b'line 1234 xxxxxxx\\n' * %d)" % n_line]
+        self.nbytes = n_line * 18
+        self.npoints = n_line
+
+    def teardown(self, *args):
+        pass
+
+    def time_cmd(self, *args):
+        cmd(self.command, max_lines=5)
+
+    def check(self):
+        assert cmd(self.command, max_lines=5) == [b'line 1234 xxxxxxx\n'] * 5
+        # a process left in the background holding the pipe does not block the return
+        t0 = time.time()
+        assert cmd("sleep 3 & echo hi") == [b'hi\n']
+        assert time.time() - t0 < 2.0
@@ -0,0 +1,76 @@
+'''
+import time of the modules of `cfdtools`, each in a new interpreter
+
+the check is the import budget: the time of `import <module>` apart from numpy
+(`python -X importtime`) is below `BUDGET_MS`, and none of the `HEAVY` modules
+is loaded, so a worker that only edits mcfd.inp or reads mcfd.info1 starts fast
+
+'''
+
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time of cfdtools itself (ms), numpy excluded
+BUDGET_MS = 30.0
+
+# modules only loaded by the functions using them
+HEAVY = ['scipy', 'h5py', 'subprocess', 'multiprocessing', 'concurrent.futures',
+         'cfdtools.system', 'cfdtools.tecplot', 'cfdtools.shared']
+
+
+def _python(code, importtime=False):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    return subprocess.run(args, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+def import_time(module):
+    '''
+    time (ms) of `import module` in a new interpreter, apart from numpy
+    '''
+    total = numpy = 0
+    for line in _python('import %s' % module, importtime=True).stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        if name.strip() == 'numpy':
+            numpy = max(numpy, int(cumulative))
+        if name.strip() == module and name == ' ' + module:
+            total = int(cumulative)
+    return (total - numpy) / 1000.0
+
+
+class import_module():
+
+    params = (['cfdtools', 'cfdtools.boundary', 'cfdtools.cfdpp', 'cfdtools.cli', 'cfdtools.utils'],)
+    param_names = ['module']
+
+    def setup(self, module):
+        # the first run writes the bytecode, the timings are those of later runs
+        _python('import %s' % module)
+        self.module = module
+        self.nbytes = 0
+        self.npoints = 1
+
+    def teardown(self, *args):
+        pass
+
+    def time_import(self, module):
+        _python('import %s' % module)
+
+    def check(self):
+        code = 'import sys, %s\nprint(" ".join(m for m in %r if m in sys.modules))' % (self.module, HEAVY)
+        loaded = _python(code).stdout.split()
+        assert loaded == [], '%s loads %s' % (self.module, loaded)
+        ms = min(import_time(self.module) for _ in range(3))
+        assert ms < BUDGET_MS, 'import %s takes %.1f ms' % (self.module, ms)
+        if self.module == 'cfdtools.cfdpp':
+            # the names the module imported before it was made lazy (raises if not found)
+            _python('from cfdtools.cfdpp import tec2py, cfdpp_cmd')
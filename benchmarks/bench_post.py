@@ -0,0 +1,165 @@
+'''
+benchmarks of the post-processing of extracted data: `cfdtools.resample`,
+`cfdtools.stats`, `cfdtools.pipeline`
+
+'''
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from cfdtools.resample import resampler
+from cfdtools.stats import running_stats
+from cfdtools.cfdpp import cfdpp
+from cfdtools.pipeline import post_pipeline, case_job
+from .fixtures import write_inp
+
+
+class resample_profiles():
+    '''
+    many line profiles of different point distributions on one grid, against
+    a loop of `np.interp` over the profiles and variables
+    '''
+
+    params = ([10, 100], [1000, 10000])
+    param_names = ['n_profile', 'n_point']
+
+    def setup(self, n_profile, n_point):
+        rng = np.random.default_rng(0)
+        self.varnames = ['X', 'Y', 'Z', 'P', 'T', 'U', 'V']
+        self.profiles = []
+        for i in range(n_profile):
+            n = n_point + i
+            x = np.concatenate([[0.0], np.sort(rng.uniform(0.0, 1.0, n - 2)), [1.0]])
+            data = rng.uniform(0.0, 1.0, (len(self.varnames), n))
+            data[0] = x
+            self.profiles.append(data)
+        self.grid = np.linspace(0.0, 1.0, 501)
+        self.rs = resampler(self.grid, coord='X')
+        self.rs(self.profiles, varnames=self.varnames)
+        self.npoints = n_profile * len(self.grid)
+        self.nbytes = sum(data.nbytes for data in self.profiles)
+
+    def teardown(self, *args):
+        pass
+
+    def time_np_interp(self, *args):
+        np.array([[np.interp(self.grid, data[0], d) for d in data] for data in self.profiles])
+
+    def time_resample(self, *args):
+        resampler(self.grid, coord='X')(self.profiles, varnames=self.varnames)
+
+    def time_resample_cached(self, *args):
+        self.rs(self.profiles, varnames=self.varnames)
+
+    def check(self):
+        ref = np.array([[np.interp(self.grid, data[0], d) for d in data] for data in self.profiles])
+        values = resampler(self.grid, coord='X')(self.profiles, varnames=self.varnames)
+        assert np.allclose(values, ref, rtol=1e-12, atol=1e-12)
+        assert np.allclose(self.rs(self.profiles, varnames=self.varnames), ref, rtol=1e-12, atol=1e-12)
+
+
+class running_field_stats():
+    '''
+    statistics of a field extracted `n_sample` times, added one sample at a
+    time and in chunks merged, against keeping all the samples for `np.var`
+    '''
+
+    params = ([100, 1000], [1000, 10000])
+    param_names = ['n_sample', 'n_point']
+
+    def setup(self, n_sample, n_point):
+        rng = np.random.default_rng(0)
+        self.shape = (7, n_point)
+        # an offset larger than the fluctuation, as pressure in Pa
+        self.base = rng.uniform(1e5, 2e5, self.shape)
+        self.fluct = rng.normal(0.0, 1.0, (8,) + self.shape)
+        self.n_sample = n_sample
+        self.npoints = n_sample * n_point
+        self.nbytes = n_sample * self.base.nbytes
+
+    def teardown(self, *args):
+        pass
+
+    def _sample(self, i):
+        return self.base + self.fluct[i % 8] * (1.0 + 0.01 * i)
+
+    def time_update(self, *args):
+        st = running_stats(self.shape)
+        for i in range(self.n_sample):
+            st.update(self._sample(i))
+
+    def time_update_batch(self, *args):
+        st = running_stats(self.shape)
+        for i in range(0, self.n_sample, 10):
+            st.update_batch([self._sample(j) for j in range(i, min(i + 10, self.n_sample))])
+
+    def time_np_var(self, *args):
+        xs = np.array([self._sample(i) for i in range(self.n_sample)])
+        xs.mean(axis=0), xs.var(axis=0)
+
+    def check(self):
+        n = min(self.n_sample, 100)
+        xs = np.array([self._sample(i) for i in range(n)])
+        a = running_stats(self.shape)
+        for x in xs[:n // 2]:
+            a.update(x)
+        b = running_stats(self.shape).update_batch(xs[n // 2:])
+        st = a + b
+        assert st.n == n
+        assert np.allclose(st.mean, xs.mean(axis=0), rtol=1e-12, atol=0.0)
+        assert np.allclose(st.var(), xs.var(axis=0), rtol=1e-8, atol=1e-10)
+        assert np.array_equal(st.min, xs.min(axis=0)) and np.array_equal(st.max, xs.max(axis=0))
+
+
+class pipeline_close():
+    '''
+    `n_case` jobs of a slow `integrate` stage through `post_pipeline.process`,
+    all of them and closed after the first one
+    '''
+
+    params = ([10, 50],)
+    param_names = ['n_case']
+    delay = 0.02
+
+    def setup(self, n_case):
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        write_inp(os.path.join(self.tmp, 'mcfd.inp'), n_bc=2, n_infset=2)
+        self.op = cfdpp(self.tmp, verbose='None', chdir=False)
+        self.n_case = n_case
+        self.nbytes = 0
+        self.npoints = n_case
+
+    def teardown(self, *args):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _jobs(self):
+        return [case_job(self.op, name='case%d' % i) for i in range(self.n_case)]
+
+    def _integrate(self, job):
+        time.sleep(self.delay)
+        return job.name
+
+    def time_process(self, *args):
+        list(post_pipeline(integrate=self._integrate, n_proc=0).process(self._jobs()))
+
+    def time_process_first(self, *args):
+        for job in post_pipeline(integrate=self._integrate, n_proc=0).process(self._jobs()):
+            break
+
+    def check(self):
+        jobs = self._jobs()
+        done = list(post_pipeline(integrate=self._integrate, n_proc=0).process(jobs))
+        assert sorted(job.name for job in done) == sorted(job.name for job in jobs)
+        assert all(job.stage == 'done' and job.result['integrate'] == job.name for job in done)
+
+        # the jobs after the first are not integrated once the consumer breaks
+        jobs = self._jobs()
+        t0 = time.time()
+        for job in post_pipeline(integrate=self._integrate, n_proc=0, maxsize=1).process(jobs):
+            assert job.result['integrate'] == job.name
+            break
+        assert time.time() - t0 < self.delay * (self.n_case - 1)
+        assert sum('integrate' in job.result for job in jobs) < self.n_case
@@ -0,0 +1,265 @@
+'''
+benchmarks of the Tecplot ASCII reader / writer of `cfdtools.tecplot`
+
+'''
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from cfdtools.tecplot import tec2py, py2tec, tec_writer, sort_lines, merge_lines, py2npz, npz2py
+from cfdtools.cfdpp import cfdpp
+from .fixtures import write_tec, tec_dict, write_tec_surface, write_inp, write_info1
+
+
+class _tec_file():
+
+    params = ([1, 10], [1000, 100000])
+    param_names = ['n_zone', 'n_point']
+
+    def setup(self, n_zone, n_point):
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        self.in_file = os.path.join(self.tmp, 'in.dat')
+        self.out_file = os.path.join(self.tmp, 'out.dat')
+        self.varnames, self.zones = write_tec(self.in_file, n_zone=n_zone, n_point=n_point)
+        self.npoints = n_zone * n_point
+
+    def teardown(self, *args):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _check_read(self, tdata):
+        assert tdata['varnames'] == self.varnames
+        assert len(tdata['lines']) == len(self.zones)
+        for line, zone in zip(tdata['lines'], self.zones):
+            assert np.allclose(np.array(line['data']), zone, rtol=1e-9, atol=0.0)
+
+
+class read_tec(_tec_file):
+
+    def setup(self, n_zone, n_point):
+        super().setup(n_zone, n_point)
+        self.nbytes = os.path.getsize(self.in_file)
+
+    def time_tec2py(self, *args):
+        tec2py(self.in_file, info=False)
+
+    def time_tec2py_sort(self, *args):
+        tec2py(self.in_file, info=False, is_sort='X')
+
+    def check(self):
+        tdata = tec2py(self.in_file, info=False)
+        self._check_read(tdata)
+        # sorted by the values read, the file rounds close values of P together
+        tdata_sort = tec2py(self.in_file, info=False, is_sort='P')
+        for line, line_sort in zip(tdata['lines'], tdata_sort['lines']):
+            data = np.array(line['data'])
+            order = np.argsort(data[3], kind='stable')
+            assert np.array_equal(np.array(line_sort['data']), data[:, order])
+
+
+
+class read_tec_surface():
+    '''
+    a FE quadrilateral zone and an IJK BLOCK zone (with a cell centered
+    variable) of `n_i` x `n_j` nodes, by `tec2py`, as a boundary of
+    `cfdpp.extract_bc`, and saved in a `sweep_store`
+    '''
+
+    params = ([100, 1000],)
+    param_names = ['n_i']
+
+    def setup(self, n_i):
+        self.tmp = tempfile.mkdtemp(prefix='cfdtools_bench_')
+        write_inp(os.path.join(self.tmp, 'mcfd.inp'), n_bc=2, n_infset=2)
+        write_info1(os.path.join(self.tmp, 'mcfd.info1'), n_bc=2, n_step=10)
+        self.in_file = os.path.join(self.tmp, 'BC1.dat')
+        self.varnames, self.fe, self.ijk = write_tec_surface(self.in_file, n_i=n_i, n_j=50)
+        write_tec(os.path.join(self.tmp, 'BC2.dat'), n_zone=2, n_point=100)
+        self.nbytes = os.path.getsize(self.in_file)
+        self.npoints = n_i * 50 * 3
+
+    def teardown(self, *args):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def time_tec2py(self, *args):
+        tec2py(self.in_file, info=False)
+
+    def _check_surfaces(self, surfaces):
+        fe, ijk = surfaces
+        assert fe['zonetype'] == 'FEQUADRILATERAL' and ijk['zonetype'] == 'ORDERED'
+        assert np.allclose(np.array(fe['data']), self.fe[0], rtol=1e-9, atol=0.0)
+        assert np.array_equal(fe['elements'], self.fe[1])
+        assert ijk['varloc'] == [0, 0, 0, 1, 0, 0, 0]
+        for arr, ref in zip(ijk['data'], self.ijk):
+            assert arr.size == ref.size and np.allclose(arr.reshape(ref.shape), ref, rtol=1e-9, atol=0.0)
+
+    def check(self):
+        tdata = tec2py(self.in_file, info=False)
+        assert tdata['varnames'] == self.varnames and tdata['lines'] == []
+        self._check_surfaces(tdata['surfaces'])
+        # the files exist, extract_bc only reads them
+        op = cfdpp(self.tmp, verbose='None', chdir=False)
+        for merge in [False, True]:
+            bcdata = op.extract_bc([1, 2], False, merge=merge, dedupe=['X', 'Y', 'Z'] if merge else None)
+            assert len(bcdata['lines']) == (1 if merge else 2)
+            self._check_surfaces(bcdata['surfaces'])
+        # the surfaces are kept in the store beside the lines
+        from cfdtools.store import sweep_store
+        st = sweep_store(os.path.join(self.tmp, 'sweep.h5'))
+        st.add_case(op, name='case', extracted={'wall': bcdata})
+        stdata = st.read_extracted('case', 'wall')
+        assert stdata['varnames'] == bcdata['varnames'] and len(stdata['lines']) == 1
+        assert np.array_equal(np.array(stdata['lines'][0]['data']), np.array(bcdata['lines'][0]['data']))
+        self._check_surfaces(stdata['surfaces'])
+        for zone, ref in zip(stdata['surfaces'], bcdata['surfaces']):
+            assert zone['size'] == tuple(ref['size']) and zone['zonename'] == ref['zonename']
+            assert [d.shape for d in zone['data']] == [np.shape(d) for d in ref['data']]
+            assert zone['elements'].dtype == ref['elements'].dtype if 'elements' in ref else 'elements' not in zone
+
+
+class merge_tec():
+    '''
+    merge of the zones of adjacent boundaries (`extract_bc(merge=True)`): the
+    zones are sorted by X, and the last point of a zone is the first of the next
+    '''
+
+    params = ([2, 20], [1000, 100000])
+    param_names = ['n_zone', 'n_point']
+
+    def setup(self, n_zone, n_point):
+        rng = np.random.default_rng(0)
+        self.varnames = ['X', 'Y', 'Z', 'P', 'T', 'U', 'V']
+        zones = []
+        x0 = 0.0
+        for i_zone in range(n_zone):
+            zone = rng.uniform(0.0, 1.0, (len(self.varnames), n_point))
+            zone[0] = x0 + np.cumsum(zone[0])
+            if i_zone > 0:
+                zone[:, 0] = zones[-1][:, -1]
+            zones.append(zone)
+            x0 = zone[0, -1]
+        self.zones = zones
+        self.npoints = n_zone * n_point
+        self.nbytes = sum(zone.nbytes for zone in zones)
+        self.tdata = tec_dict(self.varnames, zones)
+
+    def teardown(self, *args):
+        pass
+
+    def _reset(self):
+        # zones in reverse order, so sort_lines has work to do
+        for line, zone in zip(self.tdata['lines'], self.zones):
+            line['data'] = list(zone[:, ::-1])
+
+    def time_sort_lines(self, *args):
+        self._reset()
+        sort_lines(self.tdata['lines'], 0)
+
+    def time_merge_lines(self, *args):
+        merge_lines(self.tdata, is_sort='X')
+
+    def time_merge_lines_dedupe(self, *args):
+        merge_lines(self.tdata, is_sort='X', dedupe=['X', 'Y', 'Z'])
+
+    def check(self):
+        self._reset()
+        sort_lines(self.tdata['lines'], 0)
+        for line, zone in zip(self.tdata['lines'], self.zones):
+            assert np.array_equal(np.array(line['data']), zone)
+
+        merged = merge_lines(self.tdata, is_sort='X', dedupe=['X', 'Y', 'Z'])
+        assert len(merged['lines']) == 1
+        data = np.array(merged['lines'][0]['data'])
+        assert data.shape[1] == self.npoints - (len(self.zones) - 1)
+        assert np.all(np.diff(data[0]) > 0)
+        assert np.array_equal(data, np.unique(np.concatenate(self.zones, axis=1), axis=1))
+
+
+class write_tec_file(_tec_file):
+
+    def setup(self, n_zone, n_point):
+        super().setup(n_zone, n_point)
+        self.tdata = tec_dict(self.varnames, self.zones)
+        py2tec(self.tdata, self.out_file)
+        self.nbytes = os.path.getsize(self.out_file)
+
+    def time_py2tec(self, *args):
+        py2tec(self.tdata, self.out_file)
+
+    def time_tec_writer(self, *args):
+        with tec_writer(self.out_file, self.varnames) as tw:
+            for i_zone, zone in enumerate(self.zones):
+                tw.write_zone(zone, zonename='zone %d' % (i_zone + 1), solutiontime=i_zone, strandid=1)
+
+    def time_tec_writer_block(self, *args):
+        with tec_writer(self.out_file, self.varnames) as tw:
+            for i_zone, zone in enumerate(self.zones):
+                tw.write_zone(zone, datapacking='BLOCK', solutiontime=i_zone, strandid=1)
+
+    def check(self):
+        py2tec(self.tdata, self.out_file)
+        # py2tec writes `{:e}`, which keeps 7 significant digits
+        tdata = tec2py(self.out_file, info=False)
+        assert tdata['varnames'] == self.varnames
+        for line, zone in zip(tdata['lines'], self.zones):
+            assert np.allclose(np.array(line['data']), zone, rtol=1e-6, atol=0.0)
+
+        for packing in ['POINT', 'BLOCK']:
+            with tec_writer(self.out_file, self.varnames) as tw:
+                for i_zone, zone in enumerate(self.zones):
+                    tw.write_zone(zone, datapacking=packing, solutiontime=i_zone, strandid=1)
+            tdata = tec2py(self.out_file, info=False)
+            for i_zone, (line, zone) in enumerate(zip(tdata['lines'], self.zones)):
+                assert line['solutiontime'] == i_zone and line['strandid'] == 1
+                assert np.allclose(np.array(line['data']), zone, rtol=1e-6, atol=0.0)
+
+
+class tec_storage(_tec_file):
+    '''
+    binary storage of the data of a tecplot file (`py2npz`, `npz2py`) by dtype
+    and compression; the tracked values are the size of the .npz file over
+    that of the ASCII file, and the largest error over the range of each
+    variable, against the data the file is written from
+    '''
+
+    params = ([10], [1000, 100000], ['float64', 'float32'], [None, 'zip', 'zlib', 'zstd', 'blosc'])
+    param_names = ['n_zone', 'n_point', 'dtype', 'compress']
+
+    def setup(self, n_zone, n_point, dtype, compress):
+        super().setup(n_zone, n_point)
+        self.dtype = dtype
+        self.compress = compress
+        self.npz_file = os.path.join(self.tmp, 'out.npz')
+        self.tdata = tec2py(self.in_file, info=False, dtype=dtype)
+        try:
+            py2npz(self.tdata, self.npz_file, compress=compress)
+        except ImportError:
+            raise NotImplementedError('compress=%s is not installed' % compress)
+        self.nbytes = os.path.getsize(self.in_file)
+
+    def time_py2npz(self, *args):
+        py2npz(self.tdata, self.npz_file, compress=self.compress)
+
+    def time_npz2py(self, *args):
+        npz2py(self.npz_file)
+
+    def track_size_ratio(self, *args):
+        return os.path.getsize(self.npz_file) / os.path.getsize(self.in_file)
+
+    def track_max_error(self, *args):
+        error = 0.0
+        for line, zone in zip(npz2py(self.npz_file)['lines'], self.zones):
+            data = np.array(line['data'], dtype=np.float64)
+            scale = zone.max(axis=1) - zone.min(axis=1)
+            error = max(error, (np.abs(data - zone).max(axis=1) / scale).max())
+        return error
+
+    def check(self):
+        tdata = npz2py(self.npz_file)
+        assert tdata['varnames'] == self.varnames
+        for line, ref in zip(tdata['lines'], self.tdata['lines']):
+            assert line['data'][0].dtype == np.dtype(self.dtype)
+            assert np.array_equal(np.array(line['data']), np.array(ref['data']))
+        # the ASCII file keeps 7 digits, float32 keeps about 7 digits too
+        assert self.track_max_error() < (1e-6 if self.dtype == 'float32' else 1e-8)
@@ -0,0 +1,174 @@
+'''
+benchmarks.fixtures
+
+synthetic CFD++ and Tecplot files for the benchmark suite
+
+the layouts follow what `cfdtools.cfdpp` and `cfdtools.tecplot` expect to read,
+and every generator returns the reference values it wrote, so the parsed result
+can be checked against them
+
+'''
+
+import numpy as np
+
+from cfdtools.fakecfdpp import FFM_VARNAMES, write_info1_step, write_info1_at, write_tec_zone
+
+
+def write_info1(path, n_bc=10, n_step=100, n_at=0, seed=0):
+    '''
+    write a synthetic mcfd.info1
+
+    paras
+    ===
+    - `path`      file to write
+    - `n_bc`      number of boundaries
+    - `n_step`    number of time steps
+    - `n_at`      number of `At` solver-setting blocks, spread evenly between steps
+    - `seed`      random seed of the flux values
+
+    return
+    ===
+    `data`, `areas`     reference arrays with the same shape as `cfdpp.FFM_data`
+                        and `cfdpp.areas`
+
+    '''
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(-1.0, 1.0, (n_step, n_bc, len(FFM_VARNAMES))) * 10.0**rng.integers(-3, 4, (1, n_bc, len(FFM_VARNAMES)))
+    areas = rng.uniform(0.1, 2.0, (n_bc, 4))
+
+    at_steps = set()
+    if n_at > 0:
+        at_steps = set(np.linspace(0, n_step - 1, n_at, endpoint=False).astype(int).tolist())
+
+    with open(path, 'w') as f:
+        for step in range(n_step):
+            write_info1_step(f, step, data[step], areas)
+            if step in at_steps:
+                write_info1_at(f, step)
+
+    return data, areas
+
+
+def write_inp(path, n_bc=10, n_infset=20, seed=0):
+    '''
+    write a synthetic mcfd.inp with a boundary table and `n_infset` info sets
+
+    the info sets cycle over the types of `cfdpp.bc_dict`
+
+    return
+    ===
+    `infsets`   a list of (type, values) of each info set
+
+    '''
+    from cfdtools.cfdpp import bc_dict
+
+    rng = np.random.default_rng(seed)
+    typs = list(bc_dict.keys())
+    infsets = []
+
+    with open(path, 'w') as f:
+        f.write('#--- synthetic mcfd.inp for benchmark\n')
+        f.write('mbcons %d\n' % n_bc)
+        f.write('istart 0\n')
+        f.write('ntstep 1000\n')
+        f.write('cfllbg 1.0\n')
+        f.write('cflend 10.0\n')
+        f.write('cdepsave_compute 0\n')
+        f.write('cdepsave_restart 1\n')
+        f.write('cdepsave_ntsave 0\n')
+        for i_para in range(200):
+            f.write('dummy_para_%03d %d\n' % (i_para, i_para))
+
+        f.write('  seq# type modi info\n')
+        for i_bc in range(n_bc):
+            f.write('%4d %4d %4d %4d %s\n' % (i_bc + 1, 7, 0, i_bc % n_infset + 1, 'bc_%d' % (i_bc + 1)))
+
+        f.write('infsets %d\n' % n_infset)
+        for i_inf in range(n_infset):
+            typ = typs[i_inf % len(typs)]
+            bc = bc_dict[typ]
+            values = rng.uniform(1.0, 1.0e5, bc.val_num)
+            infsets.append((typ, values))
+            f.write('#------------------------------------------------------------\n')
+            f.write('seq.# %d #vals %d title %s\n' % (i_inf + 1, bc.val_num, bc.title or typ))
+            for i_val in range(0, bc.val_num, 5):
+                f.write('values ' + ' '.join(['%.4e' % v for v in values[i_val: i_val + 5]]) + '\n')
+        f.write('#------------------------------------------------------------\n')
+        f.write('end_of_file 0\n')
+
+    return infsets
+
+
+def write_tec(path, n_zone=1, n_point=1000, n_var=7, seed=0):
+    '''
+    write a synthetic Tecplot ASCII file of ordered 1D zones (POINT packing)
+
+    return
+    ===
+    `varnames`, `zones`     the variable names and a list of (n_var, n_point)
+                            arrays of each zone
+
+    '''
+    rng = np.random.default_rng(seed)
+    varnames = ['X', 'Y', 'Z', 'P', 'T', 'U', 'V', 'W', 'R', 'M'][:n_var]
+    varnames += ['var%d' % i for i in range(len(varnames), n_var)]
+    zones = []
+
+    with open(path, 'w') as f:
+        f.write('TITLE = "synthetic"\n')
+        f.write('VARIABLES = ' + ','.join(['"%s"' % v for v in varnames]) + '\n')
+        for i_zone in range(n_zone):
+            zone = rng.uniform(0.0, 1.0, (n_var, n_point))
+            # the first variable is monotonic to keep lines well defined
+            zone[0] = np.cumsum(zone[0])
+            zones.append(zone)
+            write_tec_zone(f, 'zone %d' % (i_zone + 1), zone)
+
+    return varnames, zones
+
+
+def tec_dict(varnames, zones):
+    '''
+    wrap arrays from `write_tec` to the dict format of `py2tec`
+    '''
+    return {'varnames': varnames,
+            'lines': [{'zonename': 'zone %d' % (i + 1), 'data': [d for d in zone]} for i, zone in enumerate(zones)]}
+
+
+def write_tec_surface(path, n_i=20, n_j=10, n_var=7, seed=0):
+    '''
+    write a synthetic Tecplot ASCII file of two surface zones: a FE
+    quadrilateral zone (POINT packing, connectivity from 1) and an ordered IJK
+    zone (BLOCK packing, K = 2, the 4th variable cell centered)
+
+    return
+    ===
+    `varnames`, `fe`, `ijk`     the variable names; (`data` in shape (n_var, nodes),
+                                `elements` from 0) of the FE zone; the list of
+                                the arrays of the IJK zone, in shape (K, J, I)
+                                or (K - 1, J - 1, I - 1)
+
+    '''
+    rng = np.random.default_rng(seed)
+    varnames = ['X', 'Y', 'Z', 'P', 'T', 'U', 'V', 'W', 'R', 'M'][:n_var]
+    varnames += ['var%d' % i for i in range(len(varnames), n_var)]
+
+    fe_data = rng.uniform(0.0, 1.0, (n_var, n_i * n_j))
+    node = np.arange(n_i * n_j).reshape(n_j, n_i)
+    elements = np.stack([node[:-1, :-1], node[:-1, 1:], node[1:, 1:], node[1:, :-1]], axis=-1).reshape(-1, 4)
+    ijk = [rng.uniform(0.0, 1.0, (1, n_j - 1, n_i - 1) if i_var == 3 else (2, n_j, n_i)) for i_var in range(n_var)]
+
+    with open(path, 'w') as f:
+        f.write('TITLE = "synthetic surfaces"\n')
+        f.write('VARIABLES = ' + ','.join(['"%s"' % v for v in varnames]) + '\n')
+        f.write('ZONE T="fe", ZONETYPE=FEQUADRILATERAL, NODES=%d, ELEMENTS=%d, DATAPACKING=POINT\n'
+                % (n_i * n_j, len(elements)))
+        np.savetxt(f, fe_data.T, fmt='%.10e')
+        np.savetxt(f, elements + 1, fmt='%d')
+        f.write('ZONE T="ijk", I=%d, J=%d, K=2, DATAPACKING=BLOCK, VARLOCATION=([4]=CELLCENTERED)\n' % (n_i, n_j))
+        for arr in ijk:
+            flat = arr.reshape(-1)
+            for st in range(0, len(flat), 10):
+                f.write(' '.join(['%.10e' % v for v in flat[st: st + 10]]) + '\n')
+
+    return varnames, (fe_data, elements), ijk
@@ -1,2 +1,33 @@
 __version__ = '0.1.0'
 __name__ = 'cfdpptools'
+
+import importlib
+
+# the sub-modules and the main names are loaded on first access, i.e.
+# `cfdtools.tecplot` or `cfdtools.tec2py`, `import cfdtools` loads nothing else
+SUBMODULES = ['boundary', 'catalog', 'cfdpp', 'checkpoint', 'cli', 'cluster', 'dataset', 'fakecfdpp', 'partition',
+              'pipeline', 'resample', 'shared', 'stats', 'store', 'system', 'tecplot', 'template', 'utils', 'watch']
+
+_NAMES = {
+    'tec2py': 'tecplot', 'py2tec': 'tecplot', 'tec_writer': 'tecplot', 'merge_lines': 'tecplot',
+    'bc_dict': 'boundary', 'bc_table': 'boundary',
+    'metis_cache': 'partition',
+    'run_manager': 'checkpoint',
+    'case_factory': 'template',
+    'case_job': 'pipeline', 'post_pipeline': 'pipeline',
+    'sweep_store': 'store', 'sweep_catalog': 'catalog', 'case_dataset': 'dataset',
+    'resampler': 'resample', 'running_stats': 'stats', 'field_stats': 'stats',
+    'case_watcher': 'watch', 'post_handler': 'watch',
+}
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(__spec__.name + '.' + name)
+    if name in _NAMES:
+        return getattr(importlib.import_module(__spec__.name + '.' + _NAMES[name]), name)
+    raise AttributeError("module %r has no attribute %r" % (__spec__.name, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + SUBMODULES + list(_NAMES.keys()))
@@ -0,0 +1,257 @@
+'''
+cfdtools.boundary
+
+boundary condition types of cfd++ and the boundary table of mcfd.inp
+
+- `bc_dict`     the registry of bc types, looked up by name, by cfd++ code
+                number or by infoset title
+- `bc_table`    the table `seq# type modi info` of mcfd.inp, parsed once and
+                cached until the file changes, with O(1) lookup by bc number
+                and bulk reassignment of types and infosets
+
+'''
+
+import os
+from collections.abc import Mapping
+
+
+class cfdpp_bc():
+    '''
+    a boundary condition type of cfd++
+
+    paras
+    ===
+    - `no`        the code number in cfd++
+    - `title`     the title of its infoset in mcfd.inp
+    - `val_num`   number of values of its infoset
+    - `name`      the name in `bc_dict`, set when registered
+
+    '''
+
+    __slots__ = ('no', 'title', 'val_num', 'name')
+
+    def __init__(self, no: int, title: str, val_num: int, name: str = None) -> None:
+        self.no = no
+        self.title = title
+        self.val_num = val_num
+        self.name = name
+
+    def __repr__(self):
+        return 'cfdpp_bc(%d, %r, %d, %r)' % (self.no, self.title, self.val_num, self.name)
+
+
+class bc_registry(Mapping):
+    '''
+    the bc types by name (as a dict), with reverse indexes from the cfd++
+    code number and from the infoset title to the name; `bc_dict[name] = bc`
+    is the same as `register(name, bc)`
+    '''
+
+    def __init__(self, bcs=None):
+        self._by_name = {}
+        self._by_code = {}
+        self._by_title = {}
+        if bcs is not None:
+            for name, bc in bcs.items():
+                self.register(name, bc)
+
+    def register(self, name, bc):
+        '''
+        add bc type `bc` (a `cfdpp_bc`) with `name`
+        '''
+        if bc.no in self._by_code and self._by_code[bc.no] != name:
+            raise KeyError('bc code %d already registered as %s' % (bc.no, self._by_code[bc.no]))
+        bc.name = name
+        self._by_name[name] = bc
+        self._by_code[bc.no] = name
+        if bc.title:
+            self._by_title[bc.title] = name
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+    def __setitem__(self, name, bc):
+        self.register(name, bc)
+
+    def __iter__(self):
+        return iter(self._by_name)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def code(self, name):
+        return self._by_name[name].no
+
+    def name_of(self, code):
+        '''
+        the name of the bc type with cfd++ code number `code`
+        '''
+        return self._by_code[code]
+
+    def from_code(self, code):
+        return self._by_name[self._by_code[code]]
+
+    def from_title(self, title):
+        '''
+        the bc type whose infoset has title `title`
+        '''
+        return self._by_name[self._by_title[title]]
+
+
+bc_dict = bc_registry({
+    'sym':          cfdpp_bc(6, '', 0),
+    'wall':         cfdpp_bc(7, '', 0),
+    'charactistic': cfdpp_bc(16, 'primitive_variables_2', 7),
+    'backpressure': cfdpp_bc(35, 'back_pres', 1),
+    'totalpt':      cfdpp_bc(82, 'ptot_ttot_etc.', 4),
+    'mfr':          cfdpp_bc(98, 'massrate_temp_etc.', 4)
+})
+
+
+class bc_row():
+    '''
+    a row of the boundary table: bc number, type code, modifier, infoset
+    number and name, and `line` its line index in mcfd.inp
+    '''
+
+    __slots__ = ('no', 'typ', 'modi', 'infset', 'name', 'line')
+
+    def __init__(self, no, typ, modi, infset, name, line):
+        self.no = no
+        self.typ = typ
+        self.modi = modi
+        self.infset = infset
+        self.name = name
+        self.line = line
+
+    def __repr__(self):
+        return 'bc_row(%d, %d, %d, %d, %r)' % (self.no, self.typ, self.modi, self.infset, self.name)
+
+    def format(self):
+        return '%4d %4d %4d %4d %s\n' % (self.no, self.typ, self.modi, self.infset, self.name)
+
+
+# parsed tables by path, with the (mtime, size) of the file they are parsed from
+_table_cache = {}
+
+
+def _stat(fname):
+    st = os.stat(fname)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class bc_table():
+    '''
+    the boundary table of a mcfd.inp file
+
+    use `bc_table.load(inp_dir)` to get the cached table of a file, it is only
+    parsed again when the file is changed. `lines` are the lines of the file
+    if already read
+
+    '''
+
+    HEADER = 'seq# type modi info'
+
+    def __init__(self, inp_dir, lines=None):
+        self.inp_dir = inp_dir
+        self.rows = {}
+        self.header_line = None
+        self.parse(lines)
+
+    @classmethod
+    def load(cls, inp_dir):
+        inp_dir = os.path.abspath(inp_dir)
+        stat = _stat(inp_dir)
+        cached = _table_cache.get(inp_dir)
+        if cached is not None and cached[0] == stat:
+            return cached[1]
+        table = cls(inp_dir)
+        _table_cache[inp_dir] = (stat, table)
+        return table
+
+    def parse(self, lines=None):
+        if lines is None:
+            with open(self.inp_dir, 'r') as f:
+                lines = f.readlines()
+        self.rows = {}
+        self.header_line = None
+        for idx, line in enumerate(lines):
+            if line.find(self.HEADER) > -1:
+                self.header_line = idx
+                break
+        if self.header_line is None:
+            return
+
+        for idx in range(self.header_line + 1, len(lines)):
+            line_sp = lines[idx].split()
+            if len(line_sp) < 5 or line_sp[0] != str(len(self.rows) + 1):
+                break
+            self.rows[int(line_sp[0])] = bc_row(int(line_sp[0]), int(line_sp[1]), int(line_sp[2]), int(line_sp[3]), line_sp[4], idx)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, bc_num):
+        return bc_num in self.rows
+
+    def __getitem__(self, bc_num):
+        if bc_num not in self.rows:
+            raise KeyError("Can't find boundary number %d" % bc_num)
+        return self.rows[bc_num]
+
+    def typ_name(self, bc_num):
+        '''
+        the name in `bc_dict` of the type of boundary `bc_num`, None if the
+        type is not registered
+        '''
+        try:
+            return bc_dict.name_of(self[bc_num].typ)
+        except KeyError:
+            return None
+
+    def by_infset(self, infset_num):
+        '''
+        the bc numbers using infoset `infset_num`
+        '''
+        return [no for no, row in self.rows.items() if row.infset == infset_num]
+
+    def assign(self, changes, backup=None):
+        '''
+        change the type and infoset of many boundaries, with one read and one
+        write of mcfd.inp
+
+        paras
+        ===
+        - `changes`   a dict of bc number -> (type name in `bc_dict`, infoset number),
+                      the type can be None to keep the current one
+        - `backup`    file to write the original mcfd.inp, default is None
+
+        '''
+        with open(self.inp_dir, 'r') as f:
+            lines = f.readlines()
+
+        # all the changes are checked on a fresh table before anything is written
+        table = bc_table(self.inp_dir, lines)
+        codes = {}
+        for bc_num, (typ, infset_num) in changes.items():
+            if bc_num not in table:
+                raise KeyError("Can't find boundary number %d" % bc_num)
+            if typ is not None:
+                if typ not in bc_dict:
+                    raise KeyError('bc type %s not in bc_dict' % typ)
+                codes[bc_num] = bc_dict[typ].no
+        new_lines = list(lines)
+        for bc_num, (typ, infset_num) in changes.items():
+            row = table[bc_num]
+            row.typ = codes.get(bc_num, row.typ)
+            row.infset = infset_num
+            new_lines[row.line] = row.format()
+
+        if backup is not None:
+            with open(backup, 'w') as fbak:
+                fbak.writelines(lines)
+        with open(self.inp_dir, 'w') as f:
+            f.writelines(new_lines)
+        self.rows = table.rows
+        self.header_line = table.header_line
+        _table_cache[os.path.abspath(self.inp_dir)] = (_stat(self.inp_dir), self)
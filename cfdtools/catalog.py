@@ -0,0 +1,367 @@
+'''
+cfdtools.catalog
+
+an index of the cases of a sweep in a SQLite file
+
+for each case the catalog keeps
+
+- `inputs_hash`   hash of mcfd.inp and the grid files (size and mtime), to find
+                  the cases whose inputs changed since they were run
+- `status`        `pending`, `running`, `done`, `incomplete` or `failed`, with
+                  the stage and the error of a failed case
+- `n_step`        the complete steps of mcfd.info1 (a truncated last step is
+                  not counted)
+- `metrics`       the convergence of the fluxes (last value, relative change
+                  over the last steps) and other numbers
+- `artifacts`     the extracted files of the case, with their size and mtime
+
+the catalog is updated case by case (one short transaction each, the SQLite
+file can be shared by the processes of a sweep) and queried without touching
+the case folders, so a re-run only takes the cases that changed or failed.
+
+usage
+===
+
+>>> cat = sweep_catalog('sweep.db')
+>>> todo = cat.todo(case_dirs)                      # new, changed or not done
+>>> for job in post_pipeline(...).process([case_job(cfdpp(d), ...) for d in todo]):
+>>>     cat.record(job, fluxes={'fx': ('fx', [3, 4])})
+>>> cat.summary()                                    # {'done': 180, 'failed': 3, ...}
+>>> cat.cases(status='failed')
+
+'''
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from .cfdpp import typ_dict
+from .partition import GRID_FILES
+
+STATUS = ['pending', 'running', 'done', 'incomplete', 'failed']
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cases (
+    name        TEXT PRIMARY KEY,
+    op_dir      TEXT,
+    inputs_hash TEXT,
+    status      TEXT,
+    stage       TEXT,
+    error       TEXT,
+    n_step      INTEGER,
+    metrics     TEXT,
+    updated     REAL
+);
+CREATE INDEX IF NOT EXISTS cases_status ON cases (status);
+CREATE INDEX IF NOT EXISTS cases_op_dir ON cases (op_dir);
+CREATE TABLE IF NOT EXISTS artifacts (
+    name        TEXT,
+    label       TEXT,
+    path        TEXT,
+    size        INTEGER,
+    mtime       REAL,
+    PRIMARY KEY (name, label, path)
+);
+'''
+
+
+def inputs_hash(op_dir, files=GRID_FILES):
+    '''
+    hash of the inputs of case `op_dir`: the text of mcfd.inp, and the size
+    and mtime of the grid `files` (not read, they are large)
+    '''
+    h = hashlib.sha256()
+    inp = os.path.join(op_dir, 'mcfd.inp')
+    if os.path.exists(inp):
+        with open(inp, 'rb') as f:
+            h.update(f.read())
+    for fname in files:
+        fpath = os.path.join(op_dir, fname)
+        if os.path.exists(fpath):
+            st = os.stat(fpath)
+            h.update(('%s %d %d\n' % (fname, st.st_size, st.st_mtime_ns)).encode())
+    return h.hexdigest()
+
+
+def convergence(op, fluxes, window=5):
+    '''
+    convergence metrics of the fluxes of case `op` (a `cfdpp` object)
+
+    paras
+    ===
+    - `fluxes`    a dict of label -> (typ, bc_series), as `cfdpp.read_flux`
+    - `window`    the relative change is taken over the last `window` steps
+
+    return
+    ===
+    a dict of label -> {`value`, `rel_change`}
+    '''
+    metrics = {}
+    n_step = op.index_FFM_history()
+    if n_step == 0:
+        return metrics
+    for label, (typ, bc_series) in fluxes.items():
+        data = op.FFM_index.read(steps=slice(-window, None), bcs=bc_series, typs=[typ_dict[typ]])
+        flux = data.sum(axis=1)[:, 0]
+        value = float(flux[-1])
+        change = abs(value - flux[0]) / abs(value) if value != 0 else float(abs(flux[0]))
+        metrics[label] = {'value': value, 'rel_change': change}
+    return metrics
+
+
+class sweep_catalog():
+    '''
+    SQLite index of the cases of a sweep
+
+    paras
+    ===
+    - `fname`     the SQLite file, created if not exist
+    - `timeout`   seconds to wait for the lock of another process
+
+    '''
+
+    def __init__(self, fname, timeout=30.0):
+        # kept absolute, the working directory may change (i.e. by `cfdpp`)
+        self.fname = os.path.abspath(fname)
+        self.timeout = timeout
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.fname, timeout=self.timeout)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA journal_mode=WAL')
+        return _closing(db)
+
+    # ============================== update ==============================
+
+    def _check_dir(self, row, name, op_dir):
+        # the cases are named by their folder name, two sweeps with the same
+        # names in one catalog must not overwrite each other
+        if row is not None and row['op_dir'] != op_dir:
+            raise KeyError('case %s of %s is already in %s for %s, give another name or remove it'
+                           % (name, op_dir, self.fname, row['op_dir']))
+
+    def register(self, op_dir, name=None, status='pending'):
+        '''
+        add case `op_dir` (or a `cfdpp` object), or update its inputs hash;
+        a case whose inputs changed is set back to `status`. A KeyError is
+        raised if `name` (default is the folder name) is taken by another folder
+
+        return
+        ===
+        whether the case is new or its inputs changed
+        '''
+        op_dir = os.path.abspath(getattr(op_dir, 'op_dir', op_dir))
+        name = name if name is not None else os.path.basename(os.path.normpath(op_dir))
+        digest = inputs_hash(op_dir)
+        with self._connect() as db:
+            row = db.execute('SELECT op_dir, inputs_hash FROM cases WHERE name = ?', (name,)).fetchone()
+            self._check_dir(row, name, op_dir)
+            if row is not None and row['inputs_hash'] == digest:
+                return False
+            db.execute('INSERT OR REPLACE INTO cases (name, op_dir, inputs_hash, status, stage, error, n_step, metrics, updated) '
+                       'VALUES (?, ?, ?, ?, NULL, NULL, 0, ?, ?)', (name, op_dir, digest, status, '{}', time.time()))
+            db.execute('DELETE FROM artifacts WHERE name = ?', (name,))
+        return True
+
+    def set_status(self, name, status, stage=None, error=None):
+        '''
+        set the status of case `name`, with the stage and the error if failed
+        '''
+        if status not in STATUS:
+            raise ValueError('status %s not in %s' % (status, ', '.join(STATUS)))
+        with self._connect() as db:
+            cur = db.execute('UPDATE cases SET status = ?, stage = ?, error = ?, updated = ? WHERE name = ?',
+                             (status, stage, None if error is None else str(error), time.time(), name))
+            if cur.rowcount == 0:
+                raise KeyError('case %s not in %s' % (name, self.fname))
+
+    def add_artifact(self, name, label, path):
+        '''
+        record an extracted file of case `name`, ignored if it does not exist
+        '''
+        if not os.path.exists(path):
+            return False
+        st = os.stat(path)
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO artifacts (name, label, path, size, mtime) VALUES (?, ?, ?, ?, ?)',
+                       (name, label, os.path.abspath(path), st.st_size, st.st_mtime))
+        return True
+
+    def scan(self, op, name=None, fluxes=None, window=5, expect_step=None, metrics=None):
+        '''
+        read the state of case `op` (a `cfdpp` object) into the catalog,
+        without raising on a missing or truncated output
+
+        paras
+        ===
+        - `fluxes`        a dict of label -> (typ, bc_series) whose convergence is recorded
+        - `window`        steps of the relative change of the fluxes
+        - `expect_step`   number of steps expected, the case is `incomplete`
+                          if mcfd.info1 has less
+        - `metrics`       a dict of other numbers to record
+
+        return
+        ===
+        the status of the case
+        '''
+        name = name if name is not None else os.path.basename(os.path.normpath(op.op_dir))
+        self.register(op.op_dir, name)
+        values = {}
+        error = None
+        try:
+            n_step = op.index_FFM_history() if os.path.exists(os.path.join(op.op_dir, 'mcfd.info1')) else 0
+            if fluxes is not None and n_step > 0:
+                values.update(convergence(op, fluxes, window))
+        except Exception as e:
+            n_step = 0
+            error = e
+        if metrics is not None:
+            values.update(metrics)
+
+        if error is not None:
+            status = 'failed'
+        elif n_step == 0 or (expect_step is not None and n_step < expect_step):
+            status = 'incomplete'
+        else:
+            status = 'done'
+
+        with self._connect() as db:
+            db.execute('UPDATE cases SET status = ?, stage = ?, error = ?, n_step = ?, metrics = ?, updated = ? WHERE name = ?',
+                       (status, 'scan' if error is not None else None, None if error is None else repr(error),
+                        n_step, json.dumps(values), time.time(), name))
+        return status
+
+    def record(self, job, fluxes=None, window=5, expect_step=None):
+        '''
+        record a `pipeline.case_job` after the pipeline: its status (failed in
+        a stage, or scanned), its extracted files, and its numeric results
+        '''
+        metrics = {k: v for k, v in job.result.items() if isinstance(v, (int, float))}
+        metrics.update({'time_' + k: v for k, v in job.times.items()})
+        status = self.scan(job.op, job.name, fluxes=fluxes, window=window, expect_step=expect_step, metrics=metrics)
+        if job.error is not None:
+            self.set_status(job.name, 'failed', stage=job.stage, error=repr(job.error))
+            status = 'failed'
+        for label, files in job.files.items():
+            for path in files:
+                self.add_artifact(job.name, label, path)
+        return status
+
+    def remove(self, name):
+        with self._connect() as db:
+            db.execute('DELETE FROM cases WHERE name = ?', (name,))
+            db.execute('DELETE FROM artifacts WHERE name = ?', (name,))
+
+    # ============================== query ==============================
+
+    def __contains__(self, name):
+        with self._connect() as db:
+            return db.execute('SELECT 1 FROM cases WHERE name = ?', (name,)).fetchone() is not None
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute('SELECT COUNT(*) FROM cases').fetchone()[0]
+
+    def case(self, name):
+        '''
+        the record of case `name`, a dict
+        '''
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM cases WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError('case %s not in %s' % (name, self.fname))
+        info = dict(row)
+        info['metrics'] = json.loads(info['metrics'] or '{}')
+        return info
+
+    def cases(self, status=None):
+        '''
+        names of the cases, of the given status (a str or a list) if given
+        '''
+        with self._connect() as db:
+            if status is None:
+                rows = db.execute('SELECT name FROM cases ORDER BY name').fetchall()
+            else:
+                status = [status] if isinstance(status, str) else list(status)
+                rows = db.execute('SELECT name FROM cases WHERE status IN (%s) ORDER BY name' % ','.join('?' * len(status)),
+                                  status).fetchall()
+        return [row['name'] for row in rows]
+
+    def summary(self):
+        '''
+        number of cases of each status
+        '''
+        with self._connect() as db:
+            rows = db.execute('SELECT status, COUNT(*) AS n FROM cases GROUP BY status').fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def artifacts(self, name, label=None):
+        '''
+        the recorded files of case `name` (of `label` if given), a dict of
+        label -> list of paths
+        '''
+        with self._connect() as db:
+            if label is None:
+                rows = db.execute('SELECT label, path FROM artifacts WHERE name = ? ORDER BY rowid', (name,)).fetchall()
+            else:
+                rows = db.execute('SELECT label, path FROM artifacts WHERE name = ? AND label = ? ORDER BY rowid',
+                                  (name, label)).fetchall()
+        result = {}
+        for row in rows:
+            result.setdefault(row['label'], []).append(row['path'])
+        return result
+
+    def metrics(self, key, status='done'):
+        '''
+        a metric of the cases of `status`, i.e. `metrics('fx')` for the
+        convergence of the flux `fx`, a dict of name -> value
+        '''
+        with self._connect() as db:
+            rows = db.execute('SELECT name, metrics FROM cases WHERE status = ? ORDER BY name', (status,)).fetchall()
+        result = {}
+        for row in rows:
+            values = json.loads(row['metrics'] or '{}')
+            if key in values:
+                result[row['name']] = values[key]
+        return result
+
+    def todo(self, case_dirs):
+        '''
+        the folders in `case_dirs` to run: not in the catalog, inputs changed,
+        or not `done`; compared by the folder name, a KeyError is raised if
+        the name is taken by another folder
+        '''
+        todo = []
+        with self._connect() as db:
+            for op_dir in case_dirs:
+                name = os.path.basename(os.path.normpath(op_dir))
+                row = db.execute('SELECT op_dir, inputs_hash, status FROM cases WHERE name = ?', (name,)).fetchone()
+                self._check_dir(row, name, os.path.abspath(op_dir))
+                if row is None or row['status'] != 'done' or row['inputs_hash'] != inputs_hash(op_dir):
+                    todo.append(op_dir)
+        return todo
+
+
+class _closing():
+    '''
+    a sqlite connection committed and closed at the end of a `with` block
+    '''
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, *args):
+        try:
+            if exc_type is None:
+                self.db.commit()
+            else:
+                self.db.rollback()
+        finally:
+            self.db.close()
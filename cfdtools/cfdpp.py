@@ -6,10 +6,24 @@ a selection of tools to set, run and post-process the commercial software cfd++
 '''
 
 import os
-import time
 import numpy as np
-from .system import cfdpp_cmd
-from .tecplot import tec2py
+from .boundary import cfdpp_bc, bc_dict, bc_table
+
+# the other modules (system, tecplot, shared, partition, stats) are imported
+# in the functions using them, so a process that only edits mcfd.inp or reads
+# mcfd.info1 does not load subprocess, multiprocessing, ...
+
+# the names once imported here, loaded on first access so that
+# `from cfdtools.cfdpp import tec2py` still works
+_LAZY_NAMES = {'tec2py': 'tecplot', 'cfdpp_cmd': 'system'}
+
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        import importlib
+        return getattr(importlib.import_module('.' + _LAZY_NAMES[name], __package__), name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 
 # the index of output flux type
 typ_dict = {
@@ -23,24 +37,324 @@ typ_dict = {
     'mz':       7
 }
 
-# the index of boundary conditions
+# the index of boundary conditions (`cfdpp_bc`, `bc_dict`) is in cfdtools.boundary
 
-class cfdpp_bc():
+def read_inp_para(inp_dir, key):
+    '''
+    read the value of `key` in a mcfd.inp file `inp_dir`, None if not found
+    '''
+    with open(inp_dir, 'r') as f:
+        for line in f.readlines(): 
+            if line.find(key) > -1:
+                return line.split()[1]
+    return None
 
-    def __init__(self, no: int, title: str, val_num: int) -> None:
-        self.no = no
-        self.title = title
-        self.val_num = val_num
 
-bc_dict = {
-    'sym':          cfdpp_bc(6, '', 0),
-    'wall':         cfdpp_bc(7, '', 0),
-    'charactistic': cfdpp_bc(16, 'primitive_variables_2', 7),
-    'backpressure': cfdpp_bc(35, 'back_pres', 1),
-    'totalpt':      cfdpp_bc(82, 'ptot_ttot_etc.', 4),
-    'mfr':          cfdpp_bc(98, 'massrate_temp_etc.', 4)
+def read_info1(fname, n_bc, n_var=8, n_step=1e10):
+    '''
+    read the FFM history from a mcfd.info1 file, ignore solver settiong lines
+
+    paras
+    ===
+    - `fname`     the mcfd.info1 file
+    - `n_bc`      number of boundaries (`mbcons` in mcfd.inp)
+    - `n_var`     the varibles in mcfd.info1, 8 is default and no need to change
+    - `n_step`    to read first `n_step`
+
+    return
+    ===
+    `data`      FFM data in shape (n_step, n_bc, n_var), see `cfdpp.read_FFM_history`
+    `areas`     the areas of each boundary in x, y, z and n direction, (n_bc, 4)
+
+    '''
+    with open(fname, 'r') as f:
+        lines = f.readlines()
+
+    for idx, line in enumerate(lines):
+        if line.split()[0] == 'At':
+            # print(lines[idx: idx + 11])
+            del lines[idx: idx + 11]
+
+    
+    idx = 14
+    step = 0
+    file_len = len(lines)
+
+    n_step = min(int((file_len) / (23 * n_bc + 1)), n_step)
+
+    data = np.zeros((n_step, n_bc, n_var))
+    areass = np.zeros((n_bc, 4))
+
+    for _ in range(n_step):
+        for i_bc in range(n_bc):
+            for i_var in range(n_var):
+                data[step, i_bc, i_var] = lines[idx].split()[2]
+                idx += 1
+            idx += 15
+        idx += 1
+        step += 1
+    
+    for i_area in range(n_bc):
+        areas_str = lines[22 + i_area * 23].split()
+        for i_typ in range(4):
+            areass[i_area, i_typ] = float(areas_str[1 + i_typ])
+
+    return data, areass
+
+
+def _strip_at(lines):
+    '''
+    remove the solver-setting blocks (11 lines starting with `At`) from a
+    list of lines (bytes)
+    '''
+    idx = 0
+    while idx < len(lines):
+        # the first word, as `info1_index` and `read_info1` (the line may be indented)
+        if lines[idx].lstrip()[:2] == b'At' and lines[idx].split()[:1] == [b'At']:
+            del lines[idx: idx + 11]
+        else:
+            idx += 1
+    return lines
+
+
+def _parse_info1_steps(fname, st, ed, n_step, n_bc, n_var=8, out=None, i_step=0):
+    '''
+    parse `n_step` steps of mcfd.info1 between byte offsets `st` and `ed`
+
+    if `out` (a `shared.shared_array`) is given, the data is written to
+    `out[i_step: i_step + n_step]`, otherwise it is returned
+    '''
+    with open(fname, 'rb') as f:
+        f.seek(st)
+        lines = _strip_at(f.read(ed - st).split(b'\n'))
+
+    idx = (np.arange(n_step)[:, None, None] * (23 * n_bc + 1) + 14 + np.arange(n_bc)[None, :, None] * 23
+            + np.arange(n_var)[None, None, :]).ravel()
+    data = np.array([lines[i].split()[2] for i in idx], dtype=float).reshape(n_step, n_bc, n_var)
+
+    if out is None:
+        return data
+    out.attach(writable=True)[i_step: i_step + n_step] = data
+    out.close()
+
+
+def read_info1_parallel(fname, n_bc, n_var=8, n_step=1e10, n_proc=4, n_chunk=None):
+    '''
+    read the FFM history from mcfd.info1 with a process pool, same result as
+    `read_info1`
+
+    the file is split at the time step boundaries found by `info1_index`, and
+    the chunks are parsed by `n_proc` processes into slices of one array in
+    shared memory
+
+    paras
+    ===
+    - `n_proc`    number of processes
+    - `n_chunk`   number of chunks, default is `4 * n_proc` for load balance
+
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+    from .shared import shared_array
+
+    index = info1_index(fname, n_bc, n_var)
+    n_step = int(min(index.update(), n_step))
+    if n_chunk is None:
+        n_chunk = 4 * n_proc
+    bounds = np.unique(np.linspace(0, n_step, min(n_chunk, n_step) + 1).astype(int))
+    ends = np.append(index.starts, index.pos)
+
+    out = shared_array.create((n_step, n_bc, n_var))
+    try:
+        with ProcessPoolExecutor(max_workers=n_proc) as pool:
+            futures = [pool.submit(_parse_info1_steps, fname, ends[st], ends[ed], ed - st, n_bc, n_var, out, st)
+                       for st, ed in zip(bounds[:-1], bounds[1:])]
+            for future in futures:
+                future.result()
+        data = out.array.copy()
+    finally:
+        out.unlink()
+
+    return data, index.read_areas()
+
+
+class info1_index():
+    '''
+    byte offsets of the time steps in a mcfd.info1 file, to read a slice of the
+    FFM history without parsing the whole file
+
+    a time step is `23 * n_bc + 1` lines after the solver-setting blocks (11
+    lines starting with `At`) are removed. The file is scanned once in large
+    chunks, and `update()` only scans what has been appended since, so the
+    index follows a running case. Reading `n` steps then costs O(n) instead of
+    O(file).
+
+    paras
+    ===
+    - `fname`     the mcfd.info1 file
+    - `n_bc`      number of boundaries
+    - `n_var`     the varibles in mcfd.info1, 8 is default and no need to change
+
+    '''
+
+    def __init__(self, fname, n_bc, n_var=8):
+        self.fname = fname
+        self.n_bc = n_bc
+        self.n_var = n_var
+        self.step_lines = 23 * n_bc + 1
+        self.reset()
+
+    def reset(self):
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.n_line = 0     # number of lines (out of `At` blocks) scanned
+        self.at_skip = 0    # lines of an `At` block left to skip
+        self.pos = 0        # the byte offset scanned to
+        self.tail = b''     # the last bytes scanned, to detect a rewritten file
+
+    @property
+    def n_step(self):
+        '''
+        number of complete steps in the index
+        '''
+        return self.n_line // self.step_lines
+
+    def update(self, chunk=1 << 26):
+        '''
+        scan the part of the file written since the last update
+
+        return
+        ===
+        the number of complete steps
+        '''
+        size = os.path.getsize(self.fname)
+        with open(self.fname, 'rb') as f:
+            if self.pos > 0:
+                f.seek(self.pos - len(self.tail))
+                if size < self.pos or f.read(len(self.tail)) != self.tail:
+                    # the file is truncated or rewritten by a new run
+                    self.reset()
+            f.seek(self.pos)
+
+            new_starts = []
+            while True:
+                # no larger than the file, a `read(chunk)` allocates `chunk` bytes
+                buf = f.read(min(chunk, max(size - self.pos, 0)))
+                if len(buf) == 0:
+                    break
+                last_nl = buf.rfind(b'\n')
+                if last_nl < 0:
+                    # an incomplete line is left for the next update
+                    break
+                buf = buf[:last_nl + 1]
+                new_starts.append(self._scan(buf))
+                self.pos += len(buf)
+                self.tail = buf[-64:]
+                f.seek(self.pos)
+
+        if len(new_starts) > 0:
+            self.starts = np.concatenate([self.starts] + new_starts)
+        return self.n_step
+
+    def _scan(self, buf):
+        '''
+        return the offsets of the step starts in `buf` (complete lines
+        starting at `self.pos`), and update the line counters
+        '''
+        arr = np.frombuffer(buf, dtype=np.uint8)
+        line_starts = np.concatenate(([0], np.flatnonzero(arr[:-1] == 10) + 1))
+
+        keep = np.ones(len(line_starts), dtype=bool)
+        keep[:self.at_skip] = False
+        self.at_skip = max(self.at_skip - len(line_starts), 0)
+
+        # lines whose first word is `At` (after the leading blanks, as
+        # `split()[0] == 'At'`): the words `At` found in the buffer, kept if
+        # only blanks are before them in their line
+        at = np.flatnonzero((arr[:-2] == ord('A')) & (arr[1:-1] == ord('t')))
+        at = at[np.isin(arr[at + 2], [9, 10, 13, 32])]
+        is_at = np.zeros(len(line_starts), dtype=bool)
+        for pos, i_line in zip(at, np.searchsorted(line_starts, at, side='right') - 1):
+            if buf[line_starts[i_line]: pos].strip(b' \t') == b'':
+                is_at[i_line] = True
+        for i_line in np.flatnonzero(is_at):
+            if keep[i_line]:
+                keep[i_line: i_line + 11] = False
+                self.at_skip = max(i_line + 11 - len(line_starts), 0)
+
+        data_starts = line_starts[keep]
+        counts = self.n_line + np.arange(len(data_starts))
+        self.n_line += len(data_starts)
+        return data_starts[counts % self.step_lines == 0].astype(np.int64) + self.pos
+
+    def _read_block(self, f, i_step):
+        '''
+        return the lines of step `i_step`, without `At` blocks
+        '''
+        st = self.starts[i_step]
+        ed = self.starts[i_step + 1] if i_step + 1 < len(self.starts) else self.pos
+        f.seek(st)
+        return _strip_at(f.read(ed - st).split(b'\n'))
+
+    def read(self, steps=None, bcs=None, typs=None):
+        '''
+        read a slice of the FFM history
+
+        paras
+        ===
+        - `steps`     a slice of steps (negative allowed), default is all
+        - `bcs`       a list of bc numbers (start from 1), default is all
+        - `typs`      a list of indexes in `typ_dict`, default is all
+
+        return
+        ===
+        array in shape (n_step, n_bc, n_typ)
+        '''
+        if steps is None:
+            steps = slice(None)
+        step_list = range(*steps.indices(self.n_step))
+        bc_list = list(range(1, self.n_bc + 1)) if bcs is None else list(bcs)
+        typ_list = list(range(self.n_var)) if typs is None else list(typs)
+
+        line_idx = [[14 + (i_bc - 1) * 23 + i_typ for i_typ in typ_list] for i_bc in bc_list]
+        data = np.zeros((len(step_list), len(bc_list), len(typ_list)))
+        with open(self.fname, 'rb') as f:
+            for i, i_step in enumerate(step_list):
+                lines = self._read_block(f, i_step)
+                for j, bc_lines in enumerate(line_idx):
+                    for k, i_line in enumerate(bc_lines):
+                        data[i, j, k] = lines[i_line].split()[2]
+        return data
+
+    def read_areas(self):
+        '''
+        the areas of each boundary in x, y, z and n direction, (n_bc, 4)
+        '''
+        areass = np.zeros((self.n_bc, 4))
+        with open(self.fname, 'rb') as f:
+            lines = self._read_block(f, 0)
+        for i_area in range(self.n_bc):
+            areass[i_area] = [float(v) for v in lines[22 + i_area * 23].split()[1:5]]
+        return areass
+
+    def save(self, fname):
+        '''
+        save the index to a .npz file, to be reused by `load`
+        '''
+        np.savez(fname, starts=self.starts, state=np.array([self.n_bc, self.n_var, self.n_line, self.at_skip, self.pos]),
+                 tail=np.frombuffer(self.tail, dtype=np.uint8))
+
+    @classmethod
+    def load(cls, fname, info1):
+        '''
+        load an index saved by `save`, for the mcfd.info1 file `info1`
+        '''
+        with np.load(fname) as d:
+            n_bc, n_var, n_line, at_skip, pos = [int(v) for v in d['state']]
+            index = cls(info1, n_bc, n_var)
+            index.starts = d['starts']
+            index.tail = d['tail'].tobytes()
+        index.n_line, index.at_skip, index.pos = n_line, at_skip, pos
+        return index
 
-}
 
 class cfdpp():
     ''' 
@@ -50,6 +364,14 @@ class cfdpp():
     ===
     - `op_dir`    operation dirctionary
     - `core_number`   core number to conduct cfd
+    - `launcher`    how to start the MPI solver, a `system.mpi_launcher` object or its name
+        - `mpiexec` (default on Windows), `mpirun` (default on other systems), `srun`, `local`
+    - `lazy`        if True, `read_flux` and `read_area` only read the steps and
+                    boundaries needed from mcfd.info1 (with `info1_index`) instead
+                    of the whole history
+    - `chdir`       change the working directory of the process to `op_dir`;
+                    False when cfdpp objects are created in threads (all paths
+                    used by the methods are joined to `op_dir`)
     - `verbose`     how to display infomation during the run
         - `All`     display all infomation
         - `Warning` only display warnings
@@ -57,25 +379,41 @@ class cfdpp():
 
     '''
 
-    def __init__(self, op_dir=None, core=1, ave_window=0, verbose='All'):
+    def __init__(self, op_dir=None, core=1, ave_window=0, verbose='All', launcher=None, lazy=False, chdir=True):
         
         self.verbose = {'All': 0, 'Warning': 1, 'None': 2}[verbose]
                 
         if op_dir is None:
             op_dir = os.getcwd()
-        self.set_path(op_dir)
+        self.set_path(op_dir, chdir=chdir)
 
         # for runing parameters
         self.core_number = core
         self.ave_window = ave_window
+        self.launcher = launcher
+        self.lazy = lazy
 
-    def set_path(self, new_path):
+    @property
+    def launcher(self):
+        '''
+        the `system.mpi_launcher` of the solver, created on first use
+        '''
+        from .system import get_launcher
+        self._launcher = get_launcher(self._launcher)
+        return self._launcher
+
+    @launcher.setter
+    def launcher(self, launcher):
+        self._launcher = launcher
+
+    def set_path(self, new_path, chdir=True):
         '''
         set work dir. to `new_path`, in which should have file mcfd.inp. The dir. is saved in `self.op_dir`, all operations with cfdpp object is conducted in this folder.
 
         paras
         ===
         `new_path`      the new direction
+        `chdir`         also change the working directory of the process to it
 
 
         '''
@@ -83,6 +421,7 @@ class cfdpp():
         self.inp_dir = os.path.join(new_path, "mcfd.inp")
         self.bak_dir = os.path.join(new_path, "mcfd.inp.bak")
         self.FFM_data = None
+        self.FFM_index = None
         self.areas = None
 
         if not os.path.exists(self.inp_dir):
@@ -92,14 +431,44 @@ class cfdpp():
         
         if self.verbose < 1: print("\ndirection changed to " + self.op_dir)
 
-        os.chdir(self.op_dir)
+        if chdir:
+            os.chdir(self.op_dir)
 
-    def metis(self):
+    def metis(self, cache=None):
         '''
         split metis and split field to `self.core_number` metis
+
+        paras
+        ===
+        - `cache`     a `partition.metis_cache` (or its folder), the partition
+                      is linked from the cache if the grid and core number are
+                      the same, otherwise it is computed and stored in the cache
+
+        return
+        ===
+        whether the partition is taken from the cache
         '''
+        from .system import cfdpp_cmd, remove_file
+        from .partition import metis_cache, partition_files
+
+        if cache is not None:
+            if not isinstance(cache, metis_cache):
+                cache = metis_cache(cache)
+            key = cache.key(self.op_dir, self.core_number)
+            if cache.get(self.op_dir, self.core_number, key=key):
+                if self.verbose < 1: print("metis partition for %d cores taken from cache" % self.core_number)
+                return True
 
-        os.system("cd %s && @tometis pmetis %d > metis.log" % (self.op_dir, self.core_number))
+        # the old files may be links to the cache, tometis should not write in them
+        for fname in partition_files(self.core_number):
+            remove_file(os.path.join(self.op_dir, fname))
+
+        cfdpp_cmd(['tometis', 'pmetis', str(self.core_number)], path=self.op_dir,
+                  tee=os.path.join(self.op_dir, 'metis.log'))
+
+        if cache is not None:
+            cache.put(self.op_dir, self.core_number, key=key)
+        return False
 
     def set_para(self, key, value, file=None):
         '''
@@ -157,51 +526,35 @@ class cfdpp():
         `value` the value of key
 
         '''
-        with open(self.inp_dir, 'r') as f:
-            for line in f.readlines(): 
-                if line.find(key) > -1:
-                    return line.split()[1]
-            
-        if self.verbose < 2: print("the key %s not found in file" % key)
-        return None
+        value = read_inp_para(self.inp_dir, key)
+        if value is None and self.verbose < 2: print("the key %s not found in file" % key)
+        return value
 
     def change_infset(self, bc_num, typ, infset_num):
         '''
-        set the `key` in mcfd.inp to given value
+        set the type of boundary `bc_num` to `typ` (in `bc_dict`) and its
+        infoset to `infset_num` in mcfd.inp, the original is saved to mcfd.inp.bak
+        '''
+        self.change_infsets({bc_num: (typ, infset_num)})
+
+    def change_infsets(self, changes):
+        '''
+        change the type and infoset of many boundaries at once
 
         paras
         ===
-        - `key`   key to be find in `file` and set
-        - `value `    value to be set
-        - `file`    the file where the value need to be set
-            - if is None, set the value in `self.inp_dir` (mcfd.inp)
+        - `changes`   a dict of bc number -> (type in `bc_dict`, infoset number),
+                      the type can be None to keep the current one
 
         '''
+        bc_table.load(self.inp_dir).assign(changes, backup=self.inp_dir + '.bak')
 
-        data = ''
-
-        f_name = self.inp_dir
-        b_name = f_name + '.bak'
-        
-        line_idx = 100000
-
-        with open(f_name, 'r') as f, open(b_name, 'w') as fbak:
-            for idx, line in enumerate(f.readlines()):
-                fbak.write(line)
-                
-                if line.find('seq# type modi info') > -1:
-                    line_idx = idx
-                
-                if idx == line_idx + bc_num:
-                    line_sp = line.split()
-                    if line_sp[0] == str(bc_num):
-                        line = '%4d %4d %4d %4d %s\n' % (bc_num, bc_dict[typ].no, int(line_sp[2]), infset_num, line_sp[4])
-                    else:
-                        raise KeyError("Can't find boundary number %d" % bc_num)
-                data += line
-
-        with open(f_name, 'w') as f:
-            f.writelines(data)
+    def read_bc_table(self):
+        '''
+        the boundary table of mcfd.inp (`cfdtools.boundary.bc_table`), cached
+        until the file changes
+        '''
+        return bc_table.load(self.inp_dir)
 
     def new_infset(self, typ, values):
         
@@ -302,7 +655,33 @@ class cfdpp():
         with open(self.inp_dir, 'w') as f:
             f.writelines(data)
 
-    def run_cfd(self, restart=False, step=1500, **kwargs):
+    def read_infset(self, inf_num):
+        '''
+        read the values of infoset `inf_num` in mcfd.inp
+
+        return
+        ===
+        `values`    a list of float, None if the infoset is not found
+
+        '''
+        with open(self.inp_dir, 'r') as f:
+            lines = f.readlines()
+
+        for idx, line in enumerate(lines):
+            split_line = line.split()
+            if split_line[:2] == ['seq.#', str(inf_num)]:
+                value_num = int(split_line[3])
+                values = []
+                for vline in lines[idx + 1:]:
+                    if len(values) >= value_num or not vline.startswith('values'):
+                        break
+                    values += [float(v) for v in vline.split()[1:]]
+                return values
+
+        if self.verbose < 2: print("infoset %d not found in file" % inf_num)
+        return None
+
+    def run_cfd(self, restart=False, step=1500, on_line=None, tee=None, **kwargs):
         '''
         run cfd
 
@@ -310,7 +689,18 @@ class cfdpp():
         ===
         `restart`   bool, whether to restart
         `step`      int, number of steps
+        `on_line`   function `on_line(line)` called with each output line of
+                    the solver (in byte) while it runs, i.e. to follow the progress
+        `tee`       a file name, the output of the solver is written in it
 
+        return
+        ===
+        the last output lines of the solver
+
+        raise
+        ===
+        `subprocess.CalledProcessError` if the solver (or the MPI launcher)
+        exits with a non-zero code, its `output` is the last output lines
         '''
 
         self.set_para("istart", int(restart))
@@ -321,14 +711,10 @@ class cfdpp():
 
         print("runing cfd with core number %d" % self.core_number)
 
-        if self.core_number > 1:
-            os.chdir(self.op_dir)
-            os.system('start /wait /min "" "C:\Program Files\MPICH2\\bin\mpiexec.exe" -localonly -np %d mpimcfd' % self.core_number)
-            
-            # cfdpp_cmd('"C:\Program Files\MPICH2\\bin\mpiexec.exe" -localonly -np %d mpimcfd' % self.core_number)
+        return self.launcher.run(self.core_number, 'mpimcfd', path=self.op_dir, on_line=on_line, tee=tee, check=True)
 
 
-    def read_FFM_history(self, n_var=8, n_step=1e10):
+    def read_FFM_history(self, n_var=8, n_step=1e10, n_proc=1):
         '''
         read the FFM history from mcfd.info1, ignore solver settiong lines
 
@@ -336,6 +722,7 @@ class cfdpp():
         ===
         `n_var`     the varibles in mcfd.info1, 8 is default and no need to change
         `n_step`    to read first `n_step`
+        `n_proc`    number of processes to parse the file, for very large files
 
         data
         ===
@@ -357,44 +744,107 @@ class cfdpp():
         >          }
         '''
 
-        with open(self.op_dir + "//mcfd.info1", 'r') as f:
-            lines = f.readlines()
+        n_bc = self.bc_number
+        if self.verbose < 1: print("Acquiring %d bcs intergal data" % (n_bc))
 
-        for idx, line in enumerate(lines):
-            if line.split()[0] == 'At':
-                # print(lines[idx: idx + 11])
-                del lines[idx: idx + 11]
+        if n_proc > 1:
+            self.FFM_data, self.areas = read_info1_parallel(os.path.join(self.op_dir, "mcfd.info1"), n_bc, n_var=n_var,
+                                                             n_step=n_step, n_proc=n_proc)
+        else:
+            self.FFM_data, self.areas = read_info1(os.path.join(self.op_dir, "mcfd.info1"), n_bc, n_var=n_var, n_step=n_step)
 
-        
-        idx = 14
-        step = 0
-        file_len = len(lines)
+    def index_FFM_history(self, save=False):
+        '''
+        build or update the step index of mcfd.info1 (`self.FFM_index`)
 
-        n_bc = self.bc_number
-        n_step = min(int((file_len) / (23 * n_bc + 1)), n_step)
-        if self.verbose < 1: print("Acquiring %d bcs intergal data for first %d steps" % (n_bc, n_step))
-
-        data = np.zeros((n_step, n_bc, n_var))
-        areass = np.zeros((n_bc, 4))
-
-        for _ in range(n_step):
-            for i_bc in range(n_bc):
-                for i_var in range(n_var):
-                    data[step, i_bc, i_var] = lines[idx].split()[2]
-                    idx += 1
-                idx += 15
-            idx += 1
-            step += 1
-        
-        for i_area in range(n_bc):
-            areas_str = lines[22 + i_area * 23].split()
-            for i_typ in range(4):
-                areass[i_area, i_typ] = float(areas_str[1 + i_typ])
+        paras
+        ===
+        `save`      save the index to mcfd.info1.idx.npz, it is loaded next time
+                    so only the new steps are scanned
+
+        return
+        ===
+        number of steps in mcfd.info1
+        '''
+        info1 = os.path.join(self.op_dir, "mcfd.info1")
+        idx_file = info1 + '.idx.npz'
+        if self.FFM_index is None:
+            if os.path.exists(idx_file):
+                self.FFM_index = info1_index.load(idx_file, info1)
+                if self.FFM_index.n_bc != self.bc_number:
+                    self.FFM_index = None
+            if self.FFM_index is None:
+                self.FFM_index = info1_index(info1, self.bc_number)
+        n_step = self.FFM_index.update()
+        if save:
+            self.FFM_index.save(idx_file)
+        return n_step
+
+    def read_FFM_slice(self, steps=None, bcs=None, typs=None):
+        '''
+        read a slice of the FFM history, only parse the steps asked
+
+        paras
+        ===
+        - `steps`     a slice of steps, i.e. `slice(-200, None)` for the last 200 steps
+        - `bcs`       a list of bc numbers (same with cfd++), default is all
+        - `typs`      a list of types in `typ_dict`, i.e. ['fx', 'fy'], default is all
+
+        return
+        ===
+        array in shape (n_step, n_bc, n_typ)
+        '''
+        self.index_FFM_history()
+        if typs is not None:
+            typs = [typ_dict[typ] for typ in typs]
+        return self.FFM_index.read(steps=steps, bcs=bcs, typs=typs)
+
+    def share_FFM(self, backend='shm', path=None):
+        '''
+        publish `self.FFM_data` and `self.areas` to shared memory, so the
+        workers of a process pool can use them without parsing or copying
+
+        paras
+        ===
+        - `backend`   `shm` for `multiprocessing.shared_memory`, `mmap` for
+                      memory-mapped .npy files
+        - `path`      folder of the .npy files of `mmap` backend, default is `self.op_dir`
+
+        return
+        ===
+        `share`   a small dict of `shared.shared_array` descriptors, to be given
+                  to `attach_FFM` in the workers. Call `release_FFM(share)` in
+                  this process when the workers are done.
+
+        '''
+        from .shared import shared_array
 
+        if self.FFM_data is None:
+            self.read_FFM_history()
 
-        self.FFM_data = data
-        self.areas = areass
-        # return data, areass    
+        if path is None:
+            path = self.op_dir
+        share = {'op_dir': self.op_dir, 'bc_number': self.bc_number}
+        for key in ['FFM_data', 'areas']:
+            share[key] = shared_array.publish(getattr(self, key), backend=backend, path=os.path.join(path, key + '.npy'))
+        return share
+
+    def attach_FFM(self, share):
+        '''
+        use the FFM data published by `share_FFM` as `self.FFM_data` and
+        `self.areas` (read-only, no copy)
+        '''
+        self.bc_number = share['bc_number']
+        self.FFM_data = share['FFM_data'].attach()
+        self.areas = share['areas'].attach()
+
+    @staticmethod
+    def release_FFM(share):
+        '''
+        free the shared memory of `share`
+        '''
+        for key in ['FFM_data', 'areas']:
+            share[key].unlink()
 
     def read_flux(self, typ, bc_series, ave_window=-1, move_axis=None):
         '''
@@ -421,9 +871,6 @@ class cfdpp():
         flux        float
 
         '''
-        if self.FFM_data is None:
-            self.read_FFM_history()
-        
         int_typ = typ_dict[typ]
         
         eps = 1e-3
@@ -436,24 +883,35 @@ class cfdpp():
         if _ave > 0:
             if self.verbose < 1:print("result averaged by %d steps" % (_ave))
 
+        if self.FFM_data is None and self.lazy:
+            # only read the steps used by the average and convergence check
+            FFM = self.read_FFM_slice(steps=slice(-max(_ave, 5), None), bcs=bc_series)
+            bc_idx = {i_bc: i for i, i_bc in enumerate(bc_series)}
+        else:
+            if self.FFM_data is None:
+                self.read_FFM_history()
+            FFM = self.FFM_data
+            bc_idx = {i_bc: i_bc - 1 for i_bc in bc_series}
+
         for i_bc in bc_series:
             # print("reading bc No. %d, type %s" % (i_bc,typ))
+            i_col = bc_idx[i_bc]
 
-            flux_i = self.FFM_data[-1, i_bc-1, int_typ] 
-            if abs(flux_i - self.FFM_data[-5, i_bc-1, int_typ]) / flux_i > eps:
+            flux_i = FFM[-1, i_col, int_typ] 
+            if abs(flux_i - FFM[-5, i_col, int_typ]) / flux_i > eps:
                 if self.verbose < 2:print("bc No. %d, type %s not converge" % (i_bc,typ))
             if _ave > 0:
-                flux_i = sum([stepData[i_bc-1, int_typ] for stepData in self.FFM_data[-_ave:]]) / _ave
+                flux_i = sum([stepData[i_col, int_typ] for stepData in FFM[-_ave:]]) / _ave
 
             if move_axis is not None:
                 if typ == 'mz':
                     if self.verbose < 1:print("move axis")
-                    flux_i -= sum([stepData[i_bc-1, 3] for stepData in self.FFM_data[-_ave:]]) / _ave * move_axis[0]
-                    flux_i += sum([stepData[i_bc-1, 2] for stepData in self.FFM_data[-_ave:]]) / _ave * move_axis[1]
+                    flux_i -= sum([stepData[i_col, 3] for stepData in FFM[-_ave:]]) / _ave * move_axis[0]
+                    flux_i += sum([stepData[i_col, 2] for stepData in FFM[-_ave:]]) / _ave * move_axis[1]
                 elif typ == 'my':
                     if self.verbose < 1:print("move axis from point (x=%.3f, z=%.3f)" % (move_axis[0], move_axis[2]))
-                    flux_i += sum([stepData[i_bc-1, 4] for stepData in self.FFM_data[-_ave:]]) / _ave * move_axis[0]
-                    flux_i -= sum([stepData[i_bc-1, 2] for stepData in self.FFM_data[-_ave:]]) / _ave * move_axis[2]
+                    flux_i += sum([stepData[i_col, 4] for stepData in FFM[-_ave:]]) / _ave * move_axis[0]
+                    flux_i -= sum([stepData[i_col, 2] for stepData in FFM[-_ave:]]) / _ave * move_axis[2]
                 else:
                     raise Exception('axis not set')
 
@@ -462,6 +920,35 @@ class cfdpp():
         
         return flux
 
+    def flux_stats(self, typ, bc_series, stats=None, st=0):
+        '''
+        running statistics of the flux history of given type, summed for given
+        bc_series, without the average of cfd++
+
+        paras
+        ===
+        - `typ`, `bc_series`  same as `read_flux`
+        - `stats`     the `running_stats` of a previous call, only the steps
+                      from its `next_step` are added (`st` is then ignored)
+        - `st`        the first step of the statistics
+
+        return
+        ===
+        a `stats.running_stats`: `mean`, `std()`, `min`, `max`, `n`
+        '''
+        from .stats import running_stats
+
+        if stats is None:
+            stats = running_stats()
+        n_step = self.index_FFM_history()
+        # a `running_stats` not made here continues after its samples, from `st`
+        first = stats.next_step if stats.next_step is not None else st + stats.n
+        if first < n_step:
+            data = self.FFM_index.read(steps=slice(first, None), bcs=bc_series, typs=[typ_dict[typ]])
+            stats.update_batch(data.sum(axis=1)[:, 0])
+        stats.next_step = max(first, n_step)
+        return stats
+
     def read_area(self, typ, bc_series):
         '''
         read areas or its projection on axis, for given bc indexs
@@ -476,7 +963,11 @@ class cfdpp():
 
         '''
         if self.areas is None:
-            self.read_FFM_history()
+            if self.lazy:
+                self.index_FFM_history()
+                self.areas = self.FFM_index.read_areas()
+            else:
+                self.read_FFM_history()
 
         if typ == 'x':
             int_typ = 0
@@ -491,28 +982,71 @@ class cfdpp():
 
         return area       
 
-    def extract_bc(self, bc_series, forcenew, remove=True, is_sort=None):
-        data = {'varnames': None, 'lines': []}
+    def extract_bc_files(self, bc_series, forcenew, remove=True):
+        '''
+        extract boundaries `bc_series` with exbc2do1 (if not yet, or `forcenew`)
+
+        return
+        ===
+        a list of the BC%d.dat files
+        '''
+        from .system import cfdpp_cmd, remove_file
+
+        files = []
         for i in bc_series:
-            if forcenew or not os.path.exists(os.path.join(self.op_dir, "BC%d.dat" % i)):
-                cfdpp_cmd("exbc2do1 exbcsin.bin pltosout.bin %d" % i)
+            fname = os.path.join(self.op_dir, "BC%d.dat" % i)
+            if forcenew or not os.path.exists(fname):
+                cfdpp_cmd(['exbc2do1', 'exbcsin.bin', 'pltosout.bin', str(i)], path=self.op_dir)
                 if remove:
-                    os.system('del ' + os.path.join(self.op_dir, "BC%d.mpf1d" % i))
-                    os.system('del ' + os.path.join(self.op_dir, "BC%d.txt" % i))
-            if not os.path.exists("BC%d.dat" % i):
+                    remove_file(os.path.join(self.op_dir, "BC%d.mpf1d" % i))
+                    remove_file(os.path.join(self.op_dir, "BC%d.txt" % i))
+            if not os.path.exists(fname):
                 raise IOError("    [Warning] BC%d not extract" %i)
-            
-            data_tmp = tec2py(os.path.join(self.op_dir, "BC%d.dat" % i), is_sort=is_sort)
+            files.append(fname)
+
+        return files
+
+    def extract_bc(self, bc_series, forcenew, remove=True, is_sort=None, merge=False, dedupe=None, dtype=np.float64):
+        '''
+        extract the boundaries `bc_series`, read them in the tecplot format
+
+        paras
+        ===
+        - `is_sort`   a variable name, the zones are sorted by it
+        - `merge`     merge the line zones of all boundaries into one, sorted by `is_sort`
+        - `dedupe`    with `merge`, a list of variable names (i.e. ['X', 'Y', 'Z']),
+                      the points shared by adjacent boundaries are kept once
+        - `dtype`     dtype of the arrays, `np.float32` halves the memory
+
+        the 2D boundaries (FE or IJK zones) are in `surfaces`, they are not
+        merged
+        '''
+        from .tecplot import tec2py, merge_lines
+
+        data = {'varnames': None, 'lines': [], 'surfaces': []}
+        for fname in self.extract_bc_files(bc_series, forcenew, remove):
+            data_tmp = tec2py(fname, info=self.verbose < 1, is_sort=is_sort, dtype=dtype)
             if data['varnames'] is None:
                 data['varnames'] = data_tmp['varnames']
             data['lines'] += data_tmp['lines']
-        
+            data['surfaces'] += data_tmp['surfaces']
+
+        if merge:
+            data = merge_lines(data, is_sort=is_sort, dedupe=dedupe)
         return data
 
-    
-    def extract_line(self, st, ed, forcenew, remove=True, var='P T U V W R M'):
+    def extract_line_file(self, st, ed, forcenew, remove=True, var='P T U V W R M'):
+        '''
+        extract the line from `st` to `ed` with npf2lin1 (if not yet, or `forcenew`)
+
+        return
+        ===
+        the lineoutput_1.tec file
+        '''
+        from .system import cfdpp_cmd, remove_file
 
-        if forcenew or not os.path.exists(os.path.join(self.op_dir, "lineoutput_1.tec")):
+        fname = os.path.join(self.op_dir, "lineoutput_1.tec")
+        if forcenew or not os.path.exists(fname):
             with open(os.path.join(self.op_dir, "linelist.inp"), 'w') as f:
                 
                 f.write('1\n')
@@ -520,15 +1054,24 @@ class cfdpp():
                 f.write('%.5f %.5f %.5f  ' % st)
                 f.write('%.5f %.5f %.5f\n' % ed)
 
-            cfdpp_cmd("npf2lin1 0 linelist.inp lineoutput pltosout.bin " + var)
+            cfdpp_cmd(['npf2lin1', '0', 'linelist.inp', 'lineoutput', 'pltosout.bin'] + var.split(), path=self.op_dir)
             if remove:
-                os.system('del ' + os.path.join(self.op_dir, "lineoutput_1.mpf1d"))
-                os.system('del ' + os.path.join(self.op_dir, "lineoutput_1.txt"))
+                remove_file(os.path.join(self.op_dir, "lineoutput_1.mpf1d"))
+                remove_file(os.path.join(self.op_dir, "lineoutput_1.txt"))
 
-        if not os.path.exists(os.path.join(self.op_dir, "lineoutput_1.tec")):
+        if not os.path.exists(fname):
             raise IOError("    [Warning] line not extract")
 
-        data = tec2py(os.path.join(self.op_dir, "lineoutput_1.tec"), info=False)
+        return fname
+
+    def extract_line(self, st, ed, forcenew, remove=True, var='P T U V W R M', dtype=np.float64):
+        '''
+        extract the line from `st` to `ed`, read it in the tecplot format, the
+        arrays in `dtype`
+        '''
+        from .tecplot import tec2py
+
+        data = tec2py(self.extract_line_file(st, ed, forcenew, remove, var), info=False, dtype=dtype)
 
         return data
 
@@ -543,13 +1086,18 @@ class cfdpp():
             self.set_para('cdepsave_ntsave' , 0)
 
     def output_avg_field(self):
-        print(os.getcwd())
+        '''
+        replace the solution cdepsout.bin by the averaged field cdaveout.bin
+        (the old one is kept as cdepsout.bin.bak), and run 0 step to output it
+        '''
+        from .system import move_file, replace_file
+
         if not os.path.exists(os.path.join(self.op_dir, "cdaveout.bin")):
             raise IOError("    [Warning] cdaveout.bin not exists\n Please output average file during runing")
-        time.sleep(1)
-        os.system('move ' + self.op_dir + "\\cdepsout.bin cdepsout.bin.bak")
-        os.system('move ' + self.op_dir + "\\cdaveout.bin cdepsout.bin")
+        # cdepsout.bin is swapped in one rename, it is never missing or half written
+        replace_file(os.path.join(self.op_dir, "cdaveout.bin"), os.path.join(self.op_dir, "cdepsout.bin"),
+                     backup=os.path.join(self.op_dir, "cdepsout.bin.bak"))
         if os.path.exists(os.path.join(self.op_dir, "mcfd_tec.bin")):
-            os.system('move ' + self.op_dir + "\\mcfd_tec.bin mcfd_tec.last.bin")
+            move_file(os.path.join(self.op_dir, "mcfd_tec.bin"), os.path.join(self.op_dir, "mcfd_tec.last.bin"))
         self.run_cfd(restart=True, step=0)
 
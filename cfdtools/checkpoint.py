@@ -0,0 +1,254 @@
+'''
+cfdtools.checkpoint
+
+run a long cfd++ case in segments, with checkpoints to resume from
+
+the run is split into segments of `segment` steps. After each segment the
+restart files (cdepsout.bin, and the averaged field cdaveout.bin if written)
+are copied into a new generation `checkpoints/gen_####`, with their sha256, the
+total step and the size of mcfd.info1. The generations are listed in
+`checkpoints/manifest.json`, which is replaced atomically.
+
+a segment is good if mcfd.info1 gained `segment` steps and cdepsout.bin is
+rewritten. If not (crash, node failure, preemption), the latest generation
+whose checksums are right is copied back, mcfd.info1 is truncated to the size
+it had then, and the segment is run again. `run` called again after the
+python process itself is killed resumes from the manifest the same way.
+
+usage
+===
+
+>>> op = cfdpp('case', core=32)
+>>> rm = run_manager(op, segment=500, keep=2)
+>>> rm.run(20000, cfllbg=0.1)        # total steps of the case, resumed if stopped
+
+'''
+
+import os
+import json
+import time
+import shutil
+import subprocess
+
+from .cfdpp import info1_index
+from .system import file_digest
+
+RESTART_FILES = ['cdepsout.bin', 'cdaveout.bin']
+
+
+class run_manager():
+    '''
+    segmented run of a `cfdpp` case with checkpoints
+
+    paras
+    ===
+    - `op`            a `cfdpp` object
+    - `segment`       number of steps of a segment
+    - `keep`          number of generations kept
+    - `max_retries`   number of times a failed segment is run again before an
+                      `RuntimeError` is raised
+    - `files`         the restart files saved in a generation (if exist)
+    - `ckpt_dir`      the folder of the generations, default is `checkpoints` in the case
+
+    '''
+
+    def __init__(self, op, segment=500, keep=2, max_retries=2, files=RESTART_FILES, ckpt_dir=None):
+        self.op = op
+        self.segment = segment
+        self.keep = max(keep, 1)
+        self.max_retries = max_retries
+        self.files = list(files)
+        self.ckpt_dir = ckpt_dir if ckpt_dir is not None else os.path.join(op.op_dir, 'checkpoints')
+        self.manifest = os.path.join(self.ckpt_dir, 'manifest.json')
+        self.info1 = os.path.join(op.op_dir, 'mcfd.info1')
+        self.generations = self._load()
+
+    # ============================== manifest ==============================
+
+    def _load(self):
+        if not os.path.exists(self.manifest):
+            return []
+        with open(self.manifest, 'r') as f:
+            return json.load(f)['generations']
+
+    def _save(self):
+        os.makedirs(self.ckpt_dir, exist_ok=True)
+        tmp = self.manifest + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'generations': self.generations}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest)
+
+    def _gen_dir(self, gen):
+        return os.path.join(self.ckpt_dir, 'gen_%04d' % gen['gen'])
+
+    @property
+    def step(self):
+        '''
+        total step of the latest generation, 0 if none
+        '''
+        return self.generations[-1]['step'] if len(self.generations) > 0 else 0
+
+    def _info1_steps(self):
+        if not os.path.exists(self.info1):
+            return 0
+        return info1_index(self.info1, self.op.bc_number).update()
+
+    # ============================== generations ==============================
+
+    def checkpoint(self, step):
+        '''
+        save the restart files of the case as a new generation at total step `step`
+        '''
+        gen = {'gen': self.generations[-1]['gen'] + 1 if len(self.generations) > 0 else 1,
+               'step': step, 'time': time.time(), 'files': {},
+               'info1_size': os.path.getsize(self.info1) if os.path.exists(self.info1) else 0,
+               'info1_steps': self._info1_steps()}
+        gen_dir = self._gen_dir(gen)
+        if os.path.exists(gen_dir):
+            shutil.rmtree(gen_dir)
+        os.makedirs(gen_dir)
+
+        for fname in self.files:
+            src = os.path.join(self.op.op_dir, fname)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(gen_dir, fname))
+                gen['files'][fname] = {'size': os.path.getsize(src), 'sha256': file_digest(src)}
+
+        self.generations.append(gen)
+        # the manifest is written after the files, a generation listed is complete
+        self._save()
+
+        for old in self.generations[:-self.keep]:
+            shutil.rmtree(self._gen_dir(old), ignore_errors=True)
+        self.generations = self.generations[-self.keep:]
+        self._save()
+
+        if self.op.verbose < 1: print("checkpoint %d at step %d" % (gen['gen'], step))
+        return gen
+
+    def verify(self, gen, in_case=False):
+        '''
+        check the sha256 of the files of generation `gen`, in its folder, or
+        in the case folder if `in_case`
+        '''
+        path = self.op.op_dir if in_case else self._gen_dir(gen)
+        for fname, info in gen['files'].items():
+            fpath = os.path.join(path, fname)
+            if not os.path.exists(fpath) or os.path.getsize(fpath) != info['size']:
+                return False
+            if file_digest(fpath) != info['sha256']:
+                return False
+        return True
+
+    def restore(self):
+        '''
+        copy back the latest good generation into the case, truncate mcfd.info1
+        to its size, and drop the generations after it
+
+        return
+        ===
+        the generation restored, None if there is no good generation (the
+        case is to be started from the beginning)
+        '''
+        while len(self.generations) > 0:
+            gen = self.generations[-1]
+            if self.verify(gen):
+                break
+            if self.op.verbose < 2: print("    [Warning] checkpoint %d is corrupted, dropped" % gen['gen'])
+            shutil.rmtree(self._gen_dir(gen), ignore_errors=True)
+            self.generations.pop()
+            self._save()
+        else:
+            return None
+
+        for fname in self.files:
+            dst = os.path.join(self.op.op_dir, fname)
+            if fname in gen['files']:
+                tmp = dst + '.restore'
+                shutil.copy2(os.path.join(self._gen_dir(gen), fname), tmp)
+                os.replace(tmp, dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
+
+        if os.path.exists(self.info1) and os.path.getsize(self.info1) > gen['info1_size']:
+            with open(self.info1, 'r+b') as f:
+                f.truncate(gen['info1_size'])
+        self.op.FFM_data = None
+        self.op.FFM_index = None
+
+        if self.op.verbose < 2: print("restored checkpoint %d at step %d" % (gen['gen'], gen['step']))
+        return gen
+
+    def resume(self):
+        '''
+        bring the case back to the latest good generation if it is not in
+        that state (the files are checked against the manifest)
+
+        return
+        ===
+        the total step to continue from
+        '''
+        if len(self.generations) == 0:
+            return 0
+        gen = self.generations[-1]
+        info1_size = os.path.getsize(self.info1) if os.path.exists(self.info1) else -1
+        if info1_size != gen['info1_size'] or not self.verify(gen, in_case=True):
+            gen = self.restore()
+        return 0 if gen is None else gen['step']
+
+    # ============================== run ==============================
+
+    def run_segment(self, step, n_step, **kwargs):
+        '''
+        run `n_step` steps from total step `step`, return whether it is good
+        '''
+        restart = step > 0
+        eps = os.path.join(self.op.op_dir, 'cdepsout.bin')
+        eps_mtime = os.stat(eps).st_mtime_ns if restart and os.path.exists(eps) else None
+        n_before = self._info1_steps() if restart else 0
+
+        try:
+            self.op.run_cfd(restart=restart, step=n_step, **kwargs)
+        except subprocess.CalledProcessError as e:
+            if self.op.verbose < 2: print("    [Warning] solver exited with code %d" % e.returncode)
+            return False
+
+        if not os.path.exists(eps) or os.stat(eps).st_mtime_ns == eps_mtime:
+            return False
+        return self._info1_steps() - n_before == n_step
+
+    def run(self, total_step, **kwargs):
+        '''
+        run the case until total step `total_step`, resumed from the latest
+        good checkpoint
+
+        paras
+        ===
+        - `total_step`    total step of the case (from the first run)
+        - `kwargs`        other parameters in mcfd.inp, given to `cfdpp.run_cfd`
+
+        return
+        ===
+        the total step reached
+        '''
+        step = self.resume()
+        retries = 0
+        while step < total_step:
+            n_step = min(self.segment, total_step - step)
+            if self.run_segment(step, n_step, **kwargs):
+                step += n_step
+                self.checkpoint(step)
+                retries = 0
+                continue
+
+            retries += 1
+            if self.op.verbose < 2: print("    [Warning] segment from step %d failed (%d/%d)" % (step, retries, self.max_retries))
+            if retries > self.max_retries:
+                self.resume()
+                raise RuntimeError('segment from step %d failed %d times' % (step, retries))
+            gen = self.restore()
+            step = 0 if gen is None else gen['step']
+
+        return step
@@ -0,0 +1,579 @@
+'''
+cfdtools.cli
+
+the command line tool `cfdtools`, to post-process all the cases of a sweep in
+one command
+
+    cfdtools flux 'sweep/ma*' --flux fx:3,4 --flux lift=fy:3-6 --ave 200 -j 8 -o forces.csv
+    cfdtools extract 'sweep/ma*' --bc wall=3,4 --sort X --merge --pattern '{dir}/{label}.npz' -j 4
+    cfdtools extract 'sweep/ma*' --line exit=0,0,0:0,1,0 --pattern 'lines/{case}_{label}.dat'
+    cfdtools convert BC3.dat BC4.dat --to npz --dtype float32 --compress zlib
+    cfdtools set 'sweep/ma*' --para ntstep=2000 --infset 3=backpressure:4 --output-avg 200
+    cfdtools monitor 'sweep/*' --flux fx:3,4 --window 5 --expect 2000 --every 60
+    cfdtools watch sweep --flux fx:3,4 --bc wall=3,4 --pattern '{dir}/{label}.npz' -o forces.csv -j 4
+
+the case folders (with mcfd.inp) are given as paths or glob patterns; a quoted
+pattern is expanded by the tool, so a sweep of thousands of cases does not hit
+the limit of the command line. The cases are processed by `-j` processes.
+
+the tables (a row per case) are written as CSV (default, to stdout), JSON or
+NPZ (a column per array), by the extension of `-o` or by `--format`. A case
+failing is reported in the `error` column and the exit code is 1.
+
+the extracted data are written as tecplot ASCII (`.dat`, `.tec`) or binary
+`.npz` (`tecplot.py2npz`) by the extension of `--pattern`, in which `{case}`,
+`{dir}` and `{label}` are the name and the folder of the case, and the label
+of the data.
+
+'''
+
+import os
+import sys
+import glob
+import argparse
+
+TABLE_FORMATS = ['csv', 'json', 'npz']
+
+# compression of the .npz files of tecplot data, same as `tecplot.NPZ_COMPRESS`
+NPZ_COMPRESS = [None, 'zip', 'zlib', 'zstd', 'blosc']
+
+
+# ============================== arguments ==============================
+
+def expand_cases(patterns):
+    '''
+    the case folders of the paths or glob patterns, in order and without
+    duplicates; the folders matched by a pattern without mcfd.inp are skipped
+    '''
+    cases = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = [d for d in sorted(glob.glob(pattern)) if os.path.isfile(os.path.join(d, 'mcfd.inp'))]
+        elif os.path.isfile(os.path.join(pattern, 'mcfd.inp')):
+            matches = [pattern]
+        else:
+            raise ValueError('%s is not a case folder (no mcfd.inp)' % pattern)
+        for d in matches:
+            d = os.path.abspath(d)
+            if d not in cases:
+                cases.append(d)
+    return cases
+
+
+def parse_bcs(text):
+    '''
+    bc numbers of `3,4,6-8`
+    '''
+    bcs = []
+    for item in text.split(','):
+        if '-' in item.strip('-'):
+            st, ed = item.split('-')
+            bcs += list(range(int(st), int(ed) + 1))
+        else:
+            bcs.append(int(item))
+    return bcs
+
+
+def parse_label(text, default=None):
+    '''
+    (label, value) of `label=value`, the label is `default` if not given
+    '''
+    if '=' in text:
+        label, text = text.split('=', 1)
+        return label, text
+    return default, text
+
+
+def parse_flux(text, typs):
+    '''
+    (label, typ, bcs) of `[label=]typ:bcs`, i.e. `lift=fy:3,4`, the label is
+    `typ` if not given
+    '''
+    label, text = parse_label(text)
+    if ':' not in text:
+        raise ValueError('%s is not in the form [label=]typ:bcs' % text)
+    typ, bcs = text.split(':', 1)
+    if typ not in typs:
+        raise ValueError('type %s not in %s' % (typ, ', '.join(typs)))
+    return (label if label is not None else typ), typ, parse_bcs(bcs)
+
+
+def parse_point(text):
+    return tuple([float(v) for v in text.split(',')])
+
+
+def _unique_labels(items, option):
+    labels = [item[0] for item in items]
+    for label in labels:
+        if labels.count(label) > 1:
+            raise ValueError('%s: label %s given twice, use label=...' % (option, label))
+    return items
+
+
+# ============================== output ==============================
+
+def _column(values):
+    import numpy as np
+
+    if all([v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values]):
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+    return np.array(['' if v is None else str(v) for v in values])
+
+
+def write_table(rows, fname=None, fmt=None):
+    '''
+    write the rows (a list of dicts) as CSV, JSON or NPZ, to the file `fname`
+    or to stdout (CSV and JSON); the format is `fmt` or by the extension of `fname`
+    '''
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+    if fmt is None:
+        fmt = os.path.splitext(fname)[1][1:].lower() if fname is not None else 'csv'
+    if fmt not in TABLE_FORMATS:
+        raise ValueError('table format %s not in %s' % (fmt, ', '.join(TABLE_FORMATS)))
+
+    if fmt == 'npz':
+        import numpy as np
+        if fname is None:
+            raise ValueError('an output file is needed for npz')
+        np.savez(fname, **{key: _column([row.get(key) for row in rows]) for key in columns})
+        return
+
+    fid = open(fname, 'w', newline='') if fname is not None else sys.stdout
+    try:
+        if fmt == 'json':
+            import json
+            json.dump([{key: row.get(key) for key in columns} for row in rows], fid, indent=1)
+            fid.write('\n')
+        else:
+            import csv
+            writer = csv.DictWriter(fid, columns, restval='', lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if fname is not None:
+            fid.close()
+        else:
+            fid.flush()
+
+
+def write_tdata(tdata, fname, dtype=None, compress=None):
+    '''
+    write tecplot data (the format of `tec2py`) as tecplot ASCII, or as .npz
+    by the extension of `fname` (with `dtype` and `compress` of `tecplot.py2npz`)
+    '''
+    from .tecplot import tec_writer, py2npz
+
+    dirname = os.path.dirname(fname)
+    if dirname != '':
+        os.makedirs(dirname, exist_ok=True)
+    if fname.endswith('.npz'):
+        py2npz(tdata, fname, dtype=dtype, compress=compress)
+        return
+    with tec_writer(fname, tdata['varnames'], title=tdata.get('title')) as tw:
+        for zone in tdata.get('lines', []) + tdata.get('surfaces', []):
+            tw.write_zone(**{key: zone[key] for key in ['data', 'zonename', 'zonetype', 'datapacking', 'varloc',
+                                                        'elements', 'solutiontime', 'strandid', 'size'] if key in zone})
+
+
+def read_tdata(fname, dtype='float64'):
+    '''
+    read tecplot data from tecplot ASCII (into arrays of `dtype`), or from
+    .npz by the extension of `fname`
+    '''
+    from .tecplot import tec2py, npz2py
+
+    if fname.endswith('.npz'):
+        return npz2py(fname)
+    return tec2py(fname, info=False, dtype=dtype)
+
+
+def _n_point(tdata):
+    return sum([len(zone['data'][0]) if len(zone['data']) > 0 else 0 for zone in tdata.get('lines', [])]) + \
+           sum([zone['data'][0].size if len(zone['data']) > 0 else 0 for zone in tdata.get('surfaces', [])])
+
+
+# ============================== the cases ==============================
+
+def _run_cases(func, cases, jobs=1, key='case'):
+    '''
+    `func(case)` of every case, by `jobs` processes; the rows in the order of
+    the cases, a failing case gives a row with its `error`
+    '''
+    if jobs > 1 and len(cases) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(cases))) as pool:
+            return list(pool.map(_guarded, [func] * len(cases), cases, [key] * len(cases)))
+    return [_guarded(func, case, key) for case in cases]
+
+
+def _guarded(func, case, key='case'):
+    # cfdpp changes the working folder to the case, it is set back for the next one
+    cwd = os.getcwd()
+    try:
+        return func(case)
+    except Exception as e:
+        return {key: os.path.basename(case) if key == 'case' else case, 'error': '%s: %s' % (type(e).__name__, e)}
+    finally:
+        os.chdir(cwd)
+
+
+def _open_case(case_dir, **kwargs):
+    from .cfdpp import cfdpp
+    return cfdpp(case_dir, verbose='None', **kwargs)
+
+
+def flux_case(case_dir, fluxes=(), areas=(), ave_window=0):
+    '''
+    a row of the fluxes and areas of a case, `fluxes` and `areas` are lists
+    of (label, typ, bcs)
+    '''
+    op = _open_case(case_dir, ave_window=ave_window, lazy=True)
+    row = {'case': os.path.basename(case_dir), 'n_step': op.index_FFM_history()}
+    if row['n_step'] == 0:
+        raise IOError('no step in mcfd.info1')
+    for label, typ, bcs in fluxes:
+        row[label] = float(op.read_flux(typ, bcs))
+    for label, typ, bcs in areas:
+        row[label] = float(op.read_area(typ, bcs))
+    return row
+
+
+def extract_case(case_dir, output, bcs=(), lines=(), var='P T U V W R M', is_sort=None, merge=False,
+                 dedupe=None, forcenew=False, dtype='float64', compress=None):
+    '''
+    extract the boundaries `bcs` (a list of (label, bc numbers)) and the lines
+    `lines` (a list of (label, st, ed)) of a case into the files `output`
+    (formatted with `case`, `dir`, `label`), read in `dtype`; a row per case,
+    the number of points of each label
+    '''
+    op = _open_case(case_dir)
+    name = os.path.basename(case_dir)
+    row = {'case': name}
+    for label, bc_series in bcs:
+        tdata = op.extract_bc(bc_series, forcenew, is_sort=is_sort, merge=merge, dedupe=dedupe, dtype=dtype)
+        write_tdata(tdata, output.format(case=name, dir=case_dir, label=label), compress=compress)
+        row[label] = _n_point(tdata)
+    for label, st, ed in lines:
+        # every line is written to lineoutput_1.tec, it is extracted again for each label
+        tdata = op.extract_line(st, ed, forcenew or len(lines) > 1, var=var, dtype=dtype)
+        write_tdata(tdata, output.format(case=name, dir=case_dir, label=label), compress=compress)
+        row[label] = _n_point(tdata)
+    return row
+
+
+def convert_file(fname, to='npz', outdir=None, dtype=None, compress=None):
+    '''
+    convert a tecplot file between ASCII and .npz (with `dtype` and `compress`
+    of `tecplot.py2npz`); a row of the sizes
+    '''
+    base = os.path.splitext(os.path.basename(fname))[0]
+    out = os.path.join(outdir if outdir is not None else os.path.dirname(fname), base + '.' + to)
+    if os.path.abspath(out) == os.path.abspath(fname):
+        raise ValueError('%s is already in %s' % (fname, to))
+    tdata = read_tdata(fname, dtype=dtype if dtype is not None else 'float64')
+    write_tdata(tdata, out, dtype=dtype, compress=compress)
+    return {'file': fname, 'output': out, 'n_point': _n_point(tdata),
+            'size_in': os.path.getsize(fname), 'size_out': os.path.getsize(out)}
+
+
+def set_case(case_dir, paras=(), infsets=None, output_avg=None):
+    '''
+    set the parameters `paras` (a list of (key, value)), the boundaries
+    `infsets` (`cfdpp.change_infsets`) and the average output of a case; a row
+    of the values read back
+    '''
+    op = _open_case(case_dir)
+    row = {'case': os.path.basename(case_dir)}
+    for key, value in paras:
+        if op.read_para(key) is None:
+            raise KeyError('%s not in mcfd.inp' % key)
+        op.set_para(key, value)
+        row[key] = op.read_para(key)
+    if infsets:
+        op.change_infsets(infsets)
+        table = op.read_bc_table()
+        for bc_num in infsets:
+            row['bc%d' % bc_num] = '%s:%d' % (table.typ_name(bc_num), table[bc_num].infset)
+    if output_avg is not None:
+        op.set_output_avg(output_avg)
+        row['cdepsave_ntsave'] = op.read_para('cdepsave_ntsave')
+    return row
+
+
+def monitor_case(case_dir, fluxes=(), window=5, expect=None, tol=1e-3, save_index=False):
+    '''
+    a row of the progress of a case: number of steps, age of mcfd.info1, the
+    last value and relative change over `window` steps of the `fluxes`, and
+    its status (`missing`, `incomplete`, `converged` or `not converged`)
+    '''
+    import time
+    from .catalog import convergence
+
+    op = _open_case(case_dir)
+    row = {'case': os.path.basename(case_dir)}
+    info1 = os.path.join(case_dir, 'mcfd.info1')
+    if not os.path.exists(info1):
+        row.update({'n_step': 0, 'status': 'missing'})
+        return row
+
+    row['n_step'] = op.index_FFM_history(save=save_index)
+    row['age'] = round(time.time() - os.path.getmtime(info1), 1)
+    metrics = convergence(op, {label: (typ, bcs) for label, typ, bcs in fluxes}, window) if row['n_step'] > 0 else {}
+    for label, _, _ in fluxes:
+        if label in metrics:
+            row[label] = metrics[label]['value']
+            row[label + '_change'] = metrics[label]['rel_change']
+
+    if row['n_step'] == 0 or (expect is not None and row['n_step'] < expect):
+        row['status'] = 'incomplete'
+    elif all([m['rel_change'] < tol for m in metrics.values()]):
+        row['status'] = 'converged'
+    else:
+        row['status'] = 'not converged'
+    return row
+
+
+# ============================== commands ==============================
+
+def _report(rows, args):
+    write_table(rows, args.output, args.format)
+    failed = [row for row in rows if row.get('error') is not None]
+    for row in failed:
+        print('%s: %s' % (row.get('case', row.get('file')), row['error']), file=sys.stderr)
+    return 1 if len(failed) > 0 else 0
+
+
+def cmd_flux(args):
+    from functools import partial
+    from .cfdpp import typ_dict
+
+    fluxes = _unique_labels([parse_flux(f, list(typ_dict)) for f in args.flux], '--flux')
+    areas = _unique_labels([parse_flux(a, ['x', 'y', 'z']) for a in args.area], '--area')
+    if len(fluxes) + len(areas) == 0:
+        raise ValueError('no --flux or --area given')
+    areas = [('area_' + label if label in ['x', 'y', 'z'] else label, typ, bcs) for label, typ, bcs in areas]
+    func = partial(flux_case, fluxes=fluxes, areas=areas, ave_window=args.ave)
+    return _report(_run_cases(func, expand_cases(args.cases), args.jobs), args)
+
+
+def cmd_extract(args):
+    from functools import partial
+
+    bcs = _unique_labels([parse_label(b, 'bc') for b in args.bc], '--bc')
+    bcs = [(label, parse_bcs(text)) for label, text in bcs]
+    lines = []
+    for text in args.line:
+        label, text = parse_label(text, 'line')
+        st, ed = text.split(':')
+        lines.append((label, parse_point(st), parse_point(ed)))
+    lines = _unique_labels(lines, '--line')
+    if len(bcs) + len(lines) == 0:
+        raise ValueError('no --bc or --line given')
+
+    output = args.pattern
+    if not output.startswith('{dir}'):
+        output = os.path.join(os.getcwd(), output)
+    func = partial(extract_case, output=output, bcs=bcs, lines=lines, var=args.var, is_sort=args.sort,
+                   merge=args.merge, dedupe=args.dedupe.split(',') if args.dedupe else None, forcenew=args.forcenew,
+                   dtype=args.dtype, compress=args.compress)
+    return _report(_run_cases(func, expand_cases(args.cases), args.jobs), args)
+
+
+def cmd_convert(args):
+    from functools import partial
+
+    func = partial(convert_file, to=args.to, outdir=os.path.abspath(args.outdir) if args.outdir else None,
+                   dtype=args.dtype, compress=args.compress)
+    files = []
+    for pattern in args.files:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        files += [os.path.abspath(f) for f in matches if os.path.abspath(f) not in files]
+    return _report(_run_cases(func, files, args.jobs, key='file'), args)
+
+
+def cmd_set(args):
+    from functools import partial
+
+    paras = []
+    for text in args.para:
+        key, value = parse_label(text)
+        if key is None:
+            raise ValueError('--para %s is not in the form key=value' % text)
+        paras.append((key, value))
+    infsets = {}
+    for text in args.infset:
+        bc_num, text = parse_label(text)
+        if bc_num is None:
+            raise ValueError('--infset %s is not in the form bc=[type:]infset' % text)
+        typ, infset = text.split(':') if ':' in text else (None, text)
+        infsets[int(bc_num)] = (typ, int(infset))
+    func = partial(set_case, paras=paras, infsets=infsets, output_avg=args.output_avg)
+    return _report(_run_cases(func, expand_cases(args.cases), args.jobs), args)
+
+
+def cmd_monitor(args):
+    import time
+    from functools import partial
+    from .cfdpp import typ_dict
+
+    fluxes = _unique_labels([parse_flux(f, list(typ_dict)) for f in args.flux], '--flux')
+    func = partial(monitor_case, fluxes=fluxes, window=args.window, expect=args.expect, tol=args.tol,
+                   save_index=args.save_index)
+    try:
+        while True:
+            # the cases started since the last pass are taken too
+            status = _report(_run_cases(func, expand_cases(args.cases), args.jobs), args)
+            if args.every is None:
+                return status
+            time.sleep(args.every)
+    except KeyboardInterrupt:
+        return 0
+
+
+def cmd_watch(args):
+    from functools import partial
+    from .cfdpp import typ_dict
+    from .watch import case_watcher, post_handler
+
+    fluxes = _unique_labels([parse_flux(f, list(typ_dict)) for f in args.flux], '--flux')
+    bcs = _unique_labels([parse_label(b, 'bc') for b in args.bc], '--bc')
+    bcs = {label: parse_bcs(text) for label, text in bcs}
+    roots = []
+    for pattern in args.roots:
+        roots += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+    roots = [os.path.abspath(r) for r in roots]
+    state = os.path.abspath(args.state) if args.state is not None else None
+    catalog = os.path.abspath(args.catalog) if args.catalog is not None else None
+
+    persist = None
+    if args.pattern is not None:
+        output = args.pattern if args.pattern.startswith('{dir}') else os.path.join(os.getcwd(), args.pattern)
+        persist = partial(_persist_data, output=output, compress=args.compress)
+    handler = post_handler(fluxes={label: (typ, bc_series) for label, typ, bc_series in fluxes}, bcs=bcs,
+                           ave_window=args.ave, is_sort=args.sort, merge=args.merge, dtype=args.dtype,
+                           catalog=catalog, expect_step=args.expect, persist=persist, keep_data=False)
+    table = os.path.abspath(args.output) if args.output is not None else None
+    fmt = args.format if args.format is not None or table is None else os.path.splitext(table)[1][1:].lower()
+
+    def on_result(case, result, error):
+        if error is not None:
+            print('%s: %s: %s' % (os.path.basename(case), type(error).__name__, error), file=sys.stderr)
+        if table is not None:
+            # replaced in one rename, a reader never sees a half written table
+            write_table(handler.table(), table + '.tmp', fmt)
+            os.replace(table + '.tmp', table)
+
+    watcher = case_watcher(roots, handler, debounce=args.debounce, workers=args.jobs, poll=args.poll,
+                           backend=args.backend, state=state, on_result=on_result)
+    watcher.run(until_idle=args.once)
+    if table is None:
+        write_table(handler.table(), None, fmt)
+    return 1 if watcher.n_failed > 0 else 0
+
+
+def _persist_data(case_dir, result, output, compress=None):
+    name = os.path.basename(case_dir)
+    for label, tdata in result['data'].items():
+        write_tdata(tdata, output.format(case=name, dir=case_dir, label=label), compress=compress)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cfdtools', description='post-process the cases of CFD++ sweeps')
+    sub = parser.add_subparsers(dest='command', metavar='command')
+    sub.required = True
+
+    def add_common(p, cases=True):
+        if cases:
+            p.add_argument('cases', nargs='+', help='case folders or glob patterns')
+        p.add_argument('-j', '--jobs', type=int, default=1, help='number of processes')
+        p.add_argument('-o', '--output', default=None, help='the table file (.csv, .json, .npz), default is stdout')
+        p.add_argument('--format', choices=TABLE_FORMATS, default=None, help='format of the table')
+
+    def add_storage(p, dtype):
+        p.add_argument('--dtype', choices=['float64', 'float32'], default=dtype,
+                       help='dtype of the data%s' % (', default is that of the input' if dtype is None else ''))
+        p.add_argument('--compress', choices=[c for c in NPZ_COMPRESS if c is not None], default=None,
+                       help='compression of the .npz files (zstd and blosc need their packages)')
+
+    p = sub.add_parser('flux', help='table of the fluxes and areas of the cases')
+    add_common(p)
+    p.add_argument('--flux', action='append', default=[], metavar='[LABEL=]TYP:BCS',
+                   help='flux to read, i.e. fx:3,4 or lift=fy:3-6')
+    p.add_argument('--area', action='append', default=[], metavar='[LABEL=]X|Y|Z:BCS',
+                   help='area to read, i.e. x:3,4')
+    p.add_argument('--ave', type=int, default=0, help='average window (steps)')
+    p.set_defaults(func=cmd_flux)
+
+    p = sub.add_parser('extract', help='extract boundaries and lines of the cases')
+    add_common(p)
+    p.add_argument('--bc', action='append', default=[], metavar='[LABEL=]BCS', help='boundaries, i.e. wall=3,4')
+    p.add_argument('--line', action='append', default=[], metavar='[LABEL=]X,Y,Z:X,Y,Z', help='a line from a point to another')
+    p.add_argument('--var', default='P T U V W R M', help='variables of the lines')
+    p.add_argument('--sort', default=None, help='sort the points by a variable')
+    p.add_argument('--merge', action='store_true', help='merge the zones of the boundaries of a label')
+    p.add_argument('--dedupe', default=None, metavar='VARS', help='with --merge, i.e. X,Y,Z: keep the shared points once')
+    p.add_argument('--forcenew', action='store_true', help='extract again if the files exist')
+    p.add_argument('--pattern', default='{dir}/{label}.dat', help='the extracted files (.dat, .tec, .npz), default %(default)s')
+    add_storage(p, 'float64')
+    p.set_defaults(func=cmd_extract)
+
+    p = sub.add_parser('convert', help='convert tecplot files between ASCII and npz')
+    add_common(p, cases=False)
+    p.add_argument('files', nargs='+', help='tecplot files or glob patterns')
+    p.add_argument('--to', choices=['npz', 'dat', 'tec'], default='npz', help='the output format')
+    p.add_argument('--outdir', default=None, help='folder of the outputs, default is that of each file')
+    add_storage(p, None)
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser('set', help='set parameters and boundaries in mcfd.inp of the cases')
+    add_common(p)
+    p.add_argument('--para', action='append', default=[], metavar='KEY=VALUE', help='a parameter of mcfd.inp')
+    p.add_argument('--infset', action='append', default=[], metavar='BC=[TYPE:]INFSET', help='type and infoset of a boundary')
+    p.add_argument('--output-avg', type=int, default=None, metavar='N', help='output the average of N steps, 0 for none')
+    p.set_defaults(func=cmd_set)
+
+    p = sub.add_parser('monitor', help='progress and convergence of the cases')
+    add_common(p)
+    p.add_argument('--flux', action='append', default=[], metavar='[LABEL=]TYP:BCS', help='flux to check, i.e. fx:3,4')
+    p.add_argument('--window', type=int, default=5, help='steps of the relative change')
+    p.add_argument('--tol', type=float, default=1e-3, help='relative change of a converged flux')
+    p.add_argument('--expect', type=int, default=None, help='number of steps of a complete case')
+    p.add_argument('--every', type=float, default=None, metavar='SEC', help='check again every SEC seconds')
+    p.add_argument('--save-index', action='store_true', help='save the step index of mcfd.info1, so only the new steps are read next time')
+    p.set_defaults(func=cmd_monitor)
+
+    p = sub.add_parser('watch', help='post-process the cases as their files change')
+    add_common(p, cases=False)
+    p.add_argument('roots', nargs='+', help='folders searched for cases, or case folders')
+    p.add_argument('--flux', action='append', default=[], metavar='[LABEL=]TYP:BCS', help='flux to read, i.e. fx:3,4')
+    p.add_argument('--bc', action='append', default=[], metavar='[LABEL=]BCS', help='boundaries to extract, i.e. wall=3,4')
+    p.add_argument('--ave', type=int, default=0, help='average window (steps)')
+    p.add_argument('--sort', default=None, help='sort the points by a variable')
+    p.add_argument('--merge', action='store_true', help='merge the zones of the boundaries of a label')
+    p.add_argument('--pattern', default=None, help='the extracted files (.dat, .tec, .npz), i.e. {dir}/{label}.npz')
+    add_storage(p, 'float64')
+    p.add_argument('--catalog', default=None, help='a sweep catalog (SQLite file) the cases are recorded in')
+    p.add_argument('--expect', type=int, default=None, help='number of steps of a complete case')
+    p.add_argument('--state', default=None, help='json file of the files processed, kept between runs')
+    p.add_argument('--debounce', type=float, default=2.0, metavar='SEC', help='seconds without change before a case is processed')
+    p.add_argument('--poll', type=float, default=5.0, metavar='SEC', help='seconds between the searches of new cases')
+    p.add_argument('--backend', choices=['auto', 'inotify', 'poll'], default='auto', help='how changes are detected')
+    p.add_argument('--once', action='store_true', help='stop when no case is pending')
+    p.set_defaults(func=cmd_watch)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, KeyError, IOError) as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+'''
+cfdtools.cluster
+
+run a sweep of prepared cfd++ case folders as job arrays of a Slurm-like scheduler
+
+each case goes through the stages metis -> solve -> extract -> post. The cases
+with the same core number are grouped, and every stage of a group is submitted
+as one job array, where element `i` of a stage depends on element `i` of the
+previous stage (`--dependency=aftercorr`). So a case can be solved as soon as
+its own partition is done, and post-processed as soon as its own run is done.
+
+usage
+===
+
+>>> cases = [sweep_case(d, core=32, extract=['exbc2do1 exbcsin.bin pltosout.bin 3']) for d in dirs]
+>>> sweep = case_sweep(cases, slurm_scheduler(partition='cfd'), work_dir='sweep_jobs')
+>>> sweep.submit()
+>>> for case, state in sweep.as_completed(interval=60):
+>>>     if state == 'COMPLETED':
+>>>         op = cfdpp(case.path, verbose='None')
+>>>         ...
+
+the scheduler commands are run through `runner`, a function that takes a list
+of arguments and returns the stdout, so they can be wrapped (ssh, dry run, test)
+
+'''
+
+import os
+import shlex
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .system import get_launcher
+
+STAGES = ['metis', 'solve', 'extract', 'post']
+
+# states of the jobs, a subset of the Slurm states
+FINAL_STATES = ['COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT', 'NODE_FAIL', 'OUT_OF_MEMORY', 'PREEMPTED']
+
+
+class sweep_case():
+    '''
+    a prepared case folder in the sweep
+
+    paras
+    ===
+    - `path`      the case folder, should contain mcfd.inp and the grid
+    - `core`      core number of the solve stage
+    - `metis`     whether to partition the grid before solving
+    - `extract`   a list of command lines of the extract stage, run in the case folder
+    - `post`      a list of command lines of the post-process stage, run in the case folder
+    - `name`      name of the case, default is the folder name
+
+    '''
+
+    def __init__(self, path, core=1, metis=True, extract=None, post=None, name=None):
+        self.path = os.path.abspath(path)
+        self.core = core
+        self.metis = metis and core > 1
+        self.extract = list(extract) if extract is not None else []
+        self.post = list(post) if post is not None else []
+        self.name = name if name is not None else os.path.basename(self.path)
+
+    def commands(self, stage, launcher):
+        '''
+        the command lines of `stage` for this case
+        '''
+        if stage == 'metis':
+            return ['tometis pmetis %d > metis.log' % self.core] if self.metis else []
+        if stage == 'solve':
+            return [' '.join([shlex.quote(a) for a in launcher.args(self.core, ['mpimcfd'])])]
+        if stage == 'extract':
+            return self.extract
+        if stage == 'post':
+            return self.post
+        raise KeyError('stage %s not in %s' % (stage, STAGES))
+
+
+def _default_runner(args):
+    return subprocess.run(args, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+class slurm_scheduler():
+    '''
+    submit and poll job arrays with `sbatch` and `sacct`
+
+    paras
+    ===
+    - `partition`     the partition (queue) to submit to, default is None
+    - `time_limit`    the time limit of each job, i.e. '24:00:00', default is None
+    - `options`       a list of additional `#SBATCH` options, i.e. ['--account=aero']
+    - `runner`        function to run a command (list of arguments) and return its stdout
+
+    '''
+
+    def __init__(self, partition=None, time_limit=None, options=None, runner=None):
+        self.partition = partition
+        self.time_limit = time_limit
+        self.options = list(options) if options is not None else []
+        self.runner = runner if runner is not None else _default_runner
+
+    def header(self, name, n_task, core, log_dir):
+        '''
+        the `#SBATCH` lines of a job array with `n_task` elements of `core` cores
+        '''
+        lines = ['#SBATCH --job-name=%s' % name,
+                 '#SBATCH --array=0-%d' % (n_task - 1),
+                 '#SBATCH --ntasks=%d' % core,
+                 '#SBATCH --output=%s' % os.path.join(log_dir, name + '_%a.log')]
+        if self.partition is not None:
+            lines.append('#SBATCH --partition=%s' % self.partition)
+        if self.time_limit is not None:
+            lines.append('#SBATCH --time=%s' % self.time_limit)
+        lines += ['#SBATCH %s' % opt for opt in self.options]
+        return lines
+
+    def submit(self, script, depend=None):
+        '''
+        submit `script`, element `i` waits for element `i` of job `depend`
+
+        return
+        ===
+        the job id (str)
+        '''
+        args = ['sbatch', '--parsable']
+        if depend is not None:
+            args.append('--dependency=aftercorr:%s' % depend)
+        out = self.runner(args + [script])
+        return out.strip().split(';')[0]
+
+    def status(self, job_id, n_task):
+        '''
+        return the list of states of the `n_task` elements of job array `job_id`
+        '''
+        out = self.runner(['sacct', '-j', job_id, '--noheader', '--parsable2', '--format=JobID,State'])
+        states = ['PENDING'] * n_task
+        for line in out.splitlines():
+            split_line = line.split('|')
+            if len(split_line) < 2 or '.' in split_line[0]:
+                continue
+            idx = split_line[0].split('_')[-1]
+            if idx.isdigit() and int(idx) < n_task:
+                # i.e. 'CANCELLED by 1000'
+                states[int(idx)] = split_line[1].split()[0]
+        return states
+
+    def cancel(self, job_id):
+        self.runner(['scancel', job_id])
+
+
+class local_scheduler():
+    '''
+    run the job array scripts on the local machine with the same interface as
+    `slurm_scheduler`, for test and small sweeps
+
+    each array element runs `bash script` with `SLURM_ARRAY_TASK_ID` set, and
+    waits for the same element of the job it depends on. If that one did not
+    complete, the element is cancelled (as Slurm does with `aftercorr`).
+
+    paras
+    ===
+    - `max_workers`   number of array elements run at the same time
+    - `shell`         the shell to run the scripts
+
+    '''
+
+    def __init__(self, max_workers=4, shell='bash'):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.shell = shell
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.n_job = 0
+
+    def header(self, name, n_task, core, log_dir):
+        return ['#SBATCH --job-name=%s' % name, '#SBATCH --array=0-%d' % (n_task - 1), '#SBATCH --ntasks=%d' % core]
+
+    def _run(self, job_id, idx, script, depend):
+        if depend is not None:
+            self.jobs[depend]['futures'][idx].result()
+            if self.jobs[depend]['states'][idx] != 'COMPLETED':
+                self._set(job_id, idx, 'CANCELLED')
+                return
+        if self.jobs[job_id]['states'][idx] == 'CANCELLED':
+            return
+
+        self._set(job_id, idx, 'RUNNING')
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(idx), SLURM_ARRAY_JOB_ID=job_id)
+        with open(self.jobs[job_id]['logs'][idx], 'w') as log:
+            code = subprocess.call([self.shell, script], env=env, stdout=log, stderr=subprocess.STDOUT)
+        self._set(job_id, idx, 'COMPLETED' if code == 0 else 'FAILED')
+
+    def _set(self, job_id, idx, state):
+        with self.lock:
+            self.jobs[job_id]['states'][idx] = state
+
+    def submit(self, script, depend=None):
+        n_task = _array_size(script)
+        with self.lock:
+            self.n_job += 1
+            job_id = str(self.n_job)
+            log_base = os.path.splitext(script)[0]
+            self.jobs[job_id] = {'states': ['PENDING'] * n_task, 'futures': [],
+                                 'logs': ['%s_%d.log' % (log_base, i) for i in range(n_task)]}
+        # futures are created in order, so the ones of `depend` always exist
+        for idx in range(n_task):
+            self.jobs[job_id]['futures'].append(self.pool.submit(self._run, job_id, idx, script, depend))
+        return job_id
+
+    def status(self, job_id, n_task):
+        with self.lock:
+            return list(self.jobs[job_id]['states'][:n_task])
+
+    def cancel(self, job_id):
+        with self.lock:
+            states = self.jobs[job_id]['states']
+            for idx, state in enumerate(states):
+                if state == 'PENDING':
+                    states[idx] = 'CANCELLED'
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+def _array_size(script):
+    '''
+    read the array size from the `#SBATCH --array=0-N` line of `script`
+    '''
+    with open(script, 'r') as f:
+        for line in f:
+            if line.startswith('#SBATCH --array='):
+                return int(line.split('-')[-1]) + 1
+    return 1
+
+
+class case_sweep():
+    '''
+    render, submit, poll and collect the job arrays of a list of `sweep_case`
+
+    paras
+    ===
+    - `cases`         a list of `sweep_case`
+    - `scheduler`     a `slurm_scheduler`, `local_scheduler` or any object with
+                      the methods `header`, `submit`, `status` and `cancel`
+    - `work_dir`      folder to write the job scripts and logs
+    - `launcher`      MPI launcher of the solve stage, a `system.mpi_launcher` or its name
+    - `stages`        the stages to run, in the order of `STAGES`
+
+    '''
+
+    def __init__(self, cases, scheduler, work_dir='sweep_jobs', launcher='srun', stages=None):
+        self.cases = list(cases)
+        self.scheduler = scheduler
+        self.work_dir = os.path.abspath(work_dir)
+        self.launcher = get_launcher(launcher)
+        self.stages = [stg for stg in STAGES if stages is None or stg in stages]
+
+        # cases are grouped by the core number, the element index in the job
+        # arrays of a group is the index of the case in `self.groups[core]`
+        self.groups = {}
+        for case in self.cases:
+            self.groups.setdefault(case.core, []).append(case)
+
+        self.jobs = {}
+        self.collected = set()
+
+    def render(self, stage, core):
+        '''
+        return the job script of `stage` of the group with `core` cores, or
+        None if no case of the group has commands in this stage
+        '''
+        cases = self.groups[core]
+        commands = [case.commands(stage, self.launcher) for case in cases]
+        if sum([len(c) for c in commands]) == 0:
+            return None
+
+        name = '%s_c%d' % (stage, core)
+        lines = ['#!/bin/bash']
+        lines += self.scheduler.header(name, len(cases), core if stage == 'solve' else 1, self.work_dir)
+        lines += ['', 'set -e', 'CASES=(']
+        lines += ['  %s' % shlex.quote(case.path) for case in cases]
+        lines += [')', 'cd "${CASES[$SLURM_ARRAY_TASK_ID]}"', '', 'case $SLURM_ARRAY_TASK_ID in']
+        for idx, cmds in enumerate(commands):
+            lines.append('  %d)' % idx)
+            lines += ['    %s' % c for c in cmds] if len(cmds) > 0 else ['    true']
+            lines.append('    ;;')
+        lines.append('esac')
+        return '\n'.join(lines) + '\n'
+
+    def submit(self):
+        '''
+        write the job scripts to `work_dir` and submit them, the job ids are
+        saved in `self.jobs[(stage, core)]`
+        '''
+        os.makedirs(self.work_dir, exist_ok=True)
+        for core in self.groups:
+            depend = None
+            for stage in self.stages:
+                script = self.render(stage, core)
+                if script is None:
+                    continue
+                fname = os.path.join(self.work_dir, '%s_c%d.sh' % (stage, core))
+                with open(fname, 'w') as f:
+                    f.write(script)
+                depend = self.scheduler.submit(fname, depend=depend)
+                self.jobs[(stage, core)] = depend
+        return self.jobs
+
+    def poll(self):
+        '''
+        return a dict of case path -> {stage: state}
+
+        the cases are keyed by their folder (absolute), two cases of the same
+        folder name in different sweeps are kept apart
+        '''
+        states = {case.path: {} for case in self.cases}
+        for (stage, core), job_id in self.jobs.items():
+            cases = self.groups[core]
+            for case, state in zip(cases, self.scheduler.status(job_id, len(cases))):
+                states[case.path][stage] = state
+        return states
+
+    def case_state(self, stage_states):
+        '''
+        the state of a case from the states of its stages: the first one not
+        completed, or 'COMPLETED' when all are done
+        '''
+        for stage in self.stages:
+            if stage in stage_states and stage_states[stage] != 'COMPLETED':
+                return stage_states[stage]
+        return 'COMPLETED'
+
+    def as_completed(self, interval=30.0, timeout=None):
+        '''
+        poll every `interval` seconds, and yield (case, state) of each case
+        once its last stage is finished or any stage fails
+
+        raise
+        ===
+        `TimeoutError`  when `timeout` seconds are passed before all cases finished
+        '''
+        t0 = time.time()
+        by_path = {case.path: case for case in self.cases}
+        while len(self.collected) < len(by_path):
+            for path, stage_states in self.poll().items():
+                if path in self.collected:
+                    continue
+                state = self.case_state(stage_states)
+                if state in FINAL_STATES:
+                    self.collected.add(path)
+                    yield by_path[path], state
+
+            if len(self.collected) < len(by_path):
+                if timeout is not None and time.time() - t0 > timeout:
+                    raise TimeoutError('%d cases not finished in %.1f sec' % (len(by_path) - len(self.collected), timeout))
+                time.sleep(interval)
+
+    def collect(self, func, interval=30.0, timeout=None):
+        '''
+        call `func(case)` for each case completed, and return a dict of
+        case path -> result (None for the cases not completed)
+        '''
+        results = {}
+        for case, state in self.as_completed(interval=interval, timeout=timeout):
+            results[case.path] = func(case) if state == 'COMPLETED' else None
+        return results
+
+    def cancel(self):
+        for job_id in self.jobs.values():
+            self.scheduler.cancel(job_id)
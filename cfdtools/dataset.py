@@ -0,0 +1,225 @@
+'''
+cfdtools.dataset
+
+force / moment tables of many cfd++ cases in one array
+
+the FFM history of every case is stacked into an array in shape
+(n_case, n_step, n_bc, 8), loaded lazily on first use (optionally with a thread
+pool, and optionally into a memory-mapped .npy file). The windowed averaged
+flux, the area-normalized coefficients and the moments about another point are
+then computed for all cases in one vectorized call.
+
+the cases may have different numbers of steps, only the last `n_step` steps
+(default the shortest history) of each case are kept, since they are the ones
+averaged.
+
+usage
+===
+
+>>> ds = case_dataset(glob.glob('sweep/ma*'), threads=8)
+>>> fx = ds.flux('fx', [3, 4], ave_window=200)                  # (n_case,)
+>>> cd = ds.coef('fx', [3, 4], q_ref=q, ref_area=('x', [3, 4]))
+>>> mz = ds.moment('mz', [3, 4], move_axis=(0.25, 0.0, 0.0))
+
+'''
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from .cfdpp import typ_dict, info1_index, read_inp_para
+
+AREA_DICT = {'x': 0, 'y': 1, 'z': 2, 'n': 3}
+
+
+def case_index(op_dir, n_var=8):
+    '''
+    the step index (`cfdpp.info1_index`) of the mcfd.info1 of the case in
+    folder `op_dir`, scanned to the end of the file
+    '''
+    n_bc = int(read_inp_para(os.path.join(op_dir, 'mcfd.inp'), 'mbcons'))
+    index = info1_index(os.path.join(op_dir, 'mcfd.info1'), n_bc, n_var=n_var)
+    index.update()
+    return index
+
+
+def load_case(op_dir, n_var=8, steps=None):
+    '''
+    read the FFM history and areas of the case in folder `op_dir`, only the
+    `steps` (a slice, default is all) are parsed
+    '''
+    index = case_index(op_dir, n_var=n_var)
+    return index.read(steps), index.read_areas()
+
+
+class case_dataset():
+    '''
+    the FFM histories of many cases
+
+    paras
+    ===
+    - `case_dirs`     a list of case folders (with mcfd.inp and mcfd.info1)
+    - `n_step`        number of last steps to keep, default is the shortest history
+    - `threads`       number of threads to load the cases, default is 1
+    - `mmap`          path of a .npy file to store the stacked array, default is
+                      None (in memory)
+    - `names`         names of the cases, default is the folder names
+    - `dtype`         dtype of the stacked array (and of the `mmap` file),
+                      `float32` halves its size, the fluxes are still summed
+                      and averaged in float64
+
+    '''
+
+    def __init__(self, case_dirs, n_step=None, threads=1, mmap=None, names=None, dtype='float64'):
+        self.case_dirs = list(case_dirs)
+        self.names = list(names) if names is not None else [os.path.basename(os.path.normpath(d)) for d in self.case_dirs]
+        self.n_step = n_step
+        self.threads = threads
+        self.mmap = mmap
+        self.dtype = dtype
+        self._data = None
+        self._areas = None
+
+    def __len__(self):
+        return len(self.case_dirs)
+
+    def load(self):
+        '''
+        read all cases and stack them, called on first use of `data` or `areas`
+        '''
+        # the steps of the cases are found first, so the stacked array is
+        # allocated once and each case is written to it as soon as it is read
+        indexes = self._map(case_index, self.case_dirs)
+
+        n_bcs = set([index.n_bc for index in indexes])
+        if len(n_bcs) > 1:
+            raise ValueError('cases have different numbers of boundaries: %s' % sorted(n_bcs))
+        n_step = min([index.n_step for index in indexes])
+        if self.n_step is not None:
+            if self.n_step > n_step:
+                raise ValueError('%d steps asked, but the shortest history has %d' % (self.n_step, n_step))
+            n_step = self.n_step
+        self.n_step = n_step
+
+        shape = (len(indexes), n_step, indexes[0].n_bc, indexes[0].n_var)
+        if self.mmap is not None:
+            data = np.lib.format.open_memmap(self.mmap, mode='w+', dtype=self.dtype, shape=shape)
+        else:
+            data = np.empty(shape, dtype=self.dtype)
+
+        def read(i):
+            index = indexes[i]
+            data[i] = index.read(slice(index.n_step - n_step, None))
+            return index.read_areas()
+
+        self._areas = np.array(self._map(read, range(len(indexes))))
+        self._data = data
+
+    def _map(self, func, items):
+        if self.threads > 1:
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                return list(pool.map(func, items))
+        return [func(item) for item in items]
+
+    @property
+    def data(self):
+        '''
+        FFM history in shape (n_case, n_step, n_bc, 8)
+        '''
+        if self._data is None:
+            self.load()
+        return self._data
+
+    @property
+    def areas(self):
+        '''
+        areas in shape (n_case, n_bc, 4)
+        '''
+        if self._areas is None:
+            self.load()
+        return self._areas
+
+    def _window(self, ave_window):
+        # no average means the last step
+        return self.data[:, -max(ave_window, 1):]
+
+    def fluxes(self, bc_series, ave_window=0):
+        '''
+        averaged flux of all types summed over `bc_series`
+
+        return
+        ===
+        array in shape (n_case, 8), in the order of `typ_dict`
+        '''
+        idx = np.asarray(bc_series) - 1
+        return self._window(ave_window)[:, :, idx].mean(axis=1, dtype=np.float64).sum(axis=1)
+
+    def flux(self, typ, bc_series, ave_window=0, move_axis=None):
+        '''
+        flux `typ` summed over `bc_series` of all cases, same as `cfdpp.read_flux`
+
+        paras
+        ===
+        - `typ`           flux type in `typ_dict`
+        - `bc_series`     bc numbers (start from 1) to read and sum
+        - `ave_window`    average the last several steps, 0 for the last step
+        - `move_axis`     (x, y, z) to move the axis of moment, or an array in
+                          shape (n_case, 3) for each case
+
+        return
+        ===
+        array in shape (n_case,)
+        '''
+        if move_axis is not None:
+            return self.moment(typ, bc_series, move_axis, ave_window=ave_window)
+        return self.fluxes(bc_series, ave_window)[:, typ_dict[typ]]
+
+    def moment(self, typ, bc_series, move_axis, ave_window=0):
+        '''
+        moment `typ` (`mx`, `my` or `mz`) about point `move_axis` instead of
+        the reference point of the cases
+        '''
+        f = self.fluxes(bc_series, ave_window)
+        axis = np.broadcast_to(np.asarray(move_axis, dtype=float), (len(f), 3))
+        fx, fy, fz = f[:, typ_dict['fx']], f[:, typ_dict['fy']], f[:, typ_dict['fz']]
+        if typ == 'mz':
+            return f[:, typ_dict['mz']] - fy * axis[:, 0] + fx * axis[:, 1]
+        if typ == 'my':
+            return f[:, typ_dict['my']] + fz * axis[:, 0] - fx * axis[:, 2]
+        if typ == 'mx':
+            return f[:, typ_dict['mx']] - fz * axis[:, 1] + fy * axis[:, 2]
+        raise KeyError('moment type %s not in mx, my, mz' % typ)
+
+    def area(self, typ, bc_series):
+        '''
+        area (projected on `typ` = 'x', 'y', 'z' or 'n') summed over `bc_series`,
+        same as `cfdpp.read_area`
+        '''
+        return self.areas[:, np.asarray(bc_series) - 1, AREA_DICT[typ]].sum(axis=1)
+
+    def coef(self, typ, bc_series, q_ref, ref_area, ave_window=0, move_axis=None, ref_length=1.0):
+        '''
+        coefficient of flux `typ`: flux / (q_ref * ref_area [* ref_length])
+
+        paras
+        ===
+        - `q_ref`         reference dynamic pressure, a float or an array (n_case,)
+        - `ref_area`      reference area, a float, an array (n_case,), or a
+                          tuple (typ, bc_series) to use the area of the boundaries
+        - `ref_length`    reference length of moment coefficients
+
+        '''
+        if isinstance(ref_area, tuple):
+            ref_area = self.area(*ref_area)
+        value = self.flux(typ, bc_series, ave_window=ave_window, move_axis=move_axis)
+        norm = np.asarray(q_ref) * np.asarray(ref_area)
+        if typ in ['mx', 'my', 'mz']:
+            norm = norm * ref_length
+        return value / norm
+
+    def table(self, bc_series, ave_window=0):
+        '''
+        dict of case name -> {typ: flux}, for writing csv / json
+        '''
+        f = self.fluxes(bc_series, ave_window)
+        return {name: {typ: float(f[i, j]) for typ, j in typ_dict.items()} for i, name in enumerate(self.names)}
@@ -0,0 +1,404 @@
+'''
+cfdtools.fakecfdpp
+
+stand-in executables of the CFD++ tools used by `cfdtools.cfdpp`, to run and
+load-test the python side of the workflow without a CFD++ licence
+
+the tools follow the file contracts of the real ones:
+
+- `tometis pmetis N`            writes `mcfd_metis.graph` and `mcpusin.bin.N`
+- `mpimcfd`                     reads mcfd.inp, appends time steps to mcfd.info1,
+                                writes cdepsout.bin, pltosout.bin (and cdaveout.bin)
+- `exbc2do1 exbcsin.bin pltosout.bin N`
+                                writes BC%d.dat, BC%d.mpf1d and BC%d.txt
+- `npf2lin1 0 linelist.inp lineoutput pltosout.bin VAR ...`
+                                writes lineoutput_%d.tec, .mpf1d and .txt
+- `mpiexec` / `mpirun` / `srun` run the program with the core number in
+                                `FAKECFDPP_NP`
+
+they are run as `python -m cfdtools.fakecfdpp TOOL ARGS`, or put on the PATH with
+
+>>> bin_dir = install('/tmp/fakebin')
+>>> os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+the timing profile is set with environment variables (seconds):
+
+- `FAKECFDPP_STEP_TIME`     wall time of one step on one core, divided by the core number
+- `FAKECFDPP_EXTRACT_TIME`  wall time of one `exbc2do1` / `npf2lin1` call
+- `FAKECFDPP_METIS_TIME`    wall time of one `tometis` call
+- `FAKECFDPP_NPOINT`        number of points of an extracted BC or line (default 101)
+- `FAKECFDPP_FAIL_AT`       `mpimcfd` crashes after this many steps of a run (default never)
+
+'''
+
+import os
+import re
+import sys
+import time
+import subprocess
+import numpy as np
+
+FFM_VARNAMES = ['energy', 'mass', 'fx', 'fy', 'fz', 'mx', 'my', 'mz']
+FIELD_VARNAMES = ['X', 'Y', 'Z', 'P', 'T', 'U', 'V', 'W', 'R', 'M']
+
+TOOLS = ['mpimcfd', 'exbc2do1', 'npf2lin1', 'tometis', 'mpiexec', 'mpirun', 'srun']
+
+
+def _env(name, default, typ=float):
+    val = os.environ.get(name)
+    if val is None or val == '':
+        return default
+    return typ(val)
+
+
+def _read_inp(key, default=None, inp='mcfd.inp'):
+    '''
+    read `key value` from mcfd.inp in the current folder
+    '''
+    with open(inp, 'r') as f:
+        for line in f:
+            split_line = line.split()
+            if len(split_line) > 1 and split_line[0] == key:
+                return split_line[1]
+    return default
+
+
+def _exit(tool, message):
+    sys.stderr.write('%s: %s\n' % (tool, message))
+    return 1
+
+# ================================ file writers ==================================
+
+
+def write_info1_bc(f, step, i_bc, values, area):
+    '''
+    write one boundary block (23 lines) of mcfd.info1
+
+    paras
+    ===
+    - `f`         file stream
+    - `step`      time step, start from 0
+    - `i_bc`      boundary index, start from 0
+    - `values`    the 8 flux values in the order of `FFM_VARNAMES`
+    - `area`      the areas in x, y, z and n direction
+
+    '''
+    f.write(' ========================================================\n')
+    f.write(' Integrated quantities for bc # %4d  time step %8d\n' % (i_bc + 1, step + 1))
+    f.write(' ========================================================\n')
+    for i_head in range(11):
+        f.write(' bcinfo %d %d header-line-%d\n' % (i_bc + 1, step + 1, i_head))
+    for name, val in zip(FFM_VARNAMES, values):
+        f.write(' %-8s = % .8e\n' % (name, val))
+    f.write(' area % .8e % .8e % .8e % .8e\n' % tuple(area))
+
+
+def write_info1_step(f, step, values, areas):
+    '''
+    write one time step (n_bc blocks and the end line) of mcfd.info1
+
+    `values` is in shape (n_bc, 8), `areas` in shape (n_bc, 4)
+    '''
+    for i_bc in range(len(values)):
+        write_info1_bc(f, step, i_bc, values[i_bc], areas[i_bc])
+    f.write(' end of time step %d\n' % (step + 1))
+
+
+def write_info1_at(f, step):
+    '''
+    write one solver-setting block (11 lines) starting with `At`
+    '''
+    f.write('At time step %d the solver settings are\n' % (step + 1))
+    for i_line in range(10):
+        f.write(' setting_%d = %d\n' % (i_line, step + 1))
+
+
+def write_tec_zone(f, zonename, data):
+    '''
+    write an ordered 1D zone in POINT packing, `data` in shape (n_var, n_point)
+    '''
+    f.write('ZONE T="%s" I=%d\n' % (zonename, data.shape[1]))
+    np.savetxt(f, data.T, fmt='%.10e')
+
+
+def write_tec_lines(fname, varnames, zones, title='fakecfdpp'):
+    '''
+    write a Tecplot ASCII file of ordered 1D zones, `zones` is a dict of
+    zonename -> (n_var, n_point) array
+    '''
+    with open(fname, 'w') as f:
+        f.write('TITLE = "%s"\n' % title)
+        f.write('VARIABLES = ' + ','.join(['"%s"' % v for v in varnames]) + '\n')
+        for zonename, data in zones.items():
+            write_tec_zone(f, zonename, data)
+
+# ================================ fake flow field ===============================
+
+
+class fake_flow():
+    '''
+    deterministic flux histories and flow fields of a case with `n_bc` boundaries
+
+    the flux of each boundary converges exponentially to a random target with a
+    small oscillation, so averaging and convergence checks behave as in real runs
+    '''
+
+    def __init__(self, n_bc, seed=0):
+        rng = np.random.default_rng(seed + n_bc)
+        n_var = len(FFM_VARNAMES)
+        self.n_bc = n_bc
+        self.target = rng.uniform(-1.0, 1.0, (n_bc, n_var)) * 10.0**rng.integers(-2, 3, (n_bc, n_var))
+        self.tau = rng.uniform(50.0, 200.0, (n_bc, n_var))
+        self.omega = rng.uniform(0.05, 0.5, (n_bc, n_var))
+        self.areas = rng.uniform(0.1, 2.0, (n_bc, 4))
+
+    def flux(self, step):
+        return self.target * (1.0 - np.exp(-(step + 1) / self.tau) + 1e-3 * np.sin(self.omega * step))
+
+    def field(self, xyz, step):
+        '''
+        flow variables (P T U V W R M) on points `xyz` in shape (3, n)
+        '''
+        x, y, z = xyz
+        phase = 0.01 * step
+        p = 101325.0 * (1.0 + 0.1 * np.sin(x + phase) * np.cos(y))
+        t = 300.0 * (1.0 + 0.05 * np.cos(x - z + phase))
+        u = 100.0 * np.cos(y + phase)
+        v = 10.0 * np.sin(x)
+        w = 1.0 * np.sin(z)
+        r = p / 287.0 / t
+        m = np.sqrt(u**2 + v**2 + w**2) / np.sqrt(1.4 * 287.0 * t)
+        return np.array([p, t, u, v, w, r, m])
+
+
+def _read_restart(fname):
+    '''
+    return the number of steps stored in a (fake) restart file
+    '''
+    if not os.path.exists(fname):
+        return 0
+    with open(fname, 'rb') as f:
+        head = f.readline().decode('ascii', 'ignore')
+    found = re.findall(r'step\s+(\d+)', head)
+    return int(found[0]) if found else 0
+
+
+def _write_restart(fname, step, nbytes=4096):
+    with open(fname, 'wb') as f:
+        f.write(b'fakecfdpp restart step %d\n' % step)
+        f.write(os.urandom(nbytes))
+
+# ================================ tools =========================================
+
+
+def mpimcfd(args):
+    '''
+    run `ntstep` steps of the case in the current folder
+    '''
+    n_proc = _env('FAKECFDPP_NP', 1, int)
+    step_time = _env('FAKECFDPP_STEP_TIME', 0.0)
+    fail_at = _env('FAKECFDPP_FAIL_AT', -1, int)
+
+    if not os.path.exists('mcfd.inp'):
+        return _exit('mpimcfd', 'mcfd.inp not found in ' + os.getcwd())
+    if n_proc > 1 and not os.path.exists('mcpusin.bin.%d' % n_proc):
+        return _exit('mpimcfd', 'no partition for %d cores, run tometis first' % n_proc)
+
+    n_bc = int(_read_inp('mbcons', 1))
+    n_step = int(_read_inp('ntstep', 0))
+    restart = int(_read_inp('istart', 0)) > 0
+    save_avg = int(_read_inp('cdepsave_compute', 0)) > 0
+
+    flow = fake_flow(n_bc)
+    step0 = _read_restart('cdepsout.bin') if restart else 0
+
+    with open('mcfd.info1', 'a' if restart else 'w') as f:
+        write_info1_at(f, step0)
+        for i_step in range(n_step):
+            if i_step == fail_at:
+                f.flush()
+                return _exit('mpimcfd', 'crashed at step %d' % (step0 + i_step + 1))
+            write_info1_step(f, step0 + i_step, flow.flux(step0 + i_step), flow.areas)
+            f.flush()
+            if step_time > 0.0:
+                time.sleep(step_time / n_proc)
+
+    step = step0 + n_step
+    _write_restart('cdepsout.bin', step)
+    _write_restart('pltosout.bin', step)
+    if save_avg:
+        _write_restart('cdaveout.bin', step)
+    return 0
+
+
+def _field_file_step(tool, fname):
+    if not os.path.exists(fname):
+        raise FileNotFoundError('%s: %s not found' % (tool, fname))
+    return _read_restart(fname)
+
+
+def exbc2do1(args):
+    '''
+    extract boundary `args[2]` of `args[1]` (pltosout.bin)
+    '''
+    if len(args) < 3:
+        return _exit('exbc2do1', 'usage: exbc2do1 exbcsin.bin pltosout.bin BC_NUMBER')
+    try:
+        step = _field_file_step('exbc2do1', args[1])
+    except FileNotFoundError as e:
+        return _exit('exbc2do1', str(e))
+
+    i_bc = int(args[2])
+    n_bc = int(_read_inp('mbcons', 1)) if os.path.exists('mcfd.inp') else i_bc
+    if i_bc < 1 or i_bc > n_bc:
+        return _exit('exbc2do1', 'no boundary %d' % i_bc)
+
+    os.makedirs('mlog', exist_ok=True)
+    time.sleep(_env('FAKECFDPP_EXTRACT_TIME', 0.0))
+
+    n_point = _env('FAKECFDPP_NPOINT', 101, int)
+    s = np.linspace(0.0, 1.0, n_point)
+    xyz = np.array([s + i_bc - 1, 0.1 * i_bc * np.sin(np.pi * s), np.zeros(n_point)])
+    data = np.vstack((xyz, fake_flow(n_bc).field(xyz, step)))
+
+    write_tec_lines('BC%d.dat' % i_bc, FIELD_VARNAMES, {'BC %d' % i_bc: data})
+    for ext in ['mpf1d', 'txt']:
+        with open('BC%d.%s' % (i_bc, ext), 'w') as f:
+            f.write('fakecfdpp bc %d step %d\n' % (i_bc, step))
+    return 0
+
+
+def npf2lin1(args):
+    '''
+    `npf2lin1 0 linelist.inp OUTPUT pltosout.bin VAR ...`: interpolate
+    `args[3]` (pltosout.bin) on the lines of `args[1]` (linelist.inp), line i
+    is written to `args[2]`_i.tec with the variables `args[4:]` (default all)
+    '''
+    if len(args) < 4:
+        return _exit('npf2lin1', 'usage: npf2lin1 0 linelist.inp OUTPUT pltosout.bin VAR ...')
+    linelist, output, field = args[1], args[2], args[3]
+    varnames = args[4:] if len(args) > 4 else FIELD_VARNAMES[3:]
+    unknown = [v for v in varnames if v not in FIELD_VARNAMES[3:]]
+    if len(unknown) > 0:
+        return _exit('npf2lin1', 'unknown variables %s' % ' '.join(unknown))
+
+    try:
+        step = _field_file_step('npf2lin1', field)
+    except FileNotFoundError as e:
+        return _exit('npf2lin1', str(e))
+    if not os.path.exists(linelist):
+        return _exit('npf2lin1', linelist + ' not found')
+
+    with open(linelist, 'r') as f:
+        tokens = f.read().split()
+    n_line = int(tokens[0])
+    ends = [float(t) for t in tokens[2: 2 + 6 * n_line]]
+
+    os.makedirs('mlog', exist_ok=True)
+    time.sleep(_env('FAKECFDPP_EXTRACT_TIME', 0.0))
+
+    n_point = _env('FAKECFDPP_NPOINT', 101, int)
+    var_idx = [FIELD_VARNAMES.index(v) - 3 for v in varnames]
+    flow = fake_flow(1)
+    for i_line in range(n_line):
+        st = np.array(ends[6 * i_line: 6 * i_line + 3])
+        ed = np.array(ends[6 * i_line + 3: 6 * i_line + 6])
+        xyz = st[:, None] + (ed - st)[:, None] * np.linspace(0.0, 1.0, n_point)[None, :]
+        data = np.vstack((xyz, flow.field(xyz, step)[var_idx]))
+        fname = '%s_%d' % (output, i_line + 1)
+        write_tec_lines(fname + '.tec', FIELD_VARNAMES[:3] + list(varnames), {'line %d' % (i_line + 1): data})
+        for ext in ['mpf1d', 'txt']:
+            with open('%s.%s' % (fname, ext), 'w') as f:
+                f.write('fakecfdpp line %d step %d\n' % (i_line + 1, step))
+    return 0
+
+
+def tometis(args):
+    '''
+    `tometis pmetis N`: partition the grid for N cores
+    '''
+    if len(args) < 2 or args[0] != 'pmetis':
+        return _exit('tometis', 'usage: tometis pmetis N')
+    n_proc = int(args[1])
+    time.sleep(_env('FAKECFDPP_METIS_TIME', 0.0))
+
+    with open('mcfd_metis.graph', 'w') as f:
+        f.write('fakecfdpp metis graph for %d cores\n' % n_proc)
+    with open('mcpusin.bin.%d' % n_proc, 'wb') as f:
+        f.write(np.arange(n_proc, dtype=np.int32).tobytes())
+    print('fakecfdpp: grid split into %d parts' % n_proc)
+    return 0
+
+
+def mpiexec(args):
+    '''
+    `mpiexec [-localonly] [-np N | -n N] [-hostfile FILE] PROGRAM ARGS`
+
+    the program is run once, with the core number in `FAKECFDPP_NP`
+    '''
+    n_proc = 1
+    rest = list(args)
+    while len(rest) > 0 and rest[0].startswith('-'):
+        opt = rest.pop(0)
+        if opt in ['-np', '-n', '--ntasks']:
+            n_proc = int(rest.pop(0))
+        elif opt.startswith('--ntasks='):
+            n_proc = int(opt.split('=')[1])
+        elif opt in ['-hostfile', '-f', '-machinefile', '--hostfile', '--nodelist', '-w']:
+            rest.pop(0)
+        elif opt == '--':
+            break
+    if len(rest) == 0:
+        return _exit('mpiexec', 'no program given')
+
+    env = dict(os.environ)
+    env['FAKECFDPP_NP'] = str(n_proc)
+    return subprocess.call(_tool_command(rest[0]) + rest[1:], env=env)
+
+
+def _tool_command(name):
+    if name in TOOLS:
+        return [sys.executable, '-m', 'cfdtools.fakecfdpp', name]
+    return [name]
+
+
+def install(bin_dir):
+    '''
+    write launcher scripts of the tools into `bin_dir`, to be put on the PATH
+
+    return
+    ===
+    `bin_dir`
+
+    '''
+    os.makedirs(bin_dir, exist_ok=True)
+    for tool in TOOLS:
+        if os.name == 'nt':
+            fname = os.path.join(bin_dir, tool + '.bat')
+            script = '@"%s" -m cfdtools.fakecfdpp %s %%*\n' % (sys.executable, tool)
+        else:
+            fname = os.path.join(bin_dir, tool)
+            script = '#!/bin/sh\nexec "%s" -m cfdtools.fakecfdpp %s "$@"\n' % (sys.executable, tool)
+        with open(fname, 'w') as f:
+            f.write(script)
+        os.chmod(fname, 0o755)
+    return bin_dir
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) == 0 or argv[0] not in TOOLS + ['install']:
+        return _exit('fakecfdpp', 'usage: python -m cfdtools.fakecfdpp {%s} ARGS' % ','.join(TOOLS + ['install']))
+
+    tool, args = argv[0], argv[1:]
+    if tool == 'install':
+        print(install(args[0] if len(args) > 0 else os.path.join(os.getcwd(), 'fakebin')))
+        return 0
+    if tool in ['mpirun', 'srun']:
+        tool = 'mpiexec'
+    return globals()[tool](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
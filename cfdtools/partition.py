@@ -0,0 +1,146 @@
+'''
+cfdtools.partition
+
+cache of the metis partitions of cfd++ grids
+
+`tometis pmetis N` only depends on the grid and the core number, so the
+partition files (`mcfd_metis.graph`, `mcpusin.bin.N`) are stored once in the
+cache, under the sha256 of the grid files and N, and hard linked (or copied)
+into the other cases with the same grid. tometis is only run again when the
+grid or the core number changes.
+
+the sha256 of a grid file is remembered by (device, inode, size, mtime), so the
+grid is not read again for cases whose grid files are hard links of the same one.
+
+usage
+===
+
+>>> cache = metis_cache('/scratch/metis_cache')
+>>> op = cfdpp('case', core=32)
+>>> op.metis(cache=cache)
+
+'''
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from .system import link_or_copy, file_digest
+
+GRID_FILES = ['nodesin.bin', 'cellsin.bin', 'exbcsin.bin']
+
+
+def partition_files(n_proc):
+    '''
+    the files written by `tometis pmetis n_proc`
+    '''
+    return ['mcfd_metis.graph', 'mcpusin.bin.%d' % n_proc]
+
+
+class metis_cache():
+    '''
+    cache of metis partitions in folder `cache_dir`
+
+    paras
+    ===
+    - `cache_dir`     the cache folder, created if not exist
+    - `grid_files`    the grid files of a case that define the partition
+
+    '''
+
+    def __init__(self, cache_dir, grid_files=GRID_FILES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.grid_files = list(grid_files)
+        self.digest_file = os.path.join(self.cache_dir, 'digests.json')
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._digests = {}
+        if os.path.exists(self.digest_file):
+            with open(self.digest_file, 'r') as f:
+                self._digests = json.load(f)
+
+    def _digest(self, fname):
+        st = os.stat(fname)
+        stamp = '%d:%d:%d:%d' % (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if stamp in self._digests:
+                return self._digests[stamp]
+        digest = file_digest(fname)
+        with self._lock:
+            self._digests[stamp] = digest
+            tmp = self.digest_file + '.%d.tmp' % os.getpid()
+            with open(tmp, 'w') as f:
+                json.dump(self._digests, f)
+            os.replace(tmp, self.digest_file)
+        return digest
+
+    def key(self, op_dir, n_proc):
+        '''
+        the key of the partition of case `op_dir` for `n_proc` cores, None if
+        none of the grid files is found
+        '''
+        h = hashlib.sha256()
+        found = False
+        for fname in self.grid_files:
+            fpath = os.path.join(op_dir, fname)
+            if os.path.exists(fpath):
+                found = True
+                h.update(('%s %s\n' % (fname, self._digest(fpath))).encode())
+        if not found:
+            return None
+        return '%s_%d' % (h.hexdigest()[:32], n_proc)
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def __contains__(self, key):
+        return key is not None and os.path.isdir(self._entry(key))
+
+    def get(self, op_dir, n_proc, key=None):
+        '''
+        link the cached partition into `op_dir`
+
+        return
+        ===
+        whether the partition is found in the cache
+        '''
+        if key is None:
+            key = self.key(op_dir, n_proc)
+        if key not in self:
+            return False
+        for fname in partition_files(n_proc):
+            link_or_copy(os.path.join(self._entry(key), fname), os.path.join(op_dir, fname))
+        return True
+
+    def put(self, op_dir, n_proc, key=None):
+        '''
+        store the partition files of `op_dir` in the cache
+        '''
+        if key is None:
+            key = self.key(op_dir, n_proc)
+        if key is None or key in self:
+            return key
+
+        # the entry is filled in a temporary folder and renamed, so an entry
+        # seen by another process is always complete
+        tmp = self._entry(key) + '.%d.tmp' % os.getpid()
+        os.makedirs(tmp, exist_ok=True)
+        for fname in partition_files(n_proc):
+            # copied, the files of the case may be rewritten in place
+            shutil.copy2(os.path.join(op_dir, fname), os.path.join(tmp, fname))
+        try:
+            os.rename(tmp, self._entry(key))
+        except OSError:
+            # stored by another process at the same time
+            shutil.rmtree(tmp, ignore_errors=True)
+        return key
+
+    def clear(self):
+        '''
+        remove all cached partitions
+        '''
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._digests = {}
@@ -0,0 +1,293 @@
+'''
+cfdtools.pipeline
+
+run and post-process many cfd++ cases with overlapped stages
+
+each case goes through the stages
+
+    solve -> extract -> parse -> integrate -> persist
+
+every stage has its own worker threads, and the stages are connected by
+bounded queues: a stage blocks when the next one is full (backpressure), so a
+fast solver does not pile up extracted files faster than they are parsed. The
+stages run concurrently across cases, i.e. case N+1 is solved while case N is
+extracted and parsed. The parsing of Tecplot files (cpu bound) is done in a
+process pool.
+
+- `solve`       `cfdpp.run_cfd(**job.run)`, skipped if `job.run` is None
+- `extract`     exbc2do1 / npf2lin1 of `job.bcs` and `job.lines`
+- `parse`       `tec2py` of the extracted files, into `job.data[label]`
+- `integrate`   `cfdpp.read_flux` of `job.fluxes` into `job.result`, then the
+                function `integrate(job)` given to the pipeline
+- `persist`     the function `persist(job)` given to the pipeline, or a
+                `store.sweep_store` to save the case in
+
+a case failing in a stage is not run in the next stages, its exception is kept
+in `job.error`
+
+usage
+===
+
+>>> jobs = [case_job(cfdpp(d, core=16, verbose='None'), run={'step': 2000},
+>>>                  bcs={'wall': [3, 4]}, lines={'exit': ((0, 0, 0), (0, 1, 0))},
+>>>                  fluxes={'fx': ('fx', [3, 4])}) for d in dirs]
+>>> pipe = post_pipeline(integrate=my_integrate, persist=sweep_store('sweep.h5'))
+>>> for job in pipe.process(jobs):
+>>>     print(job.name, job.error or job.result)
+
+'''
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .tecplot import tec2py, merge_lines
+from .system import move_file
+
+PIPELINE_STAGES = ['solve', 'extract', 'parse', 'integrate', 'persist']
+
+# marks the end of the jobs in a queue
+_END = None
+
+
+class case_job():
+    '''
+    a case going through the pipeline
+
+    paras
+    ===
+    - `op`        a `cfdpp` object of the case
+    - `name`      name of the case, default is the folder name
+    - `run`       a dict of arguments of `cfdpp.run_cfd`, None to skip solving
+    - `bcs`       a dict of label -> bc numbers to extract, parsed and merged
+                  into one tecplot dict per label
+    - `lines`     a dict of label -> (st, ed) of lines to extract
+    - `fluxes`    a dict of label -> (typ, bc_series) of `cfdpp.read_flux`
+    - `is_sort`   `is_sort` of `tec2py` for the boundaries
+    - `merge`     merge the zones of the boundaries of a label into one, see
+                  `tecplot.merge_lines`
+    - `dedupe`    with `merge`, the variables of the points kept once
+    - `dtype`     dtype of the parsed arrays, `float32` halves the memory and
+                  the data sent back by the parsing processes
+
+    results
+    ===
+    - `files`     label -> extracted files
+    - `data`      label -> data in `cfdtools.tecplot` format
+    - `result`    label -> value of the fluxes, and what `integrate` returns
+    - `error`     the exception of the failed stage, None if none failed
+    - `times`     stage -> wall time (s)
+
+    '''
+
+    def __init__(self, op, name=None, run=None, bcs=None, lines=None, fluxes=None, is_sort=None, merge=False, dedupe=None,
+                 dtype='float64'):
+        self.op = op
+        self.name = name if name is not None else os.path.basename(os.path.normpath(op.op_dir))
+        self.run = run
+        self.bcs = bcs if bcs is not None else {}
+        self.lines = lines if lines is not None else {}
+        self.fluxes = fluxes if fluxes is not None else {}
+        self.is_sort = is_sort
+        self.merge = merge
+        self.dedupe = dedupe
+        self.dtype = dtype
+
+        self.files = {}
+        self.data = {}
+        self.result = {}
+        self.error = None
+        self.stage = None
+        self.times = {}
+
+    def __repr__(self):
+        return 'case_job(%s, stage=%s, error=%r)' % (self.name, self.stage, self.error)
+
+
+def _parse_files(files, is_sort=None, merge=False, dedupe=None, dtype='float64'):
+    '''
+    parse and merge the tecplot files of a label (the surface zones are kept
+    as they are), run in the process pool
+    '''
+    data = {'varnames': None, 'lines': [], 'surfaces': []}
+    for fname in files:
+        data_tmp = tec2py(fname, info=False, is_sort=is_sort, dtype=dtype)
+        if data['varnames'] is None:
+            data['varnames'] = data_tmp['varnames']
+        data['lines'] += data_tmp['lines']
+        data['surfaces'] += data_tmp['surfaces']
+    if merge:
+        data = merge_lines(data, is_sort=is_sort, dedupe=dedupe)
+    return data
+
+
+class post_pipeline():
+    '''
+    overlapped solve / extract / parse / integrate / persist of many cases
+
+    paras
+    ===
+    - `integrate`     function `integrate(job)`, its return is put in
+                      `job.result['integrate']`, default is None
+    - `persist`       function `persist(job)` or a `store.sweep_store`, default is None
+    - `workers`       a dict of stage -> number of worker threads, default is
+                      1 for every stage; `solve` workers run cases at the same time,
+                      so keep it to the number of cases the machine can hold
+    - `n_proc`        number of processes to parse the tecplot files, 0 to parse
+                      in the threads of the `parse` stage
+    - `maxsize`       size of the queues between the stages
+    - `forcenew`      extract again if the files exist
+    - `verbose`       print the stage of the cases if < 1
+
+    '''
+
+    def __init__(self, integrate=None, persist=None, workers=None, n_proc=2, maxsize=2, forcenew=True, verbose=1):
+        self.integrate = integrate
+        self.persist = persist
+        self.workers = {stage: 1 for stage in PIPELINE_STAGES}
+        if workers is not None:
+            self.workers.update(workers)
+        self.workers['parse'] = max(self.workers['parse'], n_proc)
+        self.n_proc = n_proc
+        self.maxsize = maxsize
+        self.forcenew = forcenew
+        self.verbose = verbose
+        self._pool = None
+
+    # ============================== stages ==============================
+
+    def solve(self, job):
+        if job.run is not None:
+            job.op.run_cfd(**job.run)
+
+    def extract(self, job):
+        op = job.op
+        for label, bc_series in job.bcs.items():
+            job.files[label] = op.extract_bc_files(bc_series, self.forcenew)
+        for label, (st, ed) in job.lines.items():
+            fname = op.extract_line_file(st, ed, self.forcenew)
+            # lineoutput_1.tec is written by every line
+            dst = os.path.join(op.op_dir, 'line_%s.tec' % label)
+            move_file(fname, dst)
+            job.files[label] = [dst]
+
+    def parse(self, job):
+        def args(label):
+            if label in job.bcs:
+                return job.is_sort, job.merge, job.dedupe, job.dtype
+            return None, False, None, job.dtype
+
+        if self._pool is not None:
+            futures = {label: self._pool.submit(_parse_files, files, *args(label))
+                       for label, files in job.files.items()}
+            for label, future in futures.items():
+                job.data[label] = future.result()
+        else:
+            for label, files in job.files.items():
+                job.data[label] = _parse_files(files, *args(label))
+
+    def integrate_job(self, job):
+        for label, (typ, bc_series) in job.fluxes.items():
+            job.result[label] = job.op.read_flux(typ, bc_series)
+        if self.integrate is not None:
+            job.result['integrate'] = self.integrate(job)
+
+    def persist_job(self, job):
+        if self.persist is None:
+            return
+        if hasattr(self.persist, 'add_case'):
+            self.persist.add_case(job.op, name=job.name, extracted=job.data, overwrite=True,
+                                  meta={'result': {k: v for k, v in job.result.items() if isinstance(v, (int, float))}})
+        else:
+            self.persist(job)
+
+    # ============================== run ==============================
+
+    def _worker(self, stage, func, q_in, q_out, n_alive, lock, stop):
+        while True:
+            job = q_in.get()
+            if job is _END:
+                # let the other workers of this stage see the end too, the
+                # last one passes it to the next stage
+                q_in.put(_END)
+                with lock:
+                    n_alive[stage] -= 1
+                    if n_alive[stage] == 0:
+                        q_out.put(_END)
+                return
+
+            # once the consumer stops, the jobs left are passed on without
+            # running the stage, so the pipeline drains to the end quickly
+            if job.error is None and not stop.is_set():
+                job.stage = stage
+                if self.verbose < 1: print('%s: %s' % (job.name, stage))
+                t0 = time.time()
+                try:
+                    func(job)
+                except Exception as e:
+                    job.error = e
+                    if self.verbose < 2: print('    [Warning] %s failed in %s: %r' % (job.name, stage, e))
+                job.times[stage] = time.time() - t0
+            q_out.put(job)
+
+    def process(self, jobs):
+        '''
+        run `jobs` (`case_job` objects) through the pipeline, yield them as
+        they finish; closing the generator early (a `break` or an exception in
+        the consumer) feeds no more jobs and skips the stages of the jobs left,
+        only waits for the stages running
+        '''
+        funcs = {'solve': self.solve, 'extract': self.extract, 'parse': self.parse,
+                 'integrate': self.integrate_job, 'persist': self.persist_job}
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in PIPELINE_STAGES] + [queue.Queue()]
+        n_alive = dict(self.workers)
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        if self.n_proc > 0:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_proc)
+            # start the worker processes now, forking them later from a stage
+            # thread can deadlock on locks held by the other threads
+            self._pool.submit(int).result()
+
+        threads = []
+        for i, stage in enumerate(PIPELINE_STAGES):
+            for _ in range(self.workers[stage]):
+                th = threading.Thread(target=self._worker, args=(stage, funcs[stage], queues[i], queues[i + 1], n_alive, lock, stop),
+                                      daemon=True)
+                th.start()
+                threads.append(th)
+
+        def feed():
+            for job in jobs:
+                if stop.is_set():
+                    break
+                queues[0].put(job)
+            queues[0].put(_END)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        try:
+            while True:
+                job = queues[-1].get()
+                if job is _END:
+                    break
+                job.stage = 'done' if job.error is None else job.stage
+                yield job
+        finally:
+            stop.set()
+            feeder.join()
+            for th in threads:
+                th.join()
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def run(self, jobs):
+        '''
+        run `jobs` through the pipeline, return them in the order they finish
+        '''
+        return list(self.process(jobs))
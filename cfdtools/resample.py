@@ -0,0 +1,210 @@
+'''
+cfdtools.resample
+
+put extracted lines and boundary distributions on a common grid
+
+the profiles (tecplot data of `cfdpp.extract_line`, `cfdpp.extract_bc`, or
+arrays in shape (number of variables, number of points)) are interpolated
+linearly on a grid of
+
+- arc length `s` along the points (in their order, i.e. a line of npf2lin1),
+  or
+- a variable, i.e. `X` (the points are sorted by it, i.e. the zones of a
+  boundary)
+
+the indexes and weights of a profile are computed once and cached by its
+coordinates, so they are used again for all the variables, and for the cases
+run on the same grid. All the profiles are interpolated in one call, the
+result is an array in shape
+(number of profiles, number of variables, number of grid points), to compare
+or difference the cases directly.
+
+usage
+===
+
+>>> rs = resampler(201, coord='s', normalize=True)
+>>> values = rs([op.extract_line(st, ed, True) for op in ops], variables=['P', 'T'])
+>>> dp = values[1:, 0] - values[0, 0]
+
+'''
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .tecplot import stack_lines
+
+SPACE_VARS = ['X', 'Y', 'Z']
+
+
+def arc_length(coords):
+    '''
+    arc length along the points, `coords` in shape (number of dimensions, number of points)
+    '''
+    coords = np.asarray(coords, dtype=float)
+    ds = np.sqrt(np.sum(np.diff(coords, axis=1) ** 2, axis=0))
+    return np.concatenate([[0.0], np.cumsum(ds)])
+
+
+def interp_weights(x, xi):
+    '''
+    linear interpolation from the points at `x` (in any order) to `xi`
+
+    return
+    ===
+    - `lo`, `hi`  indexes of the two points around each point of `xi`
+    - `w`         weights of `hi`, the value at `xi` is `v[lo] * (1 - w) + v[hi] * w`,
+                  the end values are held outside `x`
+    - `outside`   mask of the points of `xi` outside `x`
+    '''
+    x = np.asarray(x, dtype=float)
+    xi = np.asarray(xi, dtype=float)
+    if len(x) < 2:
+        raise ValueError('at least 2 points are needed to interpolate, %d given' % len(x))
+
+    order = None
+    if np.any(np.diff(x) < 0):
+        order = np.argsort(x, kind='stable')
+        x = x[order]
+
+    lo = np.clip(np.searchsorted(x, xi, side='right') - 1, 0, len(x) - 2)
+    hi = lo + 1
+    dx = x[hi] - x[lo]
+    w = np.divide(xi - x[lo], dx, out=np.zeros_like(xi), where=dx > 0)
+    w = np.clip(w, 0.0, 1.0)
+    outside = (xi < x[0]) | (xi > x[-1])
+
+    if order is not None:
+        lo, hi = order[lo], order[hi]
+    return lo, hi, w, outside
+
+
+class resampler():
+    '''
+    interpolate profiles on a common grid
+
+    paras
+    ===
+    - `grid`          the grid, an array, or a number of points evenly spaced
+                      on [0, 1] (with `normalize`)
+    - `coord`         `s` for the arc length along the points (of the
+                      variables in `SPACE_VARS` found), or a variable name
+    - `normalize`     scale the coordinate of each profile to [0, 1]
+    - `fill`          value outside a profile, None to hold the end values
+    - `maxsize`       number of weights kept in the cache
+
+    '''
+
+    def __init__(self, grid, coord='s', normalize=False, fill=np.nan, maxsize=256):
+        if np.isscalar(grid):
+            grid = np.linspace(0.0, 1.0, int(grid))
+        self.grid = np.asarray(grid, dtype=float)
+        self.coord = coord
+        self.normalize = normalize
+        self.fill = fill
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def coordinate(self, data, varnames):
+        '''
+        the coordinate of a profile, `data` in shape (number of variables, number of points)
+        '''
+        if self.coord == 's':
+            space = [varnames.index(v) for v in SPACE_VARS if v in varnames]
+            if len(space) == 0:
+                raise KeyError('No variable of %s in varlist: %s' % (SPACE_VARS, varnames))
+            x = arc_length(data[space])
+        else:
+            if self.coord not in varnames:
+                raise KeyError('No variable "%s" in varlist: %s' % (self.coord, varnames))
+            x = np.asarray(data[varnames.index(self.coord)], dtype=float)
+
+        if self.normalize:
+            x0, x1 = x.min(), x.max()
+            x = (x - x0) / (x1 - x0) if x1 > x0 else np.zeros_like(x)
+        return x
+
+    def weights(self, x):
+        '''
+        `interp_weights(x, grid)`, cached by the values of `x`
+        '''
+        x = np.ascontiguousarray(x, dtype=float)
+        key = hashlib.sha1(x.tobytes()).hexdigest()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+
+        self.misses += 1
+        result = interp_weights(x, self.grid)
+        self._cache[key] = result
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return result
+
+    def _profile(self, profile, varnames):
+        if isinstance(profile, dict):
+            if varnames is not None and profile['varnames'] != varnames:
+                raise ValueError('the profiles have different variables: %s, %s' % (varnames, profile['varnames']))
+            data, _ = stack_lines(profile['lines'])
+            return data, profile['varnames']
+        if varnames is None:
+            raise ValueError('varnames is needed for the profiles given as arrays')
+        return np.asarray(profile, dtype=float), varnames
+
+    def __call__(self, profiles, varnames=None, variables=None):
+        '''
+        interpolate the profiles on the grid
+
+        paras
+        ===
+        - `profiles`      a list of tecplot data (the line zones are taken one
+                          after another) or of arrays in shape
+                          (number of variables, number of points)
+        - `varnames`      the variable names of the profiles given as arrays
+        - `variables`     the variables returned, default is all
+
+        return
+        ===
+        array in shape (number of profiles, number of variables, number of grid points)
+        '''
+        weights = []
+        datas = []
+        for profile in profiles:
+            data, varnames = self._profile(profile, varnames)
+            weights.append(self.weights(self.coordinate(data, varnames)))
+            datas.append(data)
+
+        i_vars = slice(None)
+        if variables is not None:
+            for v in variables:
+                if v not in varnames:
+                    raise KeyError('No variable "%s" in varlist: %s' % (v, varnames))
+            i_vars = [varnames.index(v) for v in variables]
+        n_var = len(variables) if variables is not None else (len(varnames) if varnames is not None else 0)
+
+        # only the two points around each grid point are gathered, all the
+        # variables of a profile at once
+        values = np.empty((len(datas), n_var, len(self.grid)))
+        for i, (data, (lo, hi, w, outside)) in enumerate(zip(datas, weights)):
+            data = data[i_vars]
+            np.multiply(data[:, lo], 1.0 - w, out=values[i])
+            values[i] += data[:, hi] * w
+            if self.fill is not None:
+                values[i][:, outside] = self.fill
+        return values
+
+    def to_tdata(self, values, varnames, zonenames=None):
+        '''
+        tecplot data of the resampled profiles (one line zone a profile), with
+        the grid as the first variable
+        '''
+        name = self.coord if self.coord not in varnames else self.coord + '_grid'
+        lines = []
+        for i, profile in enumerate(values):
+            zonename = zonenames[i] if zonenames is not None else 'profile %d' % (i + 1)
+            lines.append({'data': [self.grid] + list(profile), 'zonename': zonename})
+        return {'varnames': [name] + list(varnames), 'lines': lines}
@@ -0,0 +1,194 @@
+'''
+cfdtools.shared
+
+share numpy arrays between processes without copies
+
+an array is published once into `multiprocessing.shared_memory` (`shm`) or a
+memory-mapped .npy file (`mmap`), and a small `shared_array` descriptor is sent
+to the workers (it pickles to a few hundred bytes). The workers attach to it as
+a read-only ndarray on the same memory, so the memory use does not grow with
+the number of workers.
+
+usage
+===
+
+>>> sa = shared_array.publish(data)             # in the main process
+>>> pool.map(work, [(sa, i) for i in range(n)])
+>>> sa.unlink()                                 # when all workers are done
+
+>>> def work(args):                             # in the workers
+>>>     sa, i = args
+>>>     data = sa.attach()
+
+'''
+
+import os
+import sys
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+
+# shared memory blocks attached in this process, to be reused and kept alive
+_attached = {}
+
+# held while `resource_tracker.register` is swapped out (python < 3.13), and
+# while shared memory is opened by other means, so no thread registers (or
+# skips registering) a block during the swap of another thread; also guards
+# `_attached`, so threads attaching to a block open it once
+_tracker_lock = threading.RLock()
+
+
+def _open_shm(name):
+    '''
+    attach to an existing shared memory block without registering it to the
+    resource tracker, which would unlink it when a worker exits
+    '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    if os.name == 'nt':
+        return shared_memory.SharedMemory(name=name)
+
+    from multiprocessing import resource_tracker
+    with _tracker_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class shared_array():
+    '''
+    descriptor of an array published to shared memory or a memory-mapped file
+
+    paras
+    ===
+    - `shape`, `dtype`    of the array
+    - `backend`           `shm` or `mmap`
+    - `name`              the name of the shared memory block (`shm`) or the
+                          path of the .npy file (`mmap`)
+
+    only these four attributes are pickled
+    '''
+
+    def __init__(self, shape, dtype, backend, name):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+        self.backend = backend
+        self.name = name
+        self._owner = None
+
+    def __getstate__(self):
+        return {'shape': self.shape, 'dtype': self.dtype, 'backend': self.backend, 'name': self.name}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._owner = None
+
+    def __repr__(self):
+        return 'shared_array(%s, %s, %s, %s)' % (self.shape, self.dtype, self.backend, self.name)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+    @classmethod
+    def create(cls, shape, dtype=np.float64, backend='shm', path=None):
+        '''
+        allocate a new shared array (zeros for `mmap`), return the descriptor;
+        the writable array is `sa.array`
+
+        paras
+        ===
+        - `backend`   `shm` for shared memory, `mmap` for a .npy file at `path`
+        - `path`      the .npy file of `mmap` backend
+
+        '''
+        if backend == 'shm':
+            nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            with _tracker_lock:
+                shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            sa = cls(shape, dtype, 'shm', shm.name)
+            sa._owner = shm
+            sa.array = np.ndarray(sa.shape, dtype=sa.dtype, buffer=shm.buf)
+        elif backend == 'mmap':
+            if path is None:
+                raise ValueError('path should be given for mmap backend')
+            sa = cls(shape, dtype, 'mmap', os.path.abspath(path))
+            sa.array = np.lib.format.open_memmap(sa.name, mode='w+', dtype=sa.dtype, shape=sa.shape)
+            sa._owner = sa.array
+        else:
+            raise KeyError('backend %s not in shm, mmap' % backend)
+        return sa
+
+    @classmethod
+    def publish(cls, arr, backend='shm', path=None):
+        '''
+        copy `arr` into a new shared array, return the descriptor
+        '''
+        arr = np.asarray(arr)
+        sa = cls.create(arr.shape, arr.dtype, backend=backend, path=path)
+        sa.array[...] = arr
+        if backend == 'mmap':
+            sa.array.flush()
+        return sa
+
+    def attach(self, writable=False):
+        '''
+        return a read-only ndarray on the shared data (no copy)
+
+        with `writable`, the array can be written, i.e. by workers filling
+        their own slices of an output array
+        '''
+        if self.backend == 'mmap':
+            arr = np.load(self.name, mmap_mode='r+' if writable else 'r')
+        else:
+            with _tracker_lock:
+                if self.name not in _attached:
+                    _attached[self.name] = _open_shm(self.name) if self._owner is None else self._owner
+            arr = np.ndarray(self.shape, dtype=self.dtype, buffer=_attached[self.name].buf)
+            arr.flags.writeable = writable
+        return arr
+
+    def close(self):
+        '''
+        detach this process from the shared data
+        '''
+        shm = _attached.pop(self.name, None)
+        if shm is not None and shm is not self._owner:
+            shm.close()
+
+    def unlink(self):
+        '''
+        free the shared data, called once by the process that published it
+        '''
+        self.close()
+        if self.backend == 'shm':
+            if self._owner is not None:
+                self.array = None
+                try:
+                    self._owner.close()
+                except BufferError:
+                    # arrays of this process still refer to it, the memory
+                    # is freed when they are released
+                    pass
+                self._owner.unlink()
+            else:
+                with _tracker_lock:
+                    shm = shared_memory.SharedMemory(name=self.name)
+                shm.close()
+                shm.unlink()
+        else:
+            self.array = None
+            self._owner = None
+            if os.path.exists(self.name):
+                os.remove(self.name)
+        self._owner = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
@@ -0,0 +1,224 @@
+'''
+cfdtools.stats
+
+running statistics (mean, variance, min, max) of flux histories and of
+extracted data, without keeping the samples
+
+the samples are added one by one (Welford's update) or by batches, and the
+statistics of two parts (i.e. the segments of a run, or the cases of a process
+pool) are merged exactly (Chan's update), so the averages of a case are built
+in python while it runs, without the averaging of the solver
+(`set_output_avg`) and the restart of `output_avg_field`.
+
+usage
+===
+
+>>> st = op.flux_stats('fx', [3, 4], st=2000)      # steps from 2000
+>>> op.run_cfd(restart=True, step=1000)
+>>> st = op.flux_stats('fx', [3, 4], stats=st)     # only the new steps (from st.next_step) are added
+>>> st.mean, st.std(), st.min, st.max
+
+>>> fs = field_stats()
+>>> for i in range(10):
+>>>     op.run_cfd(restart=True, step=100)
+>>>     fs.update(op.extract_bc([3, 4], True))
+>>> py2tec(fs.to_tdata('mean'), 'wall_mean.dat')
+
+'''
+
+import numpy as np
+
+from .tecplot import stack_lines
+
+
+class running_stats():
+    '''
+    running mean, variance, min and max of samples in shape `shape`
+
+    paras
+    ===
+    - `shape`     shape of a sample, () for scalars
+
+    `next_step` is the next step of a history to add, set by `cfdpp.flux_stats`
+    (None if the samples are not from a history)
+
+    '''
+
+    def __init__(self, shape=()):
+        self.n = 0
+        self.next_step = None
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def __repr__(self):
+        return 'running_stats(n=%d, shape=%s)' % (self.n, self.mean.shape)
+
+    def update(self, x):
+        '''
+        add a sample
+        '''
+        x = np.asarray(x, dtype=float)
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        np.minimum(self.min, x, out=self.min)
+        np.maximum(self.max, x, out=self.max)
+        return self
+
+    def update_batch(self, xs, axis=0):
+        '''
+        add the samples of `xs` along `axis`
+        '''
+        xs = np.moveaxis(np.asarray(xs, dtype=float), axis, 0)
+        n = xs.shape[0]
+        if n == 0:
+            return self
+        mean = xs.mean(axis=0)
+        m2 = ((xs - mean) ** 2).sum(axis=0)
+        return self._merge(n, mean, m2, xs.min(axis=0), xs.max(axis=0))
+
+    def _merge(self, n, mean, m2, vmin, vmax):
+        n_all = self.n + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / n_all)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.n * n / n_all)
+        self.min = np.minimum(self.min, vmin)
+        self.max = np.maximum(self.max, vmax)
+        self.n = n_all
+        return self
+
+    def merge(self, other):
+        '''
+        add the samples of `other` (a `running_stats`)
+        '''
+        if other.n == 0:
+            return self
+        return self._merge(other.n, other.mean, other.m2, other.min, other.max)
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def copy(self):
+        return running_stats.from_state(self.state())
+
+    def var(self, ddof=0):
+        '''
+        variance, nan if there are not more than `ddof` samples
+        '''
+        if self.n <= ddof:
+            return np.full(self.mean.shape, np.nan)
+        return self.m2 / (self.n - ddof)
+
+    def std(self, ddof=0):
+        '''
+        standard deviation
+        '''
+        return np.sqrt(self.var(ddof))
+
+    def state(self):
+        '''
+        the statistics as a dict of arrays
+        '''
+        return {'n': np.array(self.n), 'mean': self.mean.copy(), 'm2': self.m2.copy(),
+                'min': self.min.copy(), 'max': self.max.copy(),
+                'next_step': np.array(-1 if self.next_step is None else self.next_step)}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(np.shape(state['mean']))
+        obj.n = int(state['n'])
+        for key in ['mean', 'm2', 'min', 'max']:
+            setattr(obj, key, np.array(state[key], dtype=float))
+        if 'next_step' in state and int(state['next_step']) >= 0:
+            obj.next_step = int(state['next_step'])
+        return obj
+
+    def save(self, fname):
+        '''
+        save the statistics to a .npz file
+        '''
+        np.savez(fname, **self.state())
+
+    @classmethod
+    def load(cls, fname):
+        with np.load(fname) as f:
+            return cls.from_state(f)
+
+
+class field_stats():
+    '''
+    running statistics of the data extracted many times from a case (the same
+    boundaries or lines), point by point
+
+    paras
+    ===
+    - `varnames`  the variable names, default is those of the first data
+
+    '''
+
+    def __init__(self, varnames=None):
+        self.varnames = varnames
+        self.zones = None
+        self.offsets = None
+        self.stats = None
+
+    @property
+    def n(self):
+        return 0 if self.stats is None else self.stats.n
+
+    def update(self, tdata):
+        '''
+        add the line zones of `tdata` (the format of `tec2py`)
+        '''
+        if self.varnames is None:
+            self.varnames = list(tdata['varnames'])
+        elif list(tdata['varnames']) != self.varnames:
+            raise ValueError('the variables changed: %s, %s' % (self.varnames, tdata['varnames']))
+
+        data, offsets = stack_lines(tdata['lines'])
+        if self.stats is None:
+            self.zones = [line.get('zonename', 'ZONE %d' % (i + 1)) for i, line in enumerate(tdata['lines'])]
+            self.offsets = offsets
+            self.stats = running_stats(data.shape)
+        elif not np.array_equal(offsets, self.offsets):
+            raise ValueError('the zones changed, %d points in %d zones expected' % (self.offsets[-1], len(self.zones)))
+        self.stats.update(data)
+        return self
+
+    def merge(self, other):
+        '''
+        add the samples of `other` (a `field_stats` of the same zones)
+        '''
+        if other.stats is None:
+            return self
+        if self.stats is None:
+            self.varnames, self.zones, self.offsets = other.varnames, other.zones, other.offsets
+            self.stats = running_stats(other.stats.mean.shape)
+        elif not np.array_equal(other.offsets, self.offsets):
+            raise ValueError('the zones are different')
+        self.stats.merge(other.stats)
+        return self
+
+    def to_tdata(self, kind='mean', ddof=0):
+        '''
+        tecplot data of a statistic, `kind` is `mean`, `std`, `var`, `min` or `max`
+        '''
+        if self.stats is None:
+            raise ValueError('no data added')
+        if kind in ['std', 'var']:
+            data = getattr(self.stats, kind)(ddof)
+        elif kind in ['mean', 'min', 'max']:
+            data = getattr(self.stats, kind)
+        else:
+            raise KeyError('unknown statistic %s' % kind)
+
+        lines = []
+        for zonename, st, ed in zip(self.zones, self.offsets[:-1], self.offsets[1:]):
+            lines.append({'data': list(data[:, st:ed]), 'zonename': '%s %s' % (zonename, kind)})
+        return {'varnames': self.varnames, 'lines': lines}
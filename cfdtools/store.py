@@ -0,0 +1,287 @@
+'''
+cfdtools.store
+
+consolidate the results of a sweep of cfd++ cases into one HDF5 file
+
+for each case the FFM history (`cfdpp.FFM_data`), the areas, the extracted
+boundaries and lines (in `cfdtools.tecplot` format) and the metadata (mcfd.inp
+parameters, infoset values, or anything given) are saved in
+
+    /cases/<name>/FFM_data          (n_step, n_bc, 8), chunked along steps and bc
+    /cases/<name>/areas             (n_bc, 4)
+    /cases/<name>/extracted/<label>/zone_<i>     (n_var, n_point)
+    /cases/<name>/extracted/<label>/surface_<i>/var_<j>, elements
+    /cases/<name>.attrs['meta']     json of the metadata
+
+cases can be added while the sweep is running, and the FFM history of a case can
+be appended as new steps are computed. The HDF5 file is opened for each
+operation, so the store can be used from short-lived processes.
+
+requires h5py
+
+usage
+===
+
+>>> st = sweep_store('sweep.h5')
+>>> st.add_case(op, name='ma0.8', paras=['ntstep'], infsets=[8], extracted={'wall': op.extract_bc([3], False)})
+>>> names, fx = st.query('fx', [3], last=200)      # (n_case, 200)
+
+'''
+
+import os
+import json
+import numpy as np
+
+from .cfdpp import typ_dict
+
+# the zone header of a surface kept in the attrs (as `tecplot._NPZ_KEYS`, which
+# is not imported to keep `cfdtools.tecplot` out of the store)
+_TEC_KEYS = ['zonename', 'zonetype', 'datapacking', 'varloc', 'size', 'solutiontime', 'strandid']
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('h5py is required by cfdtools.store, install it with `pip install h5py`')
+    return h5py
+
+
+class sweep_store():
+    '''
+    HDF5 store of the results of many cases
+
+    paras
+    ===
+    - `fname`         the HDF5 file, created if not exist
+    - `compression`   compression of the datasets, `gzip`, `lzf` or None
+    - `chunk_step`    number of steps in a chunk of FFM history
+
+    '''
+
+    def __init__(self, fname, compression='gzip', chunk_step=256):
+        self.fname = fname
+        self.compression = compression
+        self.chunk_step = chunk_step
+        with self._open('a') as f:
+            f.require_group('cases')
+
+    def _open(self, mode='r'):
+        return _h5py().File(self.fname, mode)
+
+    def case_names(self):
+        '''
+        names of the cases in the store, in the order they are added
+        '''
+        with self._open() as f:
+            names = list(f['cases'].keys())
+            order = [f['cases'][n].attrs.get('order', 0) for n in names]
+        return [n for _, n in sorted(zip(order, names))]
+
+    def __contains__(self, name):
+        with self._open() as f:
+            return name in f['cases']
+
+    def add_case(self, op, name=None, paras=None, infsets=None, extracted=None, meta=None, overwrite=False):
+        '''
+        save a `cfdpp` case to the store
+
+        paras
+        ===
+        - `op`          a `cfdpp` object, its FFM history is read if not yet
+        - `name`        name of the case, default is the folder name
+        - `paras`       a list of keys in mcfd.inp to save in the metadata
+        - `infsets`     a list of infoset numbers whose values are saved in the metadata
+        - `extracted`   a dict of label -> data from `extract_bc` / `extract_line`
+        - `meta`        a dict of other metadata (should be json serializable)
+        - `overwrite`   replace the case if it is already in the store
+
+        '''
+        if name is None:
+            name = os.path.basename(os.path.normpath(op.op_dir))
+        if op.FFM_data is None:
+            op.read_FFM_history()
+
+        info = {'op_dir': op.op_dir}
+        if paras is not None:
+            info['paras'] = {key: op.read_para(key) for key in paras}
+        if infsets is not None:
+            info['infsets'] = {str(i): op.read_infset(i) for i in infsets}
+        if meta is not None:
+            info.update(meta)
+
+        with self._open('a') as f:
+            cases = f['cases']
+            if name in cases:
+                if not overwrite:
+                    raise KeyError('case %s already in %s' % (name, self.fname))
+                del cases[name]
+            # after the next one, the cases deleted leave gaps in the order
+            order = max([cases[n].attrs.get('order', 0) for n in cases] + [-1]) + 1
+            grp = cases.create_group(name)
+            grp.attrs['order'] = order
+            grp.attrs['meta'] = json.dumps(info)
+            self._write_FFM(grp, op.FFM_data)
+            grp.create_dataset('areas', data=op.areas)
+
+            if extracted is not None:
+                for label, tdata in extracted.items():
+                    self._write_tec(grp.require_group('extracted'), label, tdata)
+
+    def _write_FFM(self, grp, data):
+        n_step, n_bc, n_var = data.shape
+        grp.create_dataset('FFM_data', data=data, maxshape=(None, n_bc, n_var),
+                           chunks=(max(min(self.chunk_step, n_step), 1), 1, n_var), compression=self.compression)
+
+    def _write_tec(self, grp, label, tdata):
+        if label in grp:
+            del grp[label]
+        sub = grp.create_group(label)
+        sub.attrs['varnames'] = json.dumps(tdata['varnames'])
+        for i, zone in enumerate(tdata['lines']):
+            ds = sub.create_dataset('zone_%d' % i, data=np.array(zone['data']), compression=self.compression)
+            ds.attrs['zonename'] = zone.get('zonename', 'zone %d' % i)
+        # the variables of a surface differ in shape (nodal or cell-centered),
+        # so each one is a dataset, the zone header is kept in the attrs
+        for i, zone in enumerate(tdata.get('surfaces', [])):
+            zgrp = sub.create_group('surface_%d' % i)
+            for j, d in enumerate(zone['data']):
+                zgrp.create_dataset('var_%d' % j, data=np.asarray(d), compression=self.compression)
+            if 'elements' in zone:
+                zgrp.create_dataset('elements', data=np.asarray(zone['elements']), compression=self.compression)
+            header = {key: zone[key] for key in _TEC_KEYS if key in zone}
+            if 'size' in header:
+                header['size'] = [int(n) for n in header['size']]
+            zgrp.attrs['header'] = json.dumps(header)
+
+    def append_FFM(self, name, data):
+        '''
+        append new steps (n_new, n_bc, 8) to the FFM history of case `name`
+
+        return
+        ===
+        the number of steps stored
+        '''
+        with self._open('a') as f:
+            ds = f['cases'][name]['FFM_data']
+            n_old = ds.shape[0]
+            ds.resize(n_old + data.shape[0], axis=0)
+            ds[n_old:] = data
+            return ds.shape[0]
+
+    def update_FFM(self, op, name=None):
+        '''
+        append the steps of `op.FFM_data` that are not yet in the store
+        '''
+        if name is None:
+            name = os.path.basename(os.path.normpath(op.op_dir))
+        with self._open() as f:
+            n_old = f['cases'][name]['FFM_data'].shape[0]
+        if op.FFM_data.shape[0] > n_old:
+            return self.append_FFM(name, op.FFM_data[n_old:])
+        return n_old
+
+    def add_extracted(self, name, label, tdata):
+        '''
+        save extracted data (from `extract_bc` / `extract_line`) of case `name`
+        '''
+        with self._open('a') as f:
+            self._write_tec(f['cases'][name].require_group('extracted'), label, tdata)
+
+    def meta(self, name):
+        with self._open() as f:
+            return json.loads(f['cases'][name].attrs['meta'])
+
+    def read_FFM(self, name, steps=None, bcs=None, typs=None):
+        '''
+        read a slice of the FFM history of case `name`
+
+        paras
+        ===
+        - `steps`     a slice of steps, default is all
+        - `bcs`       a list of bc numbers (start from 1), default is all
+        - `typs`      a list of flux types in `typ_dict`, default is all
+
+        return
+        ===
+        array in shape (n_step, n_bc, n_typ)
+        '''
+        with self._open() as f:
+            ds = f['cases'][name]['FFM_data']
+            sel = ds[_step_slice(steps, ds.shape[0])]
+        if bcs is not None:
+            sel = sel[:, [i - 1 for i in bcs]]
+        if typs is not None:
+            sel = sel[:, :, [typ_dict[t] for t in typs]]
+        return sel
+
+    def read_areas(self, name):
+        with self._open() as f:
+            return f['cases'][name]['areas'][()]
+
+    def read_extracted(self, name, label):
+        '''
+        return the extracted data of case `name` in `cfdtools.tecplot` format
+        '''
+        with self._open() as f:
+            sub = f['cases'][name]['extracted'][label]
+            keys = lambda kind: sorted([k for k in sub.keys() if k.startswith(kind + '_')], key=lambda k: int(k.split('_')[1]))
+            tdata = {'varnames': json.loads(sub.attrs['varnames']),
+                     'lines': [{'zonename': sub[z].attrs['zonename'], 'data': [d for d in sub[z][()]]} for z in keys('zone')],
+                     'surfaces': []}
+            for z in keys('surface'):
+                zgrp = sub[z]
+                zone = json.loads(zgrp.attrs['header'])
+                if 'size' in zone:
+                    zone['size'] = tuple(zone['size'])
+                n_var = len([k for k in zgrp.keys() if k.startswith('var_')])
+                zone['data'] = [zgrp['var_%d' % j][()] for j in range(n_var)]
+                if 'elements' in zgrp:
+                    zone['elements'] = zgrp['elements'][()]
+                tdata['surfaces'].append(zone)
+            return tdata
+
+    def query(self, typ, bc_series, last=None, steps=None, cases=None):
+        '''
+        read flux `typ` summed over `bc_series` for many cases
+
+        paras
+        ===
+        - `typ`         flux type in `typ_dict`
+        - `bc_series`   bc numbers (start from 1) to read and sum
+        - `last`        read the last `last` steps (0 reads none)
+        - `steps`       or, a slice of steps (used when `last` is None)
+        - `cases`       the case names, default is all
+
+        return
+        ===
+        `names`, `values`   the names of the cases, and a (n_case, n_step)
+                            array, or a list of arrays if the cases have
+                            different numbers of steps
+
+        '''
+        if cases is None:
+            cases = self.case_names()
+        if last is not None:
+            steps = slice(-last, None) if last > 0 else slice(0, 0)
+
+        int_typ = typ_dict[typ]
+        values = []
+        with self._open() as f:
+            for name in cases:
+                ds = f['cases'][name]['FFM_data']
+                sl = _step_slice(steps, ds.shape[0])
+                # read bc by bc to only touch the chunks of `bc_series`
+                values.append(sum([ds[sl, i_bc - 1, int_typ] for i_bc in bc_series]))
+
+        if len(set([len(v) for v in values])) == 1:
+            values = np.array(values)
+        return cases, values
+
+
+def _step_slice(steps, n_step):
+    '''
+    convert `steps` (None or slice with negative indexes) to a positive slice
+    '''
+    if steps is None:
+        return slice(0, n_step)
+    return slice(*steps.indices(n_step))
@@ -1,12 +1,136 @@
 
 
 import subprocess
-import tempfile
+import collections
+import threading
+import shutil
+import signal
+import time
+import hashlib
 
 import os
 
 
-def cmd(command, path=None, wait=None, buffering=10*100):
+class output_capture():
+    '''
+    read the output of a process in a background thread while it runs, so
+    the pipe never blocks the process, and keep only the last lines
+
+    paras
+    ===
+    - `max_lines`     number of the last lines kept, None to keep all
+    - `on_line`       function `on_line(line)` called with each line (bytes)
+                      as it is read, i.e. to parse the progress of a run
+    - `tee`           a file name or a binary file object, all the output is
+                      written in it
+
+    '''
+
+    def __init__(self, max_lines=10000, on_line=None, tee=None):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.on_line = on_line
+        self.tee = tee
+        self.n_line = 0
+        self.n_byte = 0
+        self.error = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._tee_file = None
+        self._closed = False
+
+    def start(self, pipe):
+        '''
+        start a thread to drain `pipe` (a binary file object)
+        '''
+        if self.tee is not None and self._tee_file is None:
+            self._tee_file = open(self.tee, 'wb') if isinstance(self.tee, (str, os.PathLike)) else self.tee
+        th = threading.Thread(target=self._drain, args=(pipe,), daemon=True)
+        th.start()
+        self._threads.append(th)
+
+    def _drain(self, pipe):
+        # read by blocks of what is available and split in lines here (not a
+        # readline per line); an unfinished line is cut at 64 kB, the memory is
+        # bounded for any output
+        read = getattr(pipe, 'read1', pipe.read)
+        rest = b''
+        while True:
+            block = read(1 << 16)
+            if not block:
+                break
+            parts = (rest + block).split(b'\n')
+            rest = parts.pop()
+            lines = [part + b'\n' for part in parts]
+            while len(rest) >= 1 << 16:
+                lines.append(rest[:1 << 16])
+                rest = rest[1 << 16:]
+            self._add(block, lines)
+        if rest:
+            self._add(b'', [rest])
+        pipe.close()
+
+    def _add(self, block, lines):
+        with self._lock:
+            self.n_byte += len(block)
+            if self._tee_file is not None:
+                self._tee_file.write(block)
+            if self._closed:
+                # after `join`, the output of the sub-processes left is only drained
+                return
+            self.n_line += len(lines)
+            if self.on_line is None and self.lines.maxlen is not None:
+                lines = lines[-self.lines.maxlen:]
+            self.lines.extend(lines)
+        if self.on_line is not None:
+            for line in lines:
+                if self.error is not None:
+                    break
+                try:
+                    self.on_line(line)
+                except Exception as e:
+                    # stop calling it, the error is raised after the process ends
+                    self.error = e
+
+    def join(self, timeout=None, idle=None):
+        '''
+        wait for the end of the output, close the tee file if opened here,
+        return whether all the output is read
+
+        paras
+        ===
+        - `timeout`   seconds to wait at most, None to wait for the end
+        - `idle`      stop waiting once nothing is read for `idle` seconds, i.e.
+                      the process ended but a sub-process it started in the
+                      background (a daemon of mpiexec) keeps the pipe open
+
+        the output read after `join` is not kept, the pipe is only drained
+        '''
+        t_end = None if timeout is None else time.monotonic() + timeout
+        for th in self._threads:
+            while th.is_alive():
+                n_byte = self.n_byte
+                wait = idle
+                if t_end is not None:
+                    left = max(t_end - time.monotonic(), 0.0)
+                    wait = left if wait is None else min(wait, left)
+                th.join(wait)
+                if t_end is not None and time.monotonic() >= t_end:
+                    break
+                if idle is not None and self.n_byte == n_byte:
+                    break
+        done = not any(th.is_alive() for th in self._threads)
+        with self._lock:
+            self._closed = True
+            if self._tee_file is not None:
+                if self._tee_file is not self.tee:
+                    self._tee_file.close()
+                else:
+                    self._tee_file.flush()
+                self._tee_file = None
+        return done
+
+
+def cmd(command, path=None, wait=None, buffering=-1, env=None, max_lines=10000, on_line=None, tee=None, check=False):
 
     '''
     open a new cmd window(minium), and conduct `command`
@@ -14,12 +138,26 @@ def cmd(command, path=None, wait=None, buffering=10*100):
     paras:
     ---
     `command`   : command to be conducted
+                  if it is a list of arguments, the program is started directly
+                  without a shell
 
     `path`      : change the cmd window to path, default is None
 
     `wait`      : kill the process after wait time (in second)
+
+    `env`       : a dict of additional environment variables, default is None
     
-    `buffering` : buffering to avoid block of `subprocess.Popen`
+    `buffering` : buffer size of the output pipe, -1 is the default of `io`
+
+    `max_lines` : number of the last output lines returned, None for all
+
+    `on_line`   : function `on_line(line)` called with each output line (in
+                  byte) while the process runs, i.e. to parse the progress
+
+    `tee`       : a file name or a binary file object, all the output is written in it
+
+    `check`     : raise a `subprocess.CalledProcessError` (its `output` is the
+                  last output lines) if the process exits with a non-zero code
 
     return:
     ---
@@ -33,14 +171,21 @@ def cmd(command, path=None, wait=None, buffering=10*100):
                       a `TimeoutError` is raised with infomation about which 
                       command is timeout and which PID is killed
 
+    `subprocess.CalledProcessError`   : with `check`, when the exit code is not 0
+
     remark:
     ---
-    the function is based on `subprocess.Popen`, which may have block problem
+    stdout and stderr are read together by a background thread while the
+    process runs (`output_capture`), the memory is bounded by `max_lines`
+    whatever the volume of the output
 
-    based on `taskkill` to kill all sub-process\n
+    based on `taskkill` to kill all sub-process on Windows\n
     - /F  : forced to kill
     - /T  : kill all sub-process
 
+    on other systems the process is started in a new session, and the whole
+    process group is killed
+
     usage:
     ---
 
@@ -54,37 +199,274 @@ def cmd(command, path=None, wait=None, buffering=10*100):
     '''
 
 
-    if path is not None:
+    shell = isinstance(command, str)
+    if shell and path is not None:
         command = 'cd %s && ' % path + command
-    
+
+    capture = output_capture(max_lines=max_lines, on_line=on_line, tee=tee)
+    obj = subprocess.Popen(command, shell=shell, cwd=None if shell else path, stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT, bufsize=buffering,
+                           env=None if not env else dict(os.environ, **env), start_new_session=(os.name != 'nt'))
     try:
-        out_tmp = tempfile.SpooledTemporaryFile(buffering=buffering)
-        fileno = out_tmp.fileno()
-        obj = subprocess.Popen(command, shell=True, stdout=fileno, stderr=fileno)
+        capture.start(obj.stdout)
         if wait is not None:
             obj.wait(wait)
         else:
             obj.wait()
 
-        out_tmp.seek(0)
-        lines = out_tmp.readlines()
-    
     except subprocess.TimeoutExpired as e:
+        info = _kill_tree(obj)
+        capture.join(timeout=5)
+        raise TimeoutError(str(e)+'\n' + info)
+
+    finally:
+        # the output left in the pipe is read, but a background sub-process
+        # holding the pipe open does not block the return
+        capture.join(timeout=None if obj.returncode is not None else 5, idle=0.2)
+
+    if capture.error is not None:
+        raise capture.error
+    if check and obj.returncode != 0:
+        raise subprocess.CalledProcessError(obj.returncode, command, output=b''.join(capture.lines))
+
+    return list(capture.lines)
+
+
+def _kill_tree(obj):
+    '''
+    kill the process `obj` and all its sub-processes, return the info line
+    '''
+    info_line = '>>>   Info:\n'
+    if os.name == 'nt':
         p = subprocess.Popen("taskkill /F /T /PID %s" %obj.pid, shell=True, stdout=subprocess.PIPE)
         info = p.stdout.readlines()
-        info_line = '>>>   Info:\n'
         for line in info:
             info_line += ('         ' + line.decode('gbk'))
-        raise TimeoutError(str(e)+'\n' + info_line)
+    else:
+        try:
+            os.killpg(obj.pid, signal.SIGKILL)
+            info_line += '         process group %d killed\n' % obj.pid
+        except ProcessLookupError:
+            info_line += '         process group %d already exited\n' % obj.pid
+    obj.wait()
+    return info_line
 
-    finally:
-        if out_tmp:
-            out_tmp.close()
 
-    return lines
+def remove_file(fname):
+    '''
+    remove file `fname` if it exists, without starting a shell
+    '''
+    try:
+        os.remove(fname)
+    except FileNotFoundError:
+        pass
+
+
+def move_file(src, dst):
+    '''
+    move (rename) file `src` to `dst`, `dst` is replaced if it exists
+    '''
+    os.replace(src, dst)
+
+
+def replace_file(src, dst, backup=None, retries=10, delay=0.05):
+    '''
+    replace file `dst` by `src` atomically, `dst` always exists (old or new)
+
+    paras
+    ===
+    - `backup`    keep the old `dst` as `backup` (hard link, or copy if links
+                  are not supported), default is None
+    - `retries`   number of retries if the file is still locked by a
+                  program (on Windows), the delay is doubled each time
+
+    '''
+    for i in range(retries + 1):
+        try:
+            if backup is not None and os.path.exists(dst):
+                remove_file(backup)
+                try:
+                    os.link(dst, backup)
+                except OSError:
+                    shutil.copy2(dst, backup)
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if i == retries:
+                raise
+            time.sleep(delay * 2**i)
+
+
+def link_or_copy(src, dst):
+    '''
+    hard link file `src` to `dst` (copy if links are not supported, i.e.
+    across file systems), `dst` is replaced if it exists
+    '''
+    remove_file(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def file_digest(fname, chunk=1 << 24):
+    '''
+    sha256 of file `fname`
+    '''
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        while True:
+            buf = f.read(chunk)
+            if len(buf) == 0:
+                break
+            h.update(buf)
+    return h.hexdigest()
 
 
-def cfdpp_cmd(command, path=None, wait=None, buffering=10*100):
+def remove_dir(path):
+    '''
+    remove folder `path` and everything in it
+    '''
+    shutil.rmtree(path, ignore_errors=True)
+
+
+MPICH2_WINDOWS = 'C:\\Program Files\\MPICH2\\bin\\mpiexec.exe'
+
+
+class mpi_launcher():
+    '''
+    build and run the command line of a MPI program
+
+    paras
+    ===
+    - `exe`         the launcher executable, default is `self.default_exe`
+    - `hostfile`    a host file for multi-node runs, default is None (local run)
+    - `extra_args`  a list of additional arguments given before the program
+
+    the sub-classes define `args(n_proc, program)` for each MPI implementation
+    '''
+
+    default_exe = 'mpiexec'
+
+    def __init__(self, exe=None, hostfile=None, extra_args=None):
+        self.exe = exe if exe is not None else self.default_exe
+        self.hostfile = hostfile
+        self.extra_args = list(extra_args) if extra_args is not None else []
+
+    def args(self, n_proc, program):
+        raise NotImplementedError()
+
+    def env(self):
+        '''
+        additional environment variables of the run
+        '''
+        return {}
+
+    def run(self, n_proc, program, path=None, wait=None, **kwargs):
+        '''
+        run `program` (a str or a list of arguments) with `n_proc` processes
+        in folder `path`, and return the output lines
+
+        `kwargs` (`max_lines`, `on_line`, `tee`, `check`) are given to `cmd`
+        '''
+        if isinstance(program, str):
+            program = [program]
+        args = self.args(n_proc, program)
+        return cmd(args, path=path, wait=wait, env=self.env(), **kwargs)
+
+
+class mpiexec_launcher(mpi_launcher):
+    '''
+    `mpiexec` of MPICH / Intel MPI, local only if no host file is given
+    '''
+
+    default_exe = 'mpiexec'
+
+    def __init__(self, exe=None, hostfile=None, extra_args=None):
+        if exe is None and os.name == 'nt' and os.path.exists(MPICH2_WINDOWS):
+            exe = MPICH2_WINDOWS
+        super().__init__(exe, hostfile, extra_args)
+
+    def args(self, n_proc, program):
+        if self.hostfile is None:
+            host = ['-localonly'] if os.name == 'nt' else []
+        else:
+            host = ['-machinefile', self.hostfile]
+        return [self.exe] + host + ['-np', str(n_proc)] + self.extra_args + program
+
+
+class mpirun_launcher(mpi_launcher):
+    '''
+    `mpirun` of Open MPI
+    '''
+
+    default_exe = 'mpirun'
+
+    def args(self, n_proc, program):
+        host = [] if self.hostfile is None else ['--hostfile', self.hostfile]
+        return [self.exe] + host + ['-np', str(n_proc)] + self.extra_args + program
+
+
+class srun_launcher(mpi_launcher):
+    '''
+    `srun` of Slurm, the host file is given with `SLURM_HOSTFILE`
+    '''
+
+    default_exe = 'srun'
+
+    def args(self, n_proc, program):
+        host = [] if self.hostfile is None else ['--distribution=arbitrary']
+        return [self.exe, '-n', str(n_proc)] + host + self.extra_args + program
+
+    def env(self):
+        return {} if self.hostfile is None else {'SLURM_HOSTFILE': self.hostfile}
+
+
+class local_launcher(mpi_launcher):
+    '''
+    run the program directly without MPI (for single core or test)
+    '''
+
+    default_exe = ''
+
+    def args(self, n_proc, program):
+        return self.extra_args + program
+
+
+launchers = {
+    'mpiexec':  mpiexec_launcher,
+    'mpirun':   mpirun_launcher,
+    'srun':     srun_launcher,
+    'local':    local_launcher
+}
+
+
+def get_launcher(launcher=None, **kwargs):
+    '''
+    return a `mpi_launcher` object
+
+    paras
+    ===
+    - `launcher`    a `mpi_launcher` object, or its name in `launchers`
+        - if is None, `mpiexec` is used on Windows and `mpirun` on other systems
+    - `kwargs`      given to the launcher when it is created by name
+
+    '''
+    if isinstance(launcher, mpi_launcher):
+        return launcher
+    if launcher is None:
+        launcher = 'mpiexec' if os.name == 'nt' else 'mpirun'
+    if launcher not in launchers:
+        raise KeyError('launcher %s not in %s' % (launcher, ', '.join(launchers.keys())))
+    return launchers[launcher](**kwargs)
+
+
+def cfdpp_cmd(command, path=None, wait=None, buffering=-1, env=None, **kwargs):
+    '''
+    same as `cmd`, and remove the `mlog` folder created by CFD++ tools
+
+    `kwargs` (`max_lines`, `on_line`, `tee`) are given to `cmd`
+    '''
     mlogflag = False
 
     if path is not None:
@@ -96,10 +478,10 @@ def cfdpp_cmd(command, path=None, wait=None, buffering=10*100):
         mlogflag = True
 
     try:
-        lines = cmd(command=command, path=path, wait=wait, buffering=buffering)
+        lines = cmd(command=command, path=path, wait=wait, buffering=buffering, env=env, **kwargs)
     
     finally:
         if not mlogflag and os.path.exists(mlogPath):
-            os.system('rmdir /s /q  %s' % mlogPath)
+            remove_dir(mlogPath)
 
-    return lines
\ No newline at end of file
+    return lines
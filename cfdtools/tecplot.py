@@ -1,4 +1,5 @@
 
+import io
 import numpy as np
 import re
 
@@ -43,7 +44,7 @@ def _formatnp(data):
 
     dataForm = []
     for i, idata in enumerate(data):
-        if np.issubsctype(idata, np.integer):
+        if np.issubdtype(np.asarray(idata).dtype, np.integer):
             dataForm.append('{:d}')
         else:
             dataForm.append('{:e}')
@@ -188,11 +189,7 @@ def py2tec(tdata, fname):
                 _writeZoneHeader(fid, line, [nx], izone)
 
                 # write data
-                dataFormat = _formatnp(line['data']) + '\n'
-                # nvar = len(tdata['varnames']) - len(passivevarlist)
-                for ix in range(nx):
-                    d = [j[ix] for j in line['data']]
-                    fid.write(dataFormat.format(*d))
+                _write_points(fid, line['data'])
 
                 fid.write('\n')
         # =========================== Write 2D surface ================================
@@ -256,147 +253,651 @@ def py2tec(tdata, fname):
                     fid.write(_nparray2string(data.T))
                 fid.write('\n\n')
 
-def tec2py(datfile, info=True, is_sort=None):
+def _value_format(arr):
+    return '%d' if np.issubdtype(arr.dtype, np.integer) else '%e'
+
+def _write_points(fid, data, chunk=1 << 16):
+    '''
+    write the arrays of `data` (same size) in POINT packing, one point a row,
+    `chunk` rows are formatted at once
+    '''
+    data = [np.asarray(d).ravel() for d in data]
+    n = len(data[0]) if len(data) > 0 else 0
+    row = ' '.join([_value_format(d) for d in data]) + '\n'
+    for st in range(0, n, chunk):
+        ed = min(st + chunk, n)
+        values = np.stack([d[st:ed] for d in data], axis=1).ravel().tolist()
+        fid.write(row * (ed - st) % tuple(values))
+
+def _write_block(fid, arr, per_line=10, chunk=1 << 16):
+    '''
+    write the values of `arr` in BLOCK packing, `per_line` values a row,
+    `chunk` rows are formatted at once
+    '''
+    arr = np.asarray(arr).ravel()
+    fmt = _value_format(arr)
+    n_full = len(arr) // per_line * per_line
+    row = ' '.join([fmt] * per_line) + '\n'
+    for st in range(0, n_full, chunk * per_line):
+        ed = min(st + chunk * per_line, n_full)
+        fid.write(row * ((ed - st) // per_line) % tuple(arr[st:ed].tolist()))
+    if n_full < len(arr):
+        fid.write(' '.join([fmt] * (len(arr) - n_full)) % tuple(arr[n_full:].tolist()) + '\n')
+
+
+class tec_writer():
+    '''
+    write a tecplot ASCII file zone by zone, i.e. a time history of surfaces
+    as zones of a strand, without holding all the zones in memory
+
+    paras
+    ===
+    - `fname`     the tecplot file
+    - `varnames`  a list of variable names
+    - `title`     title of the file
+    - `chunk`     number of points formatted at once
+
+    usage
+    ===
+
+    >>> with tec_writer('history.dat', ['X', 'Y', 'P']) as tw:
+    >>>     for t, p in history:
+    >>>         tw.write_zone([x, y, p], zonename='t=%g' % t, solutiontime=t, strandid=1)
+
+    the zones read by `tec2py` can be written back by `tw.write_zone(**zone)`
+    '''
+
+    def __init__(self, fname, varnames, title=None, chunk=1 << 16):
+        self.fname = fname
+        self.varnames = list(varnames)
+        self.chunk = chunk
+        self.nzone = 0
+        self.fid = open(fname, 'w', encoding='utf-8', buffering=1 << 20)
+        if title is not None:
+            self.fid.write('TITLE = "{:s}"\n'.format(title))
+        self.fid.write('VARIABLES = {:s}\n'.format(','.join(['"{:s}"'.format(i) for i in self.varnames])))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_zone(self, data, zonename=None, zonetype='ORDERED', datapacking='POINT', varloc=None,
+                   elements=None, solutiontime=None, strandid=None, size=None):
+        '''
+        write a zone
+
+        paras
+        ===
+        - `data`          a list of numpy arrays of each variable, in shape (I,),
+                          (J, I) or (K, J, I) for ordered zones, (NODES,) or
+                          (ELEMENTS,) for FE zones
+        - `zonename`      name of the zone, default is `ZONE` + No.
+        - `zonetype`      `ORDERED`, or a FE zone type (`FETRIANGLE`, `FEQUADRILATERAL`, ...)
+        - `datapacking`   `POINT` or `BLOCK`
+        - `varloc`        a list of 0 (nodal) or 1 (cell centered) of each
+                          variable, cell centered variables need `BLOCK`
+        - `elements`      FE zones: node indexes (from 0) of the elements, in
+                          shape (ELEMENTS, nodes of an element)
+        - `solutiontime`, `strandid`  the time and strand of the zone
+        - `size`          (K, J, I) or (NODES, ELEMENTS), default is from the arrays
+        '''
+        if self.fid is None:
+            raise IOError('%s is closed' % self.fname)
+        if len(data) != len(self.varnames):
+            raise ValueError('%d variables expected, %d given' % (len(self.varnames), len(data)))
+        zonetype = zonetype.upper()
+        datapacking = datapacking.upper()
+        varloc = [0] * len(data) if varloc is None else list(varloc)
+        if 1 in varloc and datapacking != 'BLOCK':
+            raise ValueError('cell centered variables need BLOCK packing')
+        nodal = [d for d, loc in zip(data, varloc) if loc == 0]
+
+        if zonetype == 'ORDERED':
+            if elements is not None:
+                raise ValueError('elements are given for an ORDERED zone')
+            if size is None:
+                if len(nodal) == 0:
+                    raise ValueError('size is needed if all variables are cell centered')
+                size = np.shape(nodal[0])
+        else:
+            if elements is None:
+                raise ValueError('elements are needed for %s zone' % zonetype)
+            elements = np.asarray(elements)
+            if size is None:
+                if len(nodal) == 0:
+                    raise ValueError('size is needed if all variables are cell centered')
+                size = (np.size(nodal[0]), len(elements))
+
+        self.nzone += 1
+        header = {'zonetype': zonetype, 'datapacking': datapacking}
+        if zonename is not None:
+            header['zonename'] = zonename
+        if solutiontime is not None:
+            header['solutiontime'] = float(solutiontime)
+        if strandid is not None:
+            header['strandid'] = int(strandid)
+        text = io.StringIO()
+        _writeZoneHeader(text, header, [int(n) for n in size], self.nzone)
+        text = text.getvalue()
+        if 1 in varloc:
+            cells = [str(i + 1) for i, loc in enumerate(varloc) if loc == 1]
+            text = text[:-1] + ' VARLOCATION=([{:s}]=CELLCENTERED)\n'.format(','.join(cells))
+        self.fid.write(text)
+
+        if datapacking == 'BLOCK':
+            for d in data:
+                _write_block(self.fid, d, chunk=self.chunk)
+        else:
+            _write_points(self.fid, data, chunk=self.chunk)
+        if elements is not None:
+            _write_points(self.fid, elements.T + 1, chunk=self.chunk)
+        self.fid.write('\n')
+
+    def close(self):
+        '''
+        flush and close the file
+        '''
+        if self.fid is not None:
+            self.fid.close()
+            self.fid = None
+
+
+# nodes of an element of each FE zone type
+FEM_NODES = {'FELINESEG': 2, 'FETRIANGLE': 3, 'FEQUADRILATERAL': 4, 'FETETRAHEDRON': 4, 'FEBRICK': 8}
+
+# element type of the old `F=FEPOINT, ET=...` zone header
+FEM_ET = {'LINESEG': 'FELINESEG', 'TRIANGLE': 'FETRIANGLE', 'QUADRILATERAL': 'FEQUADRILATERAL',
+          'TETRAHEDRON': 'FETETRAHEDRON', 'BRICK': 'FEBRICK'}
+
+def _zone_param(header, key, default=None):
+    '''
+    value of `key` in a zone header (the zone title removed), as a str
+    '''
+    found = re.findall(r'(?<![A-Za-z_])%s\s*=\s*([^,\s]+)' % key, header, re.IGNORECASE)
+    return found[0].strip('"\'') if found else default
+
+def _parse_zone_header(header, n_var, nzone):
+    '''
+    parse the text of a zone header
+
+    return
+    ===
+    a dict of the zone: `zonename`, `zonetype`, `datapacking`, `varloc` (list,
+    1 for cell centered variables), `size` ((K, J, I) or (NODES, ELEMENTS)),
+    and `solutiontime`, `strandid` if given
+    '''
+    zonename = re.findall(r'(?<![A-Za-z_])T\s*=\s*"([^"]*)"', header)
+    if not zonename:
+        zonename = re.findall(r"(?<![A-Za-z_])T\s*=\s*'([^']*)'", header)
+    if not zonename:
+        zonename = re.findall(r'(?<![A-Za-z_])T\s*=\s*([^,\s]+)', header)
+    header = re.sub(r'(?<![A-Za-z_])T\s*=\s*("[^"]*"|\'[^\']*\'|[^,\s]+)', ' ', header)
+    zone = {'zonename': zonename[0] if zonename else 'data %d' % nzone}
+
+    zonetype = _zone_param(header, 'ZONETYPE', 'ORDERED').upper()
+    packing = _zone_param(header, 'DATAPACKING')
+    legacy = _zone_param(header, 'F')
+    if legacy is not None:
+        legacy = legacy.upper()
+        packing = 'BLOCK' if legacy in ['BLOCK', 'FEBLOCK'] else 'POINT'
+        if legacy.startswith('FE'):
+            zonetype = FEM_ET[_zone_param(header, 'ET', 'QUADRILATERAL').upper()]
+    zone['zonetype'] = zonetype
+    zone['datapacking'] = 'POINT' if packing is None else packing.upper()
+
+    if zonetype == 'ORDERED':
+        size = [int(_zone_param(header, key, 1)) for key in ['K', 'J']]
+        inum = _zone_param(header, 'I')
+        zone['size'] = tuple(size + [int(inum) if inum is not None else 0])
+    elif zonetype in FEM_NODES:
+        n_node = _zone_param(header, 'NODES', _zone_param(header, 'N'))
+        n_elem = _zone_param(header, 'ELEMENTS', _zone_param(header, 'E'))
+        zone['size'] = (int(n_node), int(n_elem))
+    else:
+        raise IOError('zone type %s of zone %d is not supported' % (zonetype, nzone))
+
+    varloc = [0] * n_var
+    for var_range, loc in re.findall(r'\[([\d,\-\s]+)\]\s*=\s*(CELLCENTERED|NODAL)', header, re.IGNORECASE):
+        for part in var_range.split(','):
+            bounds = [int(v) for v in part.split('-')]
+            for i_var in range(bounds[0], bounds[-1] + 1):
+                varloc[i_var - 1] = 1 if loc.upper() == 'CELLCENTERED' else 0
+    zone['varloc'] = varloc
+
+    for key, typ in [('SOLUTIONTIME', float), ('STRANDID', int)]:
+        value = _zone_param(header, key)
+        if value is not None:
+            zone[key.lower()] = typ(value)
+    return zone
+
+def _zone_counts(zone):
+    '''
+    number of nodes and cells of a zone
+    '''
+    if zone['zonetype'] == 'ORDERED':
+        n_node = int(np.prod(zone['size']))
+        n_cell = int(np.prod([max(n - 1, 1) for n in zone['size']]))
+        return n_node, n_cell
+    return zone['size']
+
+def _zone_arrays(zone, values, n_var):
+    '''
+    split the values of a zone into one array per variable
+
+    the values are put into one contiguous buffer in variable order, and the
+    arrays are views into it, shaped (K, J, I) (without the axes of size 1) for
+    ordered zones
+    '''
+    n_node, n_cell = _zone_counts(zone)
+    if zone['datapacking'] == 'POINT':
+        buf = np.ascontiguousarray(values.reshape(-1, n_var).T)
+        counts = [buf.shape[1]] * n_var
+        buf = buf.reshape(-1)
+    else:
+        buf = values
+        counts = [n_cell if loc else n_node for loc in zone['varloc']]
+
+    if zone['zonetype'] == 'ORDERED':
+        shape_node = tuple(n for n in zone['size'] if n > 1) or (n_node,)
+        shape_cell = tuple(n - 1 for n in zone['size'] if n > 1) or (n_cell,)
+    else:
+        shape_node, shape_cell = (n_node,), (n_cell,)
+
+    data = []
+    st = 0
+    for count, loc in zip(counts, zone['varloc']):
+        arr = buf[st: st + count]
+        shape = shape_cell if loc else shape_node
+        if zone['zonetype'] == 'ORDERED' and count == int(np.prod(shape)):
+            arr = arr.reshape(shape)
+        data.append(arr)
+        st += count
+    return data
+
+def _read_values(text_lines, i_line, n_value, dtype=np.float64):
+    '''
+    read `n_value` numbers from line `i_line`, or until a non-numeric line if
+    `n_value` is None, into an array of `dtype`
+
+    return
+    ===
+    the values, and the index of the line after them
+    '''
+    if n_value is not None and i_line < len(text_lines):
+        # usually every line has the same number of values (a point, or a
+        # row of a block), then the lines are parsed in one call
+        n_first = len(text_lines[i_line].split())
+        if n_first > 0 and n_value % n_first == 0:
+            ed = i_line + n_value // n_first
+            # a text numpy can't parse (i.e. Fortran `1.0D+00`) stops it early
+            # with a warning, the length is checked instead (the warning
+            # filters are not thread-safe, the files are parsed in threads)
+            try:
+                values = np.fromstring(' '.join(text_lines[i_line: ed]), dtype=dtype, sep=' ')
+            except ValueError:
+                values = None
+            if values is not None and len(values) == n_value:
+                return values, ed
+
+    tokens = []
+    while i_line < len(text_lines) and (n_value is None or len(tokens) < n_value):
+        split_line = text_lines[i_line].split()
+        if n_value is None and len(split_line) > 0 and split_line[0][:1] not in STRDIGIT + ['+', '.']:
+            break
+        tokens += split_line
+        i_line += 1
+    return np.array(tokens if n_value is None else tokens[:n_value], dtype=dtype), i_line
+
+def tec2py(datfile, info=True, is_sort=None, dtype=np.float64):
     '''
     Argument list:
 
+    - `datfile`   the tecplot ASCII file
+    - `info`      print the variables and zones read
+    - `is_sort`   a variable name, the line zones are sorted by it
+    - `dtype`     dtype of the arrays, i.e. `np.float32` to halve the memory
+                  (the text is parsed into it, there is no float64 copy)
+
     return:
     ===
     - tdata: A dictionary of data, it can have the following keys:
         + varnames: a list of variable names
-        + lines (optional): a list of [line data] for line plot
-          each [line data] should be a dict having following keys
-            + `data`: the data for the line, it should be a list of numpy arraies, which should have the same length.
-                    numpy array's dtype can be int or float
-            + `zonename`(opt., default = 'ZONE' + No.): name of the zone
-            + `passivevarlist` (opt., default = None): exclude some variables from the data
-            + `datapacking` (opt., default = 'POINT')
-            + `zonetype` (opt., default = 'ORDERED')
-            # TODO
-            + lines.datapacking
-        + surfaces (optional): TODO
+        + lines: a list of [line data], the ordered zones with J = K = 1
+          each [line data] is a dict having following keys
+            + `data`: the data for the line, a list of numpy arraies, which have the same length.
+            + `zonename`: name of the zone
+            + `datapacking`: `POINT` or `BLOCK`
+            + `zonetype`: `ORDERED`
+            + `solutiontime`, `strandid` (if given in the file)
+        + surfaces: a list of [surface data], the other ordered zones and the FE zones
+            + `data`: a list of numpy arraies of each variable, in shape (K, J, I)
+                    (without the axes of size 1) for ordered zones, (NODES,) or
+                    (ELEMENTS,) for FE zones
+            + `zonename`, `zonetype`, `datapacking`
+            + `size`: (K, J, I) for ordered zones, (NODES, ELEMENTS) for FE zones
+            + `varloc`: a list of 0 (nodal) or 1 (cell centered) of each variable
+            + `elements` (FE zones): the node indexes (from 0) of the elements,
+                    int array in shape (ELEMENTS, nodes of an element)
+            + `solutiontime`, `strandid` (if given in the file)
+
+    the arrays of a zone are views into one contiguous buffer of the zone
     '''
-    # datfile = "D:\\CEN\\Opt1\\415\\Calculation\\0\\BC3.DAT"
 
     var_list = []
     lines = []
+    surfaces = []
     nzone = 0
 
     with open(datfile, 'r') as fid:
-        try:
-            line_num = 1
-            line = next(fid).strip()
-            split_line = line.split()
-            while True:
-                if len(split_line) <= 0 or split_line[0] in ['TITLE', '#']:
-                    line = next(fid).strip()
-                    line_num += 1
-                    split_line = line.split()
-                
-                elif split_line[0] == 'VARIABLES':
-
-                    while True:
-                        if line[0] not in ['"', 'V']:
-                            split_line = line.split()
-                            break
-                        var_list += re.findall(r'[''"](.*?)[''"]', line)
-                        line = next(fid).strip()
-                        line_num += 1
-                        
-                    n_var = len(var_list)
-                    if info:
-                        print("%d variables recognized, name:" % n_var, var_list)
-                
-                elif split_line[0] == 'ZONE':
-                    nzone = nzone + 1
-                    # ===========load zone information===================
-                    inum = False
-                    jnum = False
-                
-                    while True:
-                        if line[0] in STRDIGIT:
-                            split_line = line.split()
-                            break
-                            
-                        if not inum:
-                            inum = re.findall(r'I\s*=\s*(\d+)', line)
-                        if not jnum:
-                            jnum = re.findall(r'J\s*=\s*(\d+)', line)
-                        zonename = re.findall(r'T\s*=\s*["''](.*)[''"]', line)
-                        line = next(fid).strip()
-                        line_num += 1
-
-                    if inum:
-                        inum = int(inum[0])
-                    else:
-                        inum = 0
-
-                    if jnum:
-                        jnum = int(jnum[0])
-                    else:
-                        jnum = 1
-                    
-                    ndata = inum*jnum
-
-                    if not zonename:
-                        zonename = re.findall(r'T\s*=\s*(.*)', line)
-                    if zonename:
-                        zonename = zonename[0]
-                    else:
-                        zonename = 'data %d' % (nzone,)
-
-                    #  ============== load data ===========================
-                    zone_data = []
-                    try:
-                        while True:
-                            # print(split_line)
-                            l2append = [float(i) for i in split_line]
-                            zone_data += l2append
-                            line = next(fid).strip()
-                            split_line = line.split()
-                            
-                    except ValueError or StopIteration:
-                        pass
-
-                    finally:
-                        # print(zone_data)
-                        if jnum == 1:
-                            zone_data = np.array(zone_data).reshape(-1, n_var)
-                            ndata0 = zone_data.shape[0]
-                            if ndata == 0:
-                                print('%d points read, I,J not found' % ndata0)
-                            elif ndata0 == ndata:
-                                print('ndata: I=%d read' % (inum))
-                            else:
-                                print('ndata = %d, but %d points read' % (ndata, ndata0))
+        text_lines = fid.read().splitlines()
+
+    n_line = len(text_lines)
+    i_line = 0
+    while i_line < n_line:
+        line = text_lines[i_line].strip()
+        split_line = line.split()
+
+        if len(split_line) <= 0 or split_line[0] in ['TITLE', '#'] or split_line[0].startswith('TITLE'):
+            i_line += 1
+
+        elif split_line[0].startswith('VARIABLES'):
+            header = line.split('=', 1)[1] if '=' in line else ''
+            i_line += 1
+            while i_line < n_line and text_lines[i_line].strip()[:1] == '"':
+                header += ' ' + text_lines[i_line].strip()
+                i_line += 1
+            if '"' in header:
+                var_list += re.findall(r'"(.*?)"', header)
+            else:
+                var_list += [v for v in re.split(r'[,\s]+', header) if v]
+
+            n_var = len(var_list)
+            if info:
+                print("%d variables recognized, name:" % n_var, var_list)
+
+        elif split_line[0] in ['DATASETAUXDATA', 'VARAUXDATA']:
+            i_line += 1
+
+        elif split_line[0] == 'ZONE':
+            nzone = nzone + 1
+            # ===========load zone information===================
+            header = line[4:]
+            i_line += 1
+            while i_line < n_line:
+                line = text_lines[i_line].strip()
+                if line[:1] in STRDIGIT or line[:1] in ['+', '.']:
+                    break
+                header += ' ' + line
+                i_line += 1
+            zone = _parse_zone_header(header, n_var, nzone)
+            n_node, n_cell = _zone_counts(zone)
+
+            #  ============== load data ===========================
+            if zone['zonetype'] == 'ORDERED' and zone['size'][2] == 0:
+                # I not given, read until the next non-numeric line
+                n_value = None
+            elif zone['datapacking'] == 'POINT':
+                n_value = n_node * n_var
+            else:
+                n_value = sum([n_cell if loc else n_node for loc in zone['varloc']])
+
+            values, i_line = _read_values(text_lines, i_line, n_value, dtype)
+
+            if zone['zonetype'] == 'ORDERED' and zone['size'][2] == 0:
+                zone['size'] = (1, 1, len(values) // n_var)
+                if info: print('%d points read, I,J not found' % zone['size'][2])
+            elif len(values) < n_value:
+                raise IOError('zone %d (%s): %d values expected, %d read' % (nzone, zone['zonename'], n_value, len(values)))
+
+            zone['data'] = _zone_arrays(zone, values, n_var)
+
+            if zone['zonetype'] in FEM_NODES:
+                n_elem_node = FEM_NODES[zone['zonetype']]
+                n_conn = zone['size'][1] * n_elem_node
+                tokens = []
+                while i_line < n_line and len(tokens) < n_conn:
+                    tokens += text_lines[i_line].split()
+                    i_line += 1
+                if len(tokens) < n_conn:
+                    raise IOError('zone %d (%s): %d connectivity values expected, %d read' % (nzone, zone['zonename'], n_conn, len(tokens)))
+                zone['elements'] = np.array(tokens[:n_conn], dtype=np.int64).reshape(-1, n_elem_node) - 1
+
+            if zone['zonetype'] == 'ORDERED' and zone['size'][:2] == (1, 1):
+                if info: print('ndata: I=%d read' % zone['size'][2])
+                del zone['size'], zone['varloc']
+                lines.append(zone)
+            else:
+                if info: print('ndata: %s %s read' % (zone['zonetype'], zone['size']))
+                surfaces.append(zone)
 
-                            zone_data = zone_data.T
-                            
-                        else:
-                            zone_data = np.array(zone_data).reshape((inum, jnum, n_var))
-                            print('ndata: I=%d * J=%d' % (inum, jnum))
-                            zone_data = zone_data.transpose((2, 0, 1))
-                            
-                        lines.append({'zonename': zonename, 'data': [i for i in zone_data]})
+        else:
+            raise IOError("Can't Identify line # %d: %s" % (i_line + 1, line))
 
-                else:
-                    raise IOError("Can't Identify line # %d: %s" % (line_num, line))
+    if is_sort is not None:
 
+        if is_sort not in var_list:
+            print('No variable "%s" in varlist:' % is_sort, var_list)
+        else:
+            sort_lines(lines, var_list.index(is_sort))
 
-        except StopIteration:
-            pass
+    return {'varnames': var_list, 'lines': lines, 'surfaces': surfaces}
 
-        if is_sort is not None:
 
-            if is_sort not in var_list:
-                print('No variable "%s" in varlist:' % is_sort + var_list)
-            else:
-                sort_idx = var_list.index(is_sort)
+def stack_lines(lines):
+    '''
+    stack the data of the line zones one after another
+
+    return
+    ===
+    - `data`      array in shape (number of variables, total number of points)
+    - `offsets`   the first point of every zone in `data`, and the total number
+                  of points at the end: zone i is `data[:, offsets[i]:offsets[i + 1]]`
+
+    `data` is float64, or float32 if all the zones are float32
+    '''
+    sizes = [len(line['data'][0]) for line in lines]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    dtypes = set([np.asarray(arr).dtype for line in lines for arr in line['data']])
+    dtype = np.float32 if dtypes == set([np.dtype(np.float32)]) else np.float64
+    data = np.empty((len(lines[0]['data']) if len(lines) > 0 else 0, offsets[-1]), dtype=dtype)
+    for line, st, ed in zip(lines, offsets[:-1], offsets[1:]):
+        for i_var, arr in enumerate(line['data']):
+            data[i_var, st:ed] = arr
+    return data, offsets
+
+
+def sort_lines(lines, i_var):
+    '''
+    sort the points of every line zone by variable number `i_var`, in place
 
-                for line in lines:
-                    sort_idx = np.argsort(line['data'][sort_idx])
-                    line['data'] = [np.array([d[i] for i in sort_idx]) for d in line['data']]
+    the variables of a zone are taken in one pass into one contiguous buffer,
+    `line['data']` is the list of its rows
+    '''
+    for line in lines:
+        data = np.asarray(line['data'])
+        order = np.argsort(data[i_var], kind='stable')
+        line['data'] = list(data.take(order, axis=1))
 
 
+def merge_lines(tdata, is_sort=None, dedupe=None, tol=1e-8, zonename='merged'):
+    '''
+    merge the line zones of `tdata` into one zone, i.e. the zones of the
+    boundaries extracted by `cfdpp.extract_bc`
 
-    return {'varnames': var_list, 'lines': lines}
\ No newline at end of file
+    paras
+    ===
+    - `tdata`     data in the format of `tec2py`
+    - `is_sort`   a variable name, the merged points are sorted by it. The sort
+                  is stable and finds the sorted runs, so zones already sorted
+                  (`tec2py(is_sort=...)`) are merged run by run (k-way merge)
+    - `dedupe`    a list of variable names (i.e. ['X', 'Y', 'Z']), the points
+                  with the same values of them (rounded to `tol`) are kept once,
+                  the first one; i.e. the edge points shared by two boundaries
+    - `tol`       tolerance of `dedupe`
+    - `zonename`  name of the merged zone
+
+    return
+    ===
+    a new tdata with one line zone, the surfaces of `tdata` (FE and IJK
+    zones) are kept as they are, they are not merged or deduped
+    '''
+    var_list = tdata['varnames']
+    lines = tdata['lines']
+    if len(lines) == 0:
+        return {'varnames': var_list, 'lines': [], 'surfaces': tdata.get('surfaces', [])}
+    data, _ = stack_lines(lines)
+
+    if dedupe is not None:
+        for var in dedupe:
+            if var not in var_list:
+                raise KeyError('No variable "%s" in varlist: %s' % (var, var_list))
+        keys = np.round(data[[var_list.index(var) for var in dedupe]].T / tol)
+        _, first = np.unique(keys, axis=0, return_index=True)
+        data = data.take(np.sort(first), axis=1)
+
+    if is_sort is not None:
+        if is_sort not in var_list:
+            raise KeyError('No variable "%s" in varlist: %s' % (is_sort, var_list))
+        order = np.argsort(data[var_list.index(is_sort)], kind='stable')
+        data = data.take(order, axis=1)
+
+    line = {'data': list(data), 'zonename': zonename, 'datapacking': 'POINT', 'zonetype': 'ORDERED'}
+    for key in ['solutiontime', 'strandid']:
+        if len(lines) > 0 and key in lines[0]:
+            line[key] = lines[0][key]
+    return {'varnames': var_list, 'lines': [line], 'surfaces': tdata.get('surfaces', [])}
+
+
+# header keys of a zone kept in the .npz format
+_NPZ_KEYS = ['zonename', 'zonetype', 'datapacking', 'varloc', 'size', 'solutiontime', 'strandid']
+
+# compression of the .npz format: None, `zip` (np.savez_compressed), or the
+# arrays compressed one by one with `zlib`, `zstd` (package zstandard) or
+# `blosc` (package blosc); the bytes of the values are shuffled (the first
+# bytes of all values, then the second bytes, ...) before, which compresses
+# floats much better
+NPZ_COMPRESS = [None, 'zip', 'zlib', 'zstd', 'blosc']
+
+
+def _shuffle(arr):
+    arr = np.ascontiguousarray(arr)
+    return arr.view(np.uint8).reshape(-1, arr.itemsize).T.tobytes()
+
+def _unshuffle(buf, dtype, shape):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(buf, np.uint8).reshape(dtype.itemsize, -1).T.copy().view(dtype).reshape(shape)
+
+def _codec(compress, level=None):
+    '''
+    (encode, decode) of an array to bytes and back, for `compress` in
+    `zlib`, `zstd`, `blosc`
+    '''
+    if compress == 'zlib':
+        import zlib
+        level = 1 if level is None else level
+        return (lambda arr: zlib.compress(_shuffle(arr), level),
+                lambda buf, dtype, shape: _unshuffle(zlib.decompress(buf), dtype, shape))
+    if compress == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('compress="zstd" needs the package zstandard')
+        level = 3 if level is None else level
+        return (lambda arr: zstandard.ZstdCompressor(level=level).compress(_shuffle(arr)),
+                lambda buf, dtype, shape: _unshuffle(zstandard.ZstdDecompressor().decompress(buf), dtype, shape))
+    if compress == 'blosc':
+        try:
+            import blosc
+        except ImportError:
+            raise ImportError('compress="blosc" needs the package blosc')
+        level = 5 if level is None else level
+        return (lambda arr: blosc.compress(np.ascontiguousarray(arr).tobytes(), typesize=arr.itemsize, clevel=level,
+                                           shuffle=blosc.SHUFFLE),
+                lambda buf, dtype, shape: np.frombuffer(blosc.decompress(buf), dtype).reshape(shape))
+    raise ValueError('compress %s not in %s' % (compress, NPZ_COMPRESS))
+
+
+def py2npz(tdata, fname, dtype=None, compress=None, level=None):
+    '''
+    save tecplot data (the format of `tec2py`) to a binary .npz file, read
+    back by `npz2py` without parsing text
+
+    paras
+    ===
+    - `dtype`     dtype of the values (i.e. `np.float32`), default is that of the data;
+                  the FE connectivity is kept in integers
+    - `compress`  one of `NPZ_COMPRESS`
+    - `level`     the compression level of `zlib`, `zstd` or `blosc`
+
+    the zone headers are kept in a json string, the arrays of a zone are saved
+    in one buffer, the FE connectivity (if any) in another
+    '''
+    import json
+
+    if compress not in NPZ_COMPRESS:
+        raise ValueError('compress %s not in %s' % (compress, NPZ_COMPRESS))
+    meta = {'varnames': list(tdata['varnames']), 'title': tdata.get('title'), 'zones': [],
+            'compress': compress, 'arrays': {}}
+    arrays = {}
+    for kind in ['lines', 'surfaces']:
+        for zone in tdata.get(kind, []):
+            i = len(meta['zones'])
+            data = [np.asarray(d) for d in zone['data']]
+            header = {key: zone[key] for key in _NPZ_KEYS if key in zone}
+            header['size'] = [int(n) for n in header['size']] if 'size' in header else None
+            header.update({'kind': kind, 'shapes': [d.shape for d in data]})
+            meta['zones'].append(header)
+            buf = np.concatenate([d.ravel() for d in data]) if len(data) > 0 else np.empty(0)
+            arrays['zone%d' % i] = buf.astype(dtype, copy=False) if dtype is not None else buf
+            if 'elements' in zone:
+                arrays['elements%d' % i] = np.asarray(zone['elements'])
+
+    if compress in [None, 'zip']:
+        save = np.savez_compressed if compress == 'zip' else np.savez
+        save(fname, meta=np.array(json.dumps(meta)), **arrays)
+        return
+
+    encode, _ = _codec(compress, level)
+    for key, arr in arrays.items():
+        meta['arrays'][key] = [arr.dtype.str, arr.shape]
+        arrays[key] = np.frombuffer(encode(arr), np.uint8)
+    np.savez(fname, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def npz2py(fname):
+    '''
+    read tecplot data saved by `py2npz`, in the format of `tec2py`; the arrays
+    of a zone are views into one buffer, in the dtype they are saved in
+    '''
+    import json
+
+    tdata = {'lines': [], 'surfaces': []}
+    with np.load(fname) as f:
+        meta = json.loads(str(f['meta']))
+        compress = meta.get('compress')
+        if compress in [None, 'zip']:
+            read = lambda key: f[key]
+        else:
+            _, decode = _codec(compress)
+            read = lambda key: decode(f[key].tobytes(), *meta['arrays'][key])
+
+        tdata['varnames'] = meta['varnames']
+        if meta['title'] is not None:
+            tdata['title'] = meta['title']
+        for i, header in enumerate(meta['zones']):
+            buf = read('zone%d' % i)
+            zone = {key: header[key] for key in _NPZ_KEYS if header.get(key) is not None}
+            if 'size' in zone:
+                zone['size'] = tuple(zone['size'])
+            zone['data'] = []
+            st = 0
+            for shape in header['shapes']:
+                count = int(np.prod(shape))
+                zone['data'].append(buf[st: st + count].reshape(shape))
+                st += count
+            if 'elements%d' % i in f:
+                zone['elements'] = read('elements%d' % i)
+            tdata[header['kind']].append(zone)
+    return tdata
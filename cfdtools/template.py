@@ -0,0 +1,274 @@
+'''
+cfdtools.template
+
+build many cfd++ case folders from a template case
+
+the files of the template are put in a new case as
+
+- the grid and partition files (`LINK_FILES`), which the solver only reads,
+  are hard linked
+- other large files (i.e. restart files), which the solver may rewrite, are
+  reflinked (copy-on-write clone, on file systems that support it: btrfs, xfs,
+  ...) or copied
+- mcfd.inp is written fresh, with the parameters, infoset values and boundary
+  types of the case applied in one pass to the template text
+- other small files are copied, and the outputs (`EXCLUDE_FILES`) are skipped
+
+so a new case costs a few kB of disk and no re-reading of the grid.
+
+usage
+===
+
+>>> factory = case_factory('template_case')
+>>> factory.make('sweep/ma0.8', paras={'ntstep': 2000}, infsets={8: [101325]})
+>>> factory.make_many({'sweep/ma%.1f' % ma: {'infsets': {3: [p(ma), t(ma), 0, 0, 0, 0, 0]}} for ma in mas}, threads=8)
+
+'''
+
+import os
+import sys
+import shutil
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+from .boundary import bc_dict, bc_table
+from .partition import GRID_FILES
+from .system import remove_file
+
+LINK_FILES = GRID_FILES + ['mcfd_metis.graph', 'mcpusin.bin.*']
+
+EXCLUDE_FILES = ['mcfd.inp.bak', 'mcfd.info1', 'mcfd.info1.idx.npz', 'metis.log', 'linelist.inp',
+                 'BC*.dat', 'BC*.mpf1d', 'BC*.txt', 'lineoutput_*', 'line_*.tec', 'mlog', 'checkpoints']
+
+# ioctl number of FICLONE on Linux
+_FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    '''
+    clone file `src` to `dst` sharing the data blocks (copy-on-write), raise
+    `OSError` if the file system does not support it
+    '''
+    if not sys.platform.startswith('linux'):
+        raise OSError('reflink is only supported on Linux')
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            remove_file(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def clone_file(src, dst, link=False):
+    '''
+    put file `src` at `dst`, by hard link (if `link`), reflink, or copy
+
+    return
+    ===
+    the method used, `link`, `reflink` or `copy`
+    '''
+    remove_file(dst)
+    if link:
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            pass
+    try:
+        reflink(src, dst)
+        return 'reflink'
+    except OSError:
+        shutil.copy2(src, dst)
+        return 'copy'
+
+
+def _match(name, patterns):
+    return any(fnmatch.fnmatch(name, p) for p in patterns)
+
+
+class inp_template():
+    '''
+    the lines of a template mcfd.inp, indexed once to apply the parameters,
+    infoset values and boundary types of many cases
+
+    paras
+    ===
+    - `inp_dir`   the template mcfd.inp
+
+    '''
+
+    def __init__(self, inp_dir):
+        with open(inp_dir, 'r') as f:
+            self.lines = f.readlines()
+
+        # key -> line index, the first token of `key value` lines
+        self.keys = {}
+        # infoset number -> (line index of `seq.#`, number of values)
+        self.infsets = {}
+        for idx, line in enumerate(self.lines):
+            split_line = line.split()
+            if len(split_line) == 0:
+                continue
+            if split_line[0] == 'seq.#' and len(split_line) > 3:
+                self.infsets[int(split_line[1])] = (idx, int(split_line[3]))
+            elif len(split_line) == 2 and split_line[0] not in self.keys:
+                self.keys[split_line[0]] = idx
+
+        self.bcs = bc_table(inp_dir, lines=self.lines)
+
+    def read_infset(self, inf_num):
+        '''
+        values of infoset `inf_num` in the template
+        '''
+        idx, value_num = self.infsets[inf_num]
+        values = []
+        for vline in self.lines[idx + 1: idx + 1 + (value_num + 4) // 5]:
+            values += [float(v) for v in vline.split()[1:]]
+        return values
+
+    def render(self, paras=None, infsets=None, bcs=None):
+        '''
+        the text of mcfd.inp with
+
+        paras
+        ===
+        - `paras`     a dict of key -> value
+        - `infsets`   a dict of infoset number -> values, a value None keeps
+                      the one of the template
+        - `bcs`       a dict of bc number -> (type in `bc_dict` or None, infoset number)
+
+        '''
+        lines = list(self.lines)
+
+        if paras is not None:
+            for key, value in paras.items():
+                if key not in self.keys:
+                    raise KeyError('key %s not found in mcfd.inp' % key)
+                lines[self.keys[key]] = '%s %s\n' % (key, value)
+
+        if infsets is not None:
+            for inf_num, values in infsets.items():
+                if inf_num not in self.infsets:
+                    raise KeyError("Can't find infoset %d" % inf_num)
+                idx, value_num = self.infsets[inf_num]
+                if len(values) != value_num:
+                    raise ValueError('infoset %d has %d values, %d given' % (inf_num, value_num, len(values)))
+                old = self.read_infset(inf_num)
+                values = [old[i] if v is None else v for i, v in enumerate(values)]
+                for i_line in range((value_num + 4) // 5):
+                    lines[idx + 1 + i_line] = 'values ' + ''.join(['%.4e ' % v for v in values[5 * i_line: 5 * i_line + 5]]) + '\n'
+
+        if bcs is not None:
+            for bc_num, (typ, infset_num) in bcs.items():
+                row = self.bcs[bc_num]
+                code = row.typ if typ is None else bc_dict[typ].no
+                lines[row.line] = '%4d %4d %4d %4d %s\n' % (row.no, code, row.modi, infset_num, row.name)
+
+        return ''.join(lines)
+
+
+class case_factory():
+    '''
+    create case folders from the template case `template_dir`
+
+    paras
+    ===
+    - `template_dir`  the template case, with mcfd.inp
+    - `link`          patterns of the files that are hard linked (read only inputs)
+    - `exclude`       patterns of the files and folders not put in the cases
+    - `large`         files from this size (bytes) are reflinked if possible,
+                      smaller ones are copied
+    - `link_large`    hard link the large files too, only if the solver never
+                      rewrites them in place
+
+    '''
+
+    def __init__(self, template_dir, link=LINK_FILES, exclude=EXCLUDE_FILES, large=1 << 20, link_large=False):
+        self.template_dir = os.path.abspath(template_dir)
+        self.link = list(link)
+        self.exclude = list(exclude)
+        self.large = large
+        self.link_large = link_large
+        self.inp = inp_template(os.path.join(self.template_dir, 'mcfd.inp'))
+
+        # (relative path, size) of the files of the template, scanned once
+        self.files = []
+        for root, dirs, files in os.walk(self.template_dir):
+            dirs[:] = [d for d in dirs if not _match(d, self.exclude)]
+            rel_root = os.path.relpath(root, self.template_dir)
+            for fname in files:
+                if fname == 'mcfd.inp' and rel_root == '.':
+                    continue
+                if _match(fname, self.exclude):
+                    continue
+                rel = os.path.normpath(os.path.join(rel_root, fname))
+                self.files.append((rel, os.path.getsize(os.path.join(root, fname))))
+
+    def make(self, case_dir, paras=None, infsets=None, bcs=None, files=None, exist_ok=False):
+        '''
+        create case `case_dir`
+
+        paras
+        ===
+        - `paras`, `infsets`, `bcs`   the changes of mcfd.inp, see `inp_template.render`
+        - `files`     a dict of file name -> text of other files written in the case
+        - `exist_ok`  write into `case_dir` if it exists
+
+        return
+        ===
+        a dict of file -> how it is put (`link`, `reflink`, `copy` or `write`)
+        '''
+        os.makedirs(case_dir, exist_ok=exist_ok)
+        methods = {}
+        for rel, size in self.files:
+            src = os.path.join(self.template_dir, rel)
+            dst = os.path.join(case_dir, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            name = os.path.basename(rel)
+            if _match(name, self.link) or (self.link_large and size >= self.large):
+                methods[rel] = clone_file(src, dst, link=True)
+            elif size >= self.large:
+                methods[rel] = clone_file(src, dst)
+            else:
+                remove_file(dst)
+                shutil.copy2(src, dst)
+                methods[rel] = 'copy'
+
+        with open(os.path.join(case_dir, 'mcfd.inp'), 'w') as f:
+            f.write(self.inp.render(paras, infsets, bcs))
+        methods['mcfd.inp'] = 'write'
+
+        if files is not None:
+            for fname, text in files.items():
+                with open(os.path.join(case_dir, fname), 'w') as f:
+                    f.write(text)
+                methods[fname] = 'write'
+
+        return methods
+
+    def make_many(self, cases, threads=1, exist_ok=False):
+        '''
+        create many cases
+
+        paras
+        ===
+        - `cases`     a dict of case folder -> dict of the arguments of `make`
+                      (`paras`, `infsets`, `bcs`, `files`)
+        - `threads`   number of threads
+
+        return
+        ===
+        the list of case folders
+        '''
+        def make_one(item):
+            case_dir, kwargs = item
+            self.make(case_dir, exist_ok=exist_ok, **kwargs)
+            return case_dir
+
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                return list(pool.map(make_one, cases.items()))
+        return [make_one(item) for item in cases.items()]
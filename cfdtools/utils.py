@@ -1,6 +1,5 @@
 import math
 from functools import reduce
-from scipy.optimize import fsolve
 import numpy as np
 
 import copy
@@ -143,6 +142,8 @@ def t9(fluid, npr, tt7, fix_thermo=False):
     # print(npr, _t9_fix)
     if fix_thermo:return _t9_fix
 
+    # scipy is only needed here, it takes most of the import time of the module
+    from scipy.optimize import fsolve
     return fsolve(lambda x: math.log(npr) + fluid.cal_cp_R_intergal(x, tt7), _t9_fix)[0]
 
 def u9(fluid, tt7, t9):
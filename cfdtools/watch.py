@@ -0,0 +1,483 @@
+'''
+cfdtools.watch
+
+post-process the cases of a sweep as their files change
+
+a `case_watcher` finds the case folders (with mcfd.inp) under the given roots,
+and follows the files of each case matching `WATCH_PATTERNS` (mcfd.info1,
+pltosout.bin, BC%d.dat). The changes are detected with inotify (Linux, no
+package needed), or by polling the size and mtime of the files; the folders
+are also searched again every `poll` seconds for new cases, and to catch the
+changes inotify missed.
+
+a changed case is handed to the handler once its files have not changed for
+`debounce` seconds (or after `max_wait` seconds of changes, i.e. while the
+solver appends to mcfd.info1), with the names of the files changed since it
+was last processed. At most `workers` cases are processed at the same time, a
+case is never processed twice at once, and the changes made while it is
+processed give another call after. The size and mtime of the files processed
+are kept in the `state` file, so a watcher started again only processes the
+cases changed since.
+
+the `post_handler` does the incremental work of a case:
+
+- mcfd.info1      the step index is updated (only the new steps are scanned),
+                  the fluxes are read and their running statistics updated,
+                  and the case is scanned into a `catalog.sweep_catalog`
+- pltosout.bin    the boundaries and lines are extracted again and parsed
+- BC%d.dat        the boundaries whose files changed are parsed
+
+usage
+===
+
+>>> handler = post_handler(fluxes={'fx': ('fx', [3, 4])}, bcs={'wall': [3, 4]}, catalog='sweep.db')
+>>> watcher = case_watcher(['sweep'], handler, workers=4, state='sweep/watch.json')
+>>> watcher.run()                       # until stop() or Ctrl-C
+>>> handler.table()                     # a row per case: n_step, fx, fx_mean, fx_std
+
+'''
+
+import os
+import json
+import time
+import fnmatch
+import threading
+
+WATCH_PATTERNS = ['mcfd.info1', 'pltosout.bin', 'BC*.dat']
+
+
+def find_cases(roots, depth=2):
+    '''
+    the case folders (with mcfd.inp) in `roots`, or in their sub-folders down
+    to `depth` levels
+    '''
+    cases = []
+
+    def search(path, level):
+        if os.path.isfile(os.path.join(path, 'mcfd.inp')):
+            cases.append(os.path.abspath(path))
+            return
+        if level >= depth:
+            return
+        try:
+            entries = sorted([e.path for e in os.scandir(path) if e.is_dir()])
+        except OSError:
+            return
+        for sub in entries:
+            search(sub, level + 1)
+
+    for root in roots:
+        search(root, 0)
+    return cases
+
+
+def file_states(case_dir, patterns=WATCH_PATTERNS):
+    '''
+    the (size, mtime) of the files of a case matching `patterns`
+    '''
+    states = {}
+    try:
+        entries = list(os.scandir(case_dir))
+    except OSError:
+        return states
+    for entry in entries:
+        if any([fnmatch.fnmatch(entry.name, p) for p in patterns]):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            states[entry.name] = [st.st_size, st.st_mtime_ns]
+    return states
+
+
+class _inotify():
+    '''
+    the inotify events of folders, by the C library (Linux only)
+    '''
+
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._ctypes = ctypes
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.paths = {}
+
+    def add(self, path):
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        self.paths[wd] = path
+
+    def read(self, timeout):
+        '''
+        (folder, file name) of the events, waiting `timeout` seconds at most
+        '''
+        import select
+        import struct
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events = []
+        i = 0
+        while i + 16 <= len(buf):
+            wd, _, _, length = struct.unpack_from('iIII', buf, i)
+            name = buf[i + 16: i + 16 + length].rstrip(b'\0').decode(errors='replace')
+            if wd in self.paths and name != '':
+                events.append((self.paths[wd], name))
+            i += 16 + length
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class case_watcher():
+    '''
+    call a handler on the cases whose files change
+
+    paras
+    ===
+    - `roots`     folders searched for cases, or case folders
+    - `handler`   function `handler(case_dir, changed)`, `changed` is the set
+                  of the names of the files changed; its return is given to
+                  `on_result`. If it is a dict with `files` (the files written
+                  by the handler, i.e. extracted BC%d.dat), their changes are
+                  not taken as new changes of the case
+    - `patterns`  file names followed (fnmatch patterns)
+    - `debounce`  seconds without change before a case is processed
+    - `max_wait`  seconds of changes after which a case is processed anyway
+    - `workers`   number of cases processed at the same time
+    - `poll`      seconds between the searches of new cases and the polls of the files
+    - `backend`   `inotify`, `poll`, or `auto` (inotify if available)
+    - `state`     a json file of the states of the files processed, kept
+                  between runs; None to process all cases at start
+    - `depth`     depth of the search of cases in `roots`
+    - `on_result` function `on_result(case_dir, result, error)` called after
+                  each case, in the thread of `run`
+    - `verbose`   print the cases processed if < 1
+
+    '''
+
+    def __init__(self, roots, handler, patterns=WATCH_PATTERNS, debounce=2.0, max_wait=60.0, workers=2, poll=5.0,
+                 backend='auto', state=None, depth=2, on_result=None, verbose=1):
+        # the handler may change the working directory, the paths are kept absolute
+        self.roots = [os.path.abspath(r) for r in ([roots] if isinstance(roots, str) else roots)]
+        self.handler = handler
+        self.patterns = list(patterns)
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.workers = workers
+        self.poll = poll
+        self.state = os.path.abspath(state) if state is not None else None
+        self.depth = depth
+        self.on_result = on_result
+        self.verbose = verbose
+
+        self.seen = {}          # case -> {file: [size, mtime]} observed
+        self.done = {}          # case -> {file: [size, mtime]} processed
+        self.pending = {}       # case -> [time of the first change, time of the last change]
+        self.running = {}       # case -> (future, states given to the handler)
+        self.n_processed = 0
+        self.n_failed = 0
+        self._stop = threading.Event()
+        self._pool = None
+        self._last_scan = None
+
+        if self.state is not None and os.path.exists(self.state):
+            with open(self.state, 'r') as f:
+                self.done = json.load(f)
+
+        self._inotify = None
+        if backend not in ['auto', 'inotify', 'poll']:
+            raise ValueError('backend %s not in auto, inotify, poll' % backend)
+        if backend != 'poll':
+            try:
+                self._inotify = _inotify()
+            except (OSError, AttributeError):
+                if backend == 'inotify':
+                    raise
+        self.backend = 'inotify' if self._inotify is not None else 'poll'
+
+    # ============================== changes ==============================
+
+    def _update(self, case, states, now):
+        changed = states != self.seen.get(case)
+        self.seen[case] = states
+        if case in self.running:
+            return
+        if states == self.done.get(case, {}):
+            self.pending.pop(case, None)
+        elif case not in self.pending:
+            self.pending[case] = [now, now]
+        elif changed:
+            self.pending[case][1] = now
+
+    def scan(self):
+        '''
+        search the new cases, and compare the files of all cases
+        '''
+        now = time.monotonic()
+        for case in find_cases(self.roots, self.depth):
+            if case not in self.seen and self._inotify is not None:
+                try:
+                    self._inotify.add(case)
+                except OSError:
+                    # i.e. out of watches, the case is still polled
+                    pass
+            self._update(case, file_states(case, self.patterns), now)
+        self._last_scan = now
+
+    def _events(self, timeout):
+        if self._inotify is None:
+            time.sleep(timeout)
+            return
+        cases = set()
+        for path, name in self._inotify.read(timeout):
+            if any([fnmatch.fnmatch(name, p) for p in self.patterns]):
+                cases.add(path)
+        now = time.monotonic()
+        for case in cases:
+            self._update(case, file_states(case, self.patterns), now)
+
+    # ============================== processing ==============================
+
+    def _finish(self, case, future, states):
+        result, error = None, None
+        try:
+            result = future.result()
+        except Exception as e:
+            error = e
+        # a failed case is also taken as processed, it is tried again on its next change
+        done = dict(states)
+        if isinstance(result, dict) and 'files' in result:
+            # the files written by the handler are processed as they are now
+            now_states = file_states(case, self.patterns)
+            for fname in result['files']:
+                name = os.path.basename(fname)
+                if name in now_states:
+                    done[name] = now_states[name]
+        self.done[case] = done
+        self._save()
+        if error is None:
+            self.n_processed += 1
+        else:
+            self.n_failed += 1
+        if self.verbose < 1:
+            print('%s processed%s' % (case, '' if error is None else ', failed: %r' % error))
+        if self.on_result is not None:
+            self.on_result(case, result, error)
+        # changed while it was processed
+        self._update(case, file_states(case, self.patterns), time.monotonic())
+
+    def _dispatch(self):
+        now = time.monotonic()
+        for case, (first, last) in sorted(self.pending.items(), key=lambda item: item[1][0]):
+            if len(self.running) >= self.workers:
+                break
+            if now - last < self.debounce and now - first < self.max_wait:
+                continue
+            states = dict(self.seen[case])
+            done = self.done.get(case, {})
+            changed = set([name for name, st in states.items() if done.get(name) != st])
+            del self.pending[case]
+            self.running[case] = (self._pool.submit(self.handler, case, changed), states)
+
+    def step(self, timeout=None):
+        '''
+        one turn: wait for the events (`timeout` seconds at most), search the
+        cases if it is time, collect the cases finished and start the cases ready
+        '''
+        if timeout is None:
+            timeout = min(self.debounce / 2, self.poll, 0.5)
+        self._events(timeout)
+        if self._last_scan is None or time.monotonic() - self._last_scan >= self.poll:
+            self.scan()
+        for case, (future, states) in list(self.running.items()):
+            if future.done():
+                del self.running[case]
+                self._finish(case, future, states)
+        self._dispatch()
+
+    def run(self, duration=None, until_idle=False):
+        '''
+        watch until `stop()`, Ctrl-C, `duration` seconds, or with `until_idle`
+        until no case is pending or running (i.e. to process a sweep once)
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._stop.clear()
+        t0 = time.monotonic()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            self.scan()
+            while not self._stop.is_set():
+                self.step()
+                if duration is not None and time.monotonic() - t0 >= duration:
+                    break
+                if until_idle and len(self.pending) == 0 and len(self.running) == 0:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # the cases started are finished and recorded
+            self._pool.shutdown(wait=True)
+            for case, (future, states) in list(self.running.items()):
+                del self.running[case]
+                self._finish(case, future, states)
+            self._pool = None
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def stop(self):
+        '''
+        stop `run` (from another thread or from `on_result`)
+        '''
+        self._stop.set()
+
+    def _save(self):
+        if self.state is None:
+            return
+        tmp = self.state + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.done, f)
+        os.replace(tmp, self.state)
+
+
+class post_handler():
+    '''
+    incremental post-processing of a case, the handler of `case_watcher`
+
+    paras
+    ===
+    - `fluxes`        a dict of label -> (typ, bc_series) read when mcfd.info1 changes
+    - `bcs`           a dict of label -> bc numbers, extracted when pltosout.bin
+                      changes, parsed when their BC%d.dat change
+    - `lines`         a dict of label -> (st, ed) of lines extracted when pltosout.bin changes
+    - `ave_window`    average window of the fluxes
+    - `stats_from`    first step of the running statistics of the fluxes
+    - `is_sort`, `merge`, `dedupe`, `dtype`   as `cfdpp.extract_bc`
+    - `catalog`       a `catalog.sweep_catalog` (or its file) the cases are scanned into
+    - `expect_step`   steps of a complete case, for the catalog
+    - `persist`       function `persist(case_dir, result)` called after each case
+    - `keep_data`     keep the parsed data in `results` after `persist`; False
+                      to hold only the numbers of the cases in memory
+
+    results
+    ===
+    `results`     case name -> dict of `n_step`, the fluxes, their `stats`
+                  (`stats.running_stats`) and the parsed `data` of the labels
+    '''
+
+    def __init__(self, fluxes=None, bcs=None, lines=None, ave_window=0, stats_from=0, is_sort=None, merge=False,
+                 dedupe=None, dtype='float64', catalog=None, expect_step=None, persist=None, keep_data=True):
+        self.fluxes = fluxes if fluxes is not None else {}
+        self.bcs = bcs if bcs is not None else {}
+        self.lines = lines if lines is not None else {}
+        self.ave_window = ave_window
+        self.stats_from = stats_from
+        self.is_sort = is_sort
+        self.merge = merge
+        self.dedupe = dedupe
+        self.dtype = dtype
+        if isinstance(catalog, str):
+            from .catalog import sweep_catalog
+            catalog = sweep_catalog(catalog)
+        self.catalog = catalog
+        self.expect_step = expect_step
+        self.persist = persist
+        self.keep_data = keep_data
+
+        self.results = {}
+        self._ops = {}
+        self._lock = threading.Lock()
+
+    def _op(self, case_dir):
+        # the cfdpp objects are kept, so their step index only scans the new steps;
+        # they are created in the threads of the watcher, they must not chdir
+        from .cfdpp import cfdpp
+
+        with self._lock:
+            if case_dir not in self._ops:
+                self._ops[case_dir] = cfdpp(case_dir, ave_window=self.ave_window, verbose='None', lazy=True,
+                                             chdir=False)
+            return self._ops[case_dir]
+
+    def __call__(self, case_dir, changed):
+        op = self._op(case_dir)
+        name = os.path.basename(os.path.normpath(case_dir))
+        with self._lock:
+            result = self.results.setdefault(name, {'n_step': 0, 'stats': {}, 'data': {}})
+        files = []
+
+        if 'mcfd.info1' in changed:
+            result['n_step'] = op.index_FFM_history(save=True)
+            for label, (typ, bc_series) in self.fluxes.items():
+                # read_flux checks the change over the last 5 steps
+                if result['n_step'] >= 5:
+                    result[label] = float(op.read_flux(typ, bc_series))
+                result['stats'][label] = op.flux_stats(typ, bc_series, stats=result['stats'].get(label),
+                                                       st=self.stats_from)
+            if self.catalog is not None:
+                self.catalog.scan(op, name, fluxes=self.fluxes, expect_step=self.expect_step)
+
+        new_field = 'pltosout.bin' in changed
+        for label, bc_series in self.bcs.items():
+            bc_files = [os.path.join(case_dir, 'BC%d.dat' % i) for i in bc_series]
+            if new_field or any([os.path.basename(f) in changed for f in bc_files]):
+                result['data'][label] = op.extract_bc(bc_series, new_field, is_sort=self.is_sort, merge=self.merge,
+                                                      dedupe=self.dedupe, dtype=self.dtype)
+                files += bc_files
+                if self.catalog is not None:
+                    for fname in bc_files:
+                        self.catalog.add_artifact(name, label, fname)
+        if new_field:
+            for label, (st, ed) in self.lines.items():
+                result['data'][label] = op.extract_line(st, ed, True, dtype=self.dtype)
+
+        if self.persist is not None:
+            self.persist(case_dir, result)
+        if not self.keep_data:
+            result['data'] = {}
+        return {'files': files, 'name': name}
+
+    def table(self):
+        '''
+        a row per case: `n_step`, the fluxes, and the mean and std of their
+        running statistics (for `cli.write_table`)
+        '''
+        rows = []
+        with self._lock:
+            items = sorted(self.results.items())
+        for name, result in items:
+            row = {'case': name, 'n_step': result['n_step']}
+            for label in self.fluxes:
+                row[label] = result.get(label)
+                if label in result['stats'] and result['stats'][label].n > 0:
+                    row[label + '_mean'] = float(result['stats'][label].mean)
+                    row[label + '_std'] = float(result['stats'][label].std())
+            rows.append(row)
+        return rows
@@ -17,6 +17,12 @@ setup(name=__name__,
       author_email='yyj980401@126.com',
       packages=find_packages(exclude=["test*"]),
       install_requires=['numpy'],
+      extras_require={
+            'hdf5': ['h5py'],
+      },
+      entry_points={
+            'console_scripts': ['cfdtools = cfdtools.cli:main'],
+      },
       classifiers=[
             'Programming Language :: Python :: 3',
             'Topic :: Scientific/Engineering :: Physics',